@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+Arrays of physical quantities that share a single unit, built on the
+PhysQuant unit model in PQ_math_reorg.  Needs numpy.
+"""
+import numpy as np
+from PQ_math_reorg import PhysQuant, UnitError, _NO_DIMS
+
+
+class PhysQuantArray(object):
+    """ This Class holds many scalar values with one unit.  The values are
+    stored in SI based units in a single numpy float64 array and the unit is
+    stored once as a PhysQuant dimension vector, so math on the array is done
+    by numpy in one pass and the units are checked once per operation rather
+    than once per value.
+    Use:
+        volts = PhysQuantArray([-70, -65, -60], "mV")
+        conduct = PhysQuantArray(values, pq("1 nS"))
+    Supports *, / and ** with numbers, numpy arrays, PhysQuant objects
+    and other PhysQuantArray objects, + and - with quantities of the same
+    unit, slicing, which returns views of the same values, and the sum, mean,
+    min, max and std reductions.  Indexing a single element returns a
+    PhysQuant.
+    """
+    __slots__ = ("_values", "_dims")
+
+    # Makes numpy hand operations with arrays and numpy numbers over to the
+    # PhysQuantArray methods instead of looping over the elements
+    __array_ufunc__ = None
+
+    def __init__(self, values, unit=""):
+        """ values are numbers given in unit, which can be a unit string or a
+        PhysQuant, and are converted to SI once when the array is made.
+        Offset units like oC are converted as well.
+        """
+        if isinstance(unit, PhysQuant):
+            scale, offset, dims = unit._scale, 0.0, unit._dims
+        else:
+            scale, offset, dims = PhysQuant._unit_factors(unit)
+        values = np.asarray(values, dtype=np.float64)
+        if scale != 1.0:
+            values = values * scale
+        if offset:
+            values = values + offset
+        self._values = values
+        self._dims = dims
+
+    @classmethod
+    def _from_values(cls, values, dims):
+        """ Private constructor for an array of SI values and a dimension
+        vector that are known to be valid.  values is not copied.
+        """
+        new_array = object.__new__(PhysQuantArray)
+        new_array._values = values
+        new_array._dims = dims
+        return new_array
+
+    @classmethod
+    def from_quantities(cls, quantities):
+        """ Makes an array from a sequence of PhysQuant objects, which must
+        all have the same unit.
+        """
+        quantities = list(quantities)
+        if not quantities:
+            return PhysQuantArray([])
+        dims = quantities[0]._dims
+        for quant in quantities:
+            if quant._dims is not dims:
+                raise UnitError("{0} does not have the unit of {1}".format(
+                                quant, quantities[0]))
+        values = np.fromiter((quant._scale for quant in quantities),
+                             dtype=np.float64, count=len(quantities))
+        return PhysQuantArray._from_values(values, dims)
+
+    @property
+    def values(self):
+        """ The numpy array of values in SI based units"""
+        return self._values
+
+    @property
+    def unit(self):
+        """ The SI based unit string of the values"""
+        return PhysQuant._from_vector(1.0, self._dims).SI[1]
+
+    @property
+    def SI(self):
+        """ Returns the array of values and the SI based unit string"""
+        return self._values, self.unit
+
+    @property
+    def shape(self):
+        return self._values.shape
+
+    @property
+    def size(self):
+        return self._values.size
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        for value in self._values:
+            yield PhysQuant._from_vector(float(value), self._dims)
+
+    def __getitem__(self, index):
+        """ Integer indexes return a PhysQuant, slices return a view"""
+        item = self._values[index]
+        if np.ndim(item) == 0:
+            return PhysQuant._from_vector(float(item), self._dims)
+        return PhysQuantArray._from_values(item, self._dims)
+
+    def __setitem__(self, index, value):
+        value = self._same_unit(value, "assign")
+        self._values[index] = value
+
+    def __repr__(self):
+        return "PhysQuantArray({0}, '{1}')".format(
+            np.array2string(self._values, separator=", "), self.unit)
+
+    def __str__(self):
+        return "{0} {1}".format(self._values, self.unit)
+
+    @staticmethod
+    def _split(other):
+        """ Returns the values and dimension vector of the other operand of a
+        math operation, or None if it is not something we can handle.
+        """
+        if isinstance(other, PhysQuantArray):
+            return other._values, other._dims
+        if isinstance(other, PhysQuant):
+            return other._scale, other._dims
+        if isinstance(other, (int, float, np.ndarray, np.number)):
+            return other, _NO_DIMS
+        return None
+
+    def _same_unit(self, other, operation):
+        """ Returns the values of other after checking it has the same unit
+        as this array, as needed to add, subtract or compare.
+        """
+        split = PhysQuantArray._split(other)
+        if split is None:
+            raise TypeError("Cannot {0} {1} and PhysQuantArray".format(
+                            operation, type(other).__name__))
+        values, dims = split
+        if dims is not self._dims:
+            raise UnitError("Cannot {0} {1} and {2}, units differ".format(
+                            operation, self.unit,
+                            PhysQuant._from_vector(1.0, dims).SI[1]))
+        return values
+
+    def __mul__(self, other):
+        split = PhysQuantArray._split(other)
+        if split is None:
+            return NotImplemented
+        values, dims = split
+        return PhysQuantArray._from_values(self._values * values,
+                                           PhysQuant._add_dims(self._dims, dims))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        split = PhysQuantArray._split(other)
+        if split is None:
+            return NotImplemented
+        values, dims = split
+        return PhysQuantArray._from_values(
+            self._values / values,
+            PhysQuant._sub_dims(self._dims, dims))
+
+    def __rtruediv__(self, other):
+        split = PhysQuantArray._split(other)
+        if split is None:
+            return NotImplemented
+        values, dims = split
+        return PhysQuantArray._from_values(
+            values / self._values,
+            PhysQuant._sub_dims(dims, self._dims))
+
+    def __add__(self, other):
+        return PhysQuantArray._from_values(
+            self._values + self._same_unit(other, "add"), self._dims)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return PhysQuantArray._from_values(
+            self._values - self._same_unit(other, "subtract"), self._dims)
+
+    def __rsub__(self, other):
+        return PhysQuantArray._from_values(
+            self._same_unit(other, "subtract") - self._values, self._dims)
+
+    def __pow__(self, exponent):
+        if isinstance(exponent, (int, float)):
+            return PhysQuantArray._from_values(
+                self._values ** exponent,
+                PhysQuant._scale_dims(self._dims, exponent))
+        else:
+            raise ValueError("Exponent must be a float or int")
+
+    def __neg__(self):
+        return PhysQuantArray._from_values(-self._values, self._dims)
+
+    def __abs__(self):
+        return PhysQuantArray._from_values(np.abs(self._values), self._dims)
+
+    def inverted(self):
+        """ Returns the reciprocal of every value with the inverted unit"""
+        return PhysQuantArray._from_values(1.0 / self._values,
+                                           PhysQuant._scale_dims(self._dims, -1))
+
+    def copy(self):
+        """ Returns an array with its own copy of the values"""
+        return PhysQuantArray._from_values(self._values.copy(), self._dims)
+
+    def change_unit(self, new_unit_str):
+        """ Returns the values converted into new_unit_str and the unit
+        string.  Uses the cached ConversionPlan for this unit, so the cost is
+        one cache lookup and one vectorized division.  Raises a UnitError if
+        the units are not compatible.
+        """
+        plan = PhysQuant.conversion_plan(self, new_unit_str)
+        return plan.convert(self._values), new_unit_str
+
+    def prefixed(self, per_element=True):
+        """ Returns the values scaled by a prefix with the prefixed units,
+        following the same rules as PhysQuant.prefixed.  With per_element
+        each value gets its own prefix and the units are a numpy array of
+        strings.  Otherwise one prefix, picked for the largest value, is used
+        for the whole array and the unit is a single string.
+        """
+        use_centi = PhysQuant._render_info(self._dims)[0]
+        if per_element:
+            scaled, choice, prefixes = _find_prefixes(self._values, use_centi)
+            unit_table = np.array([PhysQuant._prefixed_unit(self._dims, prefix)
+                                   for prefix in prefixes])
+            return scaled, unit_table[choice]
+        finite = self._values[np.isfinite(self._values)]
+        largest = float(finite.max()) if finite.size else 0.0
+        _, prefix = PhysQuant.find_prefix(largest, use_centi)
+        scaled = self._values
+        if prefix:
+            scaled = self._values / PhysQuant.prefix[prefix]
+        return scaled, PhysQuant._prefixed_unit(self._dims, prefix)
+
+    def format(self, decimals=3, per_element=True):
+        """ Returns a numpy array of strings, one for each value, formatted
+        like str() of a PhysQuant with the given number of decimals.  The
+        prefixes are picked as in prefixed().
+        """
+        scaled, units = self.prefixed(per_element)
+        numbers = np.char.mod("%.{0}f ".format(decimals), scaled)
+        return np.char.add(numbers, units)
+
+    def to_list(self):
+        """ Returns the values as a list of PhysQuant objects"""
+        return list(self)
+
+    def _reduced(self, result):
+        if np.ndim(result) == 0:
+            return PhysQuant._from_vector(float(result), self._dims)
+        return PhysQuantArray._from_values(result, self._dims)
+
+    def sum(self, axis=None):
+        return self._reduced(self._values.sum(axis=axis))
+
+    def mean(self, axis=None):
+        return self._reduced(self._values.mean(axis=axis))
+
+    def min(self, axis=None):
+        return self._reduced(self._values.min(axis=axis))
+
+    def max(self, axis=None):
+        return self._reduced(self._values.max(axis=axis))
+
+    def std(self, axis=None):
+        return self._reduced(self._values.std(axis=axis))
+
+
+def _find_prefixes(values, use_centi):
+    """ Vectorized PhysQuant.find_prefix.  Each prefix of the prefix
+    dictionary is tried in order on all values that do not have one yet.
+    Returns the scaled values, the index of the prefix used for each value
+    and the list of prefixes, where index 0 means no prefix.
+    """
+    scaled = np.array(values, dtype=np.float64)
+    choice = np.zeros(scaled.shape, dtype=np.intp)
+    prefixes = [""]
+    with np.errstate(invalid="ignore"):
+        for prefix, value in PhysQuant.prefix.items():
+            if prefix == "c" and not use_centi:
+                continue
+            prefixes.append(prefix)
+            trial = values / value
+            found = (choice == 0) & (trial >= 0.9) & (trial < 999)
+            scaled[found] = trial[found]
+            choice[found] = len(prefixes) - 1
+    return scaled, choice, prefixes
+
+
+class ParsedQuantities(object):
+    """ The result of parse_quantities.  groups maps the SI unit string of
+    each kind of quantity found to a tuple of the row indexes and a
+    PhysQuantArray of their values in row order.  errors is a list of
+    (index, string, message) for the rows that could not be parsed.
+    """
+    def __init__(self, groups, errors, size):
+        self.groups = groups
+        self.errors = errors
+        self.size = size
+
+    def as_array(self):
+        """ Returns all rows as one PhysQuantArray in row order when they
+        share a unit.  Rows that could not be parsed are nan.
+        """
+        if len(self.groups) > 1:
+            raise UnitError("Rows have more than one unit: {0}".format(
+                            ", ".join(self.groups)))
+        values = np.full(self.size, np.nan)
+        dims = _NO_DIMS
+        for indexes, quantities in self.groups.values():
+            values[indexes] = quantities.values
+            dims = quantities._dims
+        return PhysQuantArray._from_values(values, dims)
+
+
+def parse_quantities(strings):
+    """ Parses many strings like "100 mS/50 cm2" or "20 pS" at once.  Rows are
+    grouped by the unit part of the string so each distinct unit is parsed
+    only once, and the numbers of each group are converted to floats by numpy
+    in a single call.  Strings with temperature units or a layout the
+    grouping does not handle are parsed one at a time.  A row that cannot be
+    parsed is reported in the errors of the result instead of stopping the
+    whole batch.
+    Input: an iterable or numpy array of strings
+    Output: a ParsedQuantities object
+    """
+    if isinstance(strings, np.ndarray):
+        strings = strings.ravel().tolist()
+    by_unit = {}
+    singles = []
+    size = 0
+    for index, unit_str in enumerate(strings):
+        size += 1
+        split = None
+        if isinstance(unit_str, str):
+            split = PhysQuant._split_scalar_text(unit_str)
+        if split is None or PhysQuant._has_temp_unit(split[0]):
+            singles.append((index, unit_str))
+            continue
+        unit_key, num_text, denom_text = split
+        rows = by_unit.get(unit_key)
+        if rows is None:
+            rows = by_unit[unit_key] = ([], [], [], [])
+        rows[0].append(index)
+        rows[1].append(num_text or "1")
+        rows[2].append(denom_text or "1")
+        rows[3].append(unit_str)
+
+    errors = []
+    # Values for each dimension vector as lists of index and value arrays
+    by_dims = {}
+    for unit_key, (indexes, num_texts, denom_texts, unit_strs) in by_unit.items():
+        try:
+            unit = PhysQuant(unit_key)
+        except Exception as err:
+            errors.extend((index, unit_str, str(err))
+                          for index, unit_str in zip(indexes, unit_strs))
+            continue
+        indexes = np.asarray(indexes, dtype=np.intp)
+        try:
+            nums = np.asarray(num_texts, dtype=np.float64)
+            denoms = np.asarray(denom_texts, dtype=np.float64)
+            good = None
+        except ValueError:
+            nums, denoms, good = _floats_by_row(num_texts, denom_texts)
+            errors.extend((int(indexes[row]), unit_strs[row],
+                           "could not convert the number to a float")
+                          for row in np.flatnonzero(~good))
+            indexes = indexes[good]
+        values = unit._scale * nums / denoms
+        found = by_dims.setdefault(unit._dims, ([], []))
+        found[0].append(indexes)
+        found[1].append(values)
+
+    for index, unit_str in singles:
+        try:
+            quant = PhysQuant(unit_str)
+        except Exception as err:
+            errors.append((index, unit_str, str(err)))
+            continue
+        found = by_dims.setdefault(quant._dims, ([], []))
+        found[0].append(np.array([index], dtype=np.intp))
+        found[1].append(np.array([quant._scale]))
+
+    groups = {}
+    for dims, (index_list, value_list) in by_dims.items():
+        indexes = np.concatenate(index_list)
+        values = np.concatenate(value_list)
+        order = np.argsort(indexes, kind="stable")
+        unit = PhysQuant._from_vector(1.0, dims).SI[1]
+        groups[unit] = (indexes[order],
+                        PhysQuantArray._from_values(values[order], dims))
+    errors.sort()
+    return ParsedQuantities(groups, errors, size)
+
+
+def _floats_by_row(num_texts, denom_texts):
+    """ Converts the numbers one row at a time when numpy could not convert
+    them all at once.  Returns the numerator and denominator values of the
+    good rows and a boolean array marking which rows were good.
+    """
+    good = np.ones(len(num_texts), dtype=bool)
+    nums = []
+    denoms = []
+    for row, (num_text, denom_text) in enumerate(zip(num_texts, denom_texts)):
+        try:
+            num_value = float(num_text)
+            denom_value = float(denom_text)
+        except ValueError:
+            good[row] = False
+            continue
+        nums.append(num_value)
+        denoms.append(denom_value)
+    return np.array(nums), np.array(denoms), good
@@ -0,0 +1,583 @@
+# -*- coding: utf-8 -*-
+"""
+Compiles formulas over PhysQuant inputs into functions on plain numbers.
+The units of the formula are checked and its SI scale factors worked out
+once, when it is compiled, and the compiled function then does only the
+float math, on single values or on numpy arrays.  Only needs numpy when
+arrays=True is used or arrays are given.  Also has the unit_checked decorator, which checks
+and unwraps the PhysQuant arguments of a function at the call and wraps
+its result.
+"""
+import ast
+import inspect
+import keyword
+import math
+from functools import wraps
+from PQ_math_reorg import (PhysQuant, UnitError, pq, pi, N, R, F, VtoBase,
+                           StoBase, RtoBase, AtoBase, tau_conv, to_sec)
+from PQ_math_reorg import _NO_DIMS, _LRUCache
+
+
+def compile_formula(formula, inputs, unit=None, arrays=False):
+    """ Compiles formula, a Python function or an expression string, into a
+    CompiledFormula.  inputs is a dictionary of input name: unit, given as
+    a unit string, a PhysQuant whose unit is used, or None for unitless
+    inputs, in the order of the positional arguments.  The compiled
+    function takes plain numbers in those units and returns a plain number
+    in unit, or in the SI unit of the result if unit is None.  unit may be
+    a PhysQuant, and results are then in multiples of its value, which the
+    unit attribute of the CompiledFormula gives.  A UnitError
+    is raised when the formula is compiled if its units do not work out or
+    do not reduce to unit.
+    Use:
+        tau = compile_formula("r * c * tau_conv", {"r": "MOhm", "c": "pF"},
+                              unit="msec")
+        tau(100.0, 20.0)
+
+    A function is called once with stand ins for its inputs, so it may use
+    PhysQuant constants, pq() and the log, exp, sqrt and abs functions of
+    this module, but not other functions or branches on the input values.
+    An expression string may use the module constants N, R, F, VtoBase,
+    StoBase, RtoBase, AtoBase, tau_conv, to_sec and pi, those functions and
+    pq("...") with a unit string.  It is read with the ast module and never
+    evaluated as Python.  With arrays=True the functions work on numpy
+    arrays as well as on numbers.
+    """
+    names = list(inputs)
+    for name in names:
+        if not name.isidentifier() or keyword.iskeyword(name) or \
+                name in _NAMESPACE:
+            raise ValueError("{0} cannot be used as an input name".format(
+                             name))
+    symbols = {name: _Symbol.input(name, inputs[name]) for name in names}
+    if callable(formula):
+        params = list(inspect.signature(formula).parameters)
+        if sorted(params) != sorted(names):
+            raise ValueError("The inputs {0} do not match the formula "
+                             "arguments {1}".format(names, params))
+        result = formula(**symbols)
+        source_text = getattr(formula, "__name__", "formula")
+    else:
+        source_text = formula
+        result = _Reader(symbols).read(formula)
+    result = _Symbol.wrap(result)
+    scale = 1.0
+    if unit is not None:
+        target = pq(unit) if isinstance(unit, str) else unit
+        scale = _output_scale(result.dims, target)
+        if scale is None:
+            raise UnitError("{0} cannot be given in {1}".format(
+                            source_text, unit))
+        out_unit = unit if isinstance(unit, str) else _unit_name(target)
+    else:
+        out_unit = PhysQuant._from_vector(1.0, result.dims).SI[1]
+    return CompiledFormula(result, scale, names, out_unit, source_text,
+                           arrays)
+
+
+def _unit_name(quant):
+    """ Returns a unit string for the value of quant, so that a PhysQuant
+    like pq("1 mV") gives "mV" and pq("2 mV") gives "2 mV"
+    """
+    value, prefixed_unit = quant.prefixed
+    if math.isclose(value, 1.0):
+        return prefixed_unit
+    return "{0:.15g} {1}".format(value, prefixed_unit)
+
+
+def _output_scale(dims, target):
+    """ Returns the SI value of one target unit in units with the dimension
+    vector dims, or None if they are not compatible.  Units that only match
+    once they are reduced, such as J/coul and V, are reduced with
+    reduce_all, which is done here once instead of on every call.
+    """
+    if target._dims is dims:
+        return target._scale
+    source = PhysQuant._from_vector(1.0, dims)
+    source.reduce_all()
+    reduced = target.melt()
+    reduced.reduce_all()
+    if source._dims is not reduced._dims:
+        return None
+    return reduced._scale / source._scale
+
+
+class CompiledFormula(object):
+    """ A formula compiled by compile_formula.  Calling it with plain numbers
+    or numpy arrays for the inputs, positionally or by name, returns the
+    value of the formula as a plain number or array in unit.  dims is the
+    dimension vector of the result and source is the Python code of the
+    compiled function.
+    """
+    __slots__ = ("function", "inputs", "unit", "dims", "scale", "source",
+                 "formula")
+
+    def __init__(self, result, scale, inputs, unit, formula, arrays):
+        # All the scale factors end up in one factor of the result
+        code = _Symbol(result.code, result.coef / scale, result.dims).term()
+        self.source = "def compiled({0}):\n    return {1}\n".format(
+            ", ".join(inputs), code)
+        if arrays:
+            import numpy as np
+            functions = {"log": np.log, "exp": np.exp, "sqrt": np.sqrt,
+                         "abs": np.abs}
+        else:
+            functions = {"log": math.log, "exp": math.exp, "sqrt": math.sqrt,
+                         "abs": abs}
+        namespace = {"__builtins__": {}}
+        namespace.update(functions)
+        # The source is made from the input names, which were checked to be
+        # identifiers, numbers and the operators above
+        exec(compile(self.source, "<formula>", "exec"), namespace)
+        self.function = namespace["compiled"]
+        self.inputs = tuple(inputs)
+        self.unit = unit
+        self.dims = result.dims
+        self.scale = scale
+        self.formula = formula
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+
+    def quantity(self, *args, **kwargs):
+        """ Returns the value of the formula as a PhysQuant, or as a
+        PhysQuantArray if it is an array
+        """
+        value = self.function(*args, **kwargs) * self.scale
+        if getattr(value, "ndim", 0):
+            from PQ_array import PhysQuantArray
+            return PhysQuantArray._from_values(value, self.dims)
+        return PhysQuant._from_vector(float(value), self.dims)
+
+    def __repr__(self):
+        return "CompiledFormula({0}, inputs={1}, unit={2!r})".format(
+            self.formula, list(self.inputs), self.unit)
+
+
+class _Symbol(object):
+    """ Stand in for a value while a formula is compiled.  The value is
+    coef times the result of the Python code in code, which works on the
+    input numbers as they are given, and has the dimension vector dims.
+    Keeping the factors apart from the code lets the SI scale factors of
+    the inputs and constants be multiplied together once, when the formula
+    is compiled.  Symbols that do not depend on any input have no code and
+    their value is coef.
+    """
+    __slots__ = ("code", "coef", "dims")
+
+    # Makes numpy hand operations with arrays over to the _Symbol methods
+    __array_ufunc__ = None
+
+    def __init__(self, code, coef, dims):
+        self.code = code
+        self.coef = coef
+        self.dims = dims
+
+    @staticmethod
+    def input(name, unit):
+        """ The symbol of an input given in unit"""
+        if unit is None or unit == "":
+            return _Symbol(name, 1.0, _NO_DIMS)
+        if isinstance(unit, str) and any(
+                part.lstrip("o") in PhysQuant.temp_units or
+                part in PhysQuant.temp_units for part in unit.split(".")):
+            raise UnitError("Temperatures need an offset, give {0} in K"
+                            .format(name))
+        quant = pq(unit) if isinstance(unit, str) else unit
+        return _Symbol(name, quant._scale, quant._dims)
+
+    @staticmethod
+    def constant(value, dims=_NO_DIMS):
+        return _Symbol(None, float(value), dims)
+
+    @staticmethod
+    def wrap(other):
+        """ Returns other as a symbol, or None if it cannot be used in a
+        formula
+        """
+        if isinstance(other, _Symbol):
+            return other
+        if isinstance(other, str):
+            other = pq(other)
+        if isinstance(other, PhysQuant):
+            return _Symbol.constant(other._scale, other._dims)
+        if isinstance(other, (int, float)) and not isinstance(other, bool):
+            return _Symbol.constant(other)
+        return None
+
+    def term(self):
+        """ Returns the code of the whole value, factor included"""
+        if self.code is None:
+            return repr(self.coef)
+        if self.coef == 1.0:
+            return self.code
+        if self.coef == -1.0:
+            return "(-{0})".format(self.code)
+        return "({0!r} * {1})".format(self.coef, self.code)
+
+    def _binary(self, op, other, reflected=False):
+        other = _Symbol.wrap(other)
+        if other is None:
+            return NotImplemented
+        left, right = (other, self) if reflected else (self, other)
+        if op == "*":
+            dims = PhysQuant._add_dims(left.dims, right.dims)
+            return _Symbol(_join(left.code, "*", right.code),
+                           left.coef * right.coef, dims)
+        if op == "/":
+            dims = PhysQuant._sub_dims(left.dims, right.dims)
+            code = _join(left.code, "/", right.code)
+            if left.code is None and right.code is not None:
+                code = "(1.0 / {0})".format(right.code)
+            return _Symbol(code, left.coef / right.coef, dims)
+        if left.dims is not right.dims:
+            raise UnitError("Cannot {0} {1} and {2}, units differ".format(
+                            "add" if op == "+" else "subtract",
+                            PhysQuant._from_vector(1.0, left.dims).SI[1],
+                            PhysQuant._from_vector(1.0, right.dims).SI[1]))
+        if left.code is None and right.code is None:
+            coef = left.coef + right.coef if op == "+" else \
+                left.coef - right.coef
+            return _Symbol.constant(coef, left.dims)
+        if left.coef == right.coef and left.code is not None and \
+                right.code is not None:
+            # Same factor on both sides, as in co * 0.001 - ci * 0.001
+            return _Symbol("({0} {1} {2})".format(left.code, op, right.code),
+                           left.coef, left.dims)
+        return _Symbol("({0} {1} {2})".format(left.term(), op, right.term()),
+                       1.0, left.dims)
+
+    def __mul__(self, other):
+        return self._binary("*", other)
+
+    def __rmul__(self, other):
+        return self._binary("*", other, reflected=True)
+
+    def __truediv__(self, other):
+        return self._binary("/", other)
+
+    def __rtruediv__(self, other):
+        return self._binary("/", other, reflected=True)
+
+    def __add__(self, other):
+        return self._binary("+", other)
+
+    def __radd__(self, other):
+        return self._binary("+", other, reflected=True)
+
+    def __sub__(self, other):
+        return self._binary("-", other)
+
+    def __rsub__(self, other):
+        return self._binary("-", other, reflected=True)
+
+    def __neg__(self):
+        return _Symbol(self.code, -self.coef, self.dims)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return _function("abs", self, keep_units=True)
+
+    def __pow__(self, exponent):
+        if isinstance(exponent, _Symbol):
+            if exponent.code is not None or exponent.dims:
+                raise ValueError("Exponent must be a unitless number")
+            exponent = exponent.coef
+            if exponent.is_integer():
+                exponent = int(exponent)
+        if not isinstance(exponent, (int, float)):
+            raise ValueError("Exponent must be a float or int")
+        dims = PhysQuant._scale_dims(self.dims, exponent)
+        if self.code is None:
+            return _Symbol.constant(self.coef ** exponent, dims)
+        if self.coef < 0:
+            return _Symbol("({0} ** {1!r})".format(self.term(), exponent),
+                           1.0, dims)
+        return _Symbol("({0} ** {1!r})".format(self.code, exponent),
+                       self.coef ** exponent, dims)
+
+
+def _join(left, op, right):
+    """ Joins the code of two factors, either of which may be None"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return "({0} {1} {2})".format(left, op, right)
+
+
+def _function(name, value, keep_units=False):
+    """ Applies the function called name to a symbol.  Only abs keeps the
+    units, the others need a unitless value.
+    """
+    symbol = _Symbol.wrap(value)
+    if symbol is None:
+        raise ValueError("{0} cannot be used in a formula".format(value))
+    if symbol.dims and not keep_units:
+        raise UnitError("{0} needs a unitless value, not {1}".format(
+                        name, PhysQuant._from_vector(1.0, symbol.dims).SI[1]))
+    if symbol.code is None:
+        return _Symbol.constant(_MATH[name](symbol.coef), symbol.dims)
+    if name == "abs":
+        return _Symbol("abs({0})".format(symbol.code), abs(symbol.coef),
+                       symbol.dims)
+    return _Symbol("{0}({1})".format(name, symbol.term()), 1.0, symbol.dims)
+
+
+_MATH = {"log": math.log, "exp": math.exp, "sqrt": math.sqrt, "abs": abs}
+
+
+def log(value):
+    """ Natural log of a unitless value, for use in formulas"""
+    if isinstance(value, PhysQuant):
+        return math.log(value.unitless)
+    if isinstance(value, _Symbol):
+        return _function("log", value)
+    return math.log(value)
+
+
+def exp(value):
+    """ Exponential of a unitless value, for use in formulas"""
+    if isinstance(value, PhysQuant):
+        return math.exp(value.unitless)
+    if isinstance(value, _Symbol):
+        return _function("exp", value)
+    return math.exp(value)
+
+
+def sqrt(value):
+    """ Square root, for use in formulas.  Quantities with units are raised
+    to the power 0.5, which needs even powers of their units.
+    """
+    if isinstance(value, (PhysQuant, _Symbol)):
+        return value ** 0.5
+    return math.sqrt(value)
+
+
+# The names an expression string can use besides its inputs
+_NAMESPACE = {"N": N, "R": R, "F": F, "VtoBase": VtoBase,
+              "StoBase": StoBase, "RtoBase": RtoBase, "AtoBase": AtoBase,
+              "tau_conv": tau_conv, "to_sec": to_sec, "pi": pi,
+              "log": log, "exp": exp, "sqrt": sqrt, "abs": abs, "pq": pq}
+
+
+class _Reader(object):
+    """ Turns an expression string into symbols by walking its syntax tree.
+    Only numbers, names, the + - * / ** operators and calls of the
+    functions in _NAMESPACE are accepted.
+    """
+    _binary_ops = {ast.Add: "__add__", ast.Sub: "__sub__",
+                   ast.Mult: "__mul__", ast.Div: "__truediv__"}
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+
+    def read(self, text):
+        try:
+            tree = ast.parse(text.strip(), mode="eval")
+        except SyntaxError as error:
+            raise ValueError("{0} is not a formula: {1}".format(text, error))
+        return self.visit(tree.body)
+
+    def visit(self, node):
+        if isinstance(node, ast.Constant) and \
+                isinstance(node.value, (int, float)) and \
+                not isinstance(node.value, bool):
+            return _Symbol.constant(node.value)
+        if isinstance(node, ast.Name):
+            if node.id in self.symbols:
+                return self.symbols[node.id]
+            value = _NAMESPACE.get(node.id)
+            if isinstance(value, (PhysQuant, float)):
+                return _Symbol.wrap(value)
+            raise ValueError("{0} is not an input or a constant".format(
+                             node.id))
+        if isinstance(node, ast.BinOp):
+            left = _Symbol.wrap(self.visit(node.left))
+            right = self.visit(node.right)
+            if isinstance(node.op, ast.Pow):
+                return left ** right
+            method = self._binary_ops.get(type(node.op))
+            if method is not None:
+                return getattr(left, method)(right)
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.USub):
+                return -self.visit(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return self.visit(node.operand)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and node.func.id in ("log", "exp", "sqrt", "abs", "pq") \
+                and len(node.args) == 1 and not node.keywords:
+            arg = node.args[0]
+            if node.func.id == "pq":
+                if not (isinstance(arg, ast.Constant) and
+                        isinstance(arg.value, str)):
+                    raise ValueError("pq() in a formula needs a unit string")
+                return _Symbol.wrap(pq(arg.value))
+            if node.func.id == "abs":
+                return abs(self.visit(arg))
+            return _NAMESPACE[node.func.id](self.visit(arg))
+        raise ValueError("{0} cannot be used in a formula".format(
+                         ast.dump(node)))
+
+
+# Switched with set_unit_checks
+_settings = {"checks": True}
+
+
+def set_unit_checks(on=True):
+    """ Switches the unit checks of unit_checked functions on or off.  With
+    the checks off the arguments are unwrapped without looking at their
+    units, which saves the checks once a program is known to pass the
+    right units.  They are on by default.
+    """
+    _settings["checks"] = bool(on)
+
+
+def unit_checked(returns=None, **arg_units):
+    """ Decorator that declares the unit of arguments of a function and of
+    its result, as strings PhysQuant understands.  The declared arguments
+    may be given as PhysQuant or PhysQuantArray objects, unit strings, or
+    plain numbers and numpy arrays in the declared unit.  They are checked
+    and converted to SI once, when the function is called, and the body
+    gets plain floats or numpy arrays.  A plain result is taken to be an
+    SI value and wrapped in a PhysQuant, or a PhysQuantArray for arrays,
+    with the unit of returns.  A PhysQuant or PhysQuantArray result must
+    be in, or reduce to, the unit of returns.  Plain numbers in temperature
+    units like oC are converted with their offset.  Other arguments and,
+    if returns is None, the result are passed through as they are.
+    Use:
+        @unit_checked(returns="pA", v="mV", g="nS", e_rev="mV")
+        def current(v, g, e_rev):
+            return g * (v - e_rev)
+        current(pq("-65 mV"), "2 nS", 0.0)
+
+    Arguments with the declared units are only compared by their interned
+    signature.  Units that match once reduced, such as J/coul for mV, are
+    converted with a factor worked out once for each argument and
+    signature and kept in a cache, see the plan_cache_info attribute of the
+    decorated function.  Checks can be switched off with set_unit_checks.
+    """
+    declared = {name: pq(unit) if isinstance(unit, str) else unit
+                for name, unit in arg_units.items()}
+    # The scale and offset that take plain numbers in each declared unit to
+    # SI, with the offset of units like oC
+    factors = {name: PhysQuant._unit_factors(unit)[:2]
+               if isinstance(unit, str) else (unit._scale, 0.0)
+               for name, unit in arg_units.items()}
+    result_dims = None
+    if returns is not None:
+        result_dims = (pq(returns) if isinstance(returns, str)
+                       else returns)._dims
+
+    def decorate(function):
+        params = inspect.signature(function).parameters
+        names = list(params)
+        for name in declared:
+            if name not in params:
+                raise ValueError("{0} is not an argument of {1}".format(
+                                 name, function.__name__))
+        # (position, name, declared unit, number factors) of each checked
+        # argument
+        checked = tuple((names.index(name), name, unit, factors[name])
+                        for name, unit in declared.items())
+        plans = _LRUCache(64)
+        defaults = {}
+        for name, unit in declared.items():
+            default = params[name].default
+            if default is not inspect.Parameter.empty and default is not None:
+                defaults[name] = _to_si(default, name, unit, factors[name],
+                                        plans, True)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            strict = _settings["checks"]
+            if checked:
+                args = list(args)
+                for position, name, unit, scaling in checked:
+                    if position < len(args):
+                        value = args[position]
+                        # The common case of a PhysQuant in the declared unit
+                        if type(value) is PhysQuant and \
+                                (value._dims is unit._dims or not strict):
+                            args[position] = value._scale
+                        else:
+                            args[position] = _to_si(value, name, unit,
+                                                    scaling, plans, strict)
+                    elif name in kwargs:
+                        kwargs[name] = _to_si(kwargs[name], name, unit,
+                                              scaling, plans, strict)
+                    elif name in defaults:
+                        kwargs[name] = defaults[name]
+            result = function(*args, **kwargs)
+            if result_dims is None:
+                return result
+            if isinstance(result, PhysQuant) or hasattr(result, "_values"):
+                return _result_in(result, result_dims, function, plans,
+                                  strict)
+            if getattr(result, "ndim", 0):
+                from PQ_array import PhysQuantArray
+                return PhysQuantArray._from_values(result, result_dims)
+            return PhysQuant._from_vector(float(result), result_dims)
+
+        wrapper.plan_cache_info = plans.info
+        return wrapper
+    return decorate
+
+
+def _result_in(result, result_dims, function, plans, strict):
+    """ Returns a PhysQuant or PhysQuantArray result of a unit_checked
+    function in the declared unit, converting it if its units reduce to
+    that unit.  Raises a UnitError if they do not.
+    """
+    dims = result._dims
+    if dims is result_dims or not strict:
+        return result
+    key = (None, dims)
+    divisor = plans.get(key)
+    if divisor is None:
+        divisor = _output_scale(dims, PhysQuant._from_vector(1.0,
+                                                             result_dims))
+        if divisor is None:
+            raise UnitError("{0} must return {1}, not {2}".format(
+                            function.__name__,
+                            PhysQuant._from_vector(1.0, result_dims).SI[1],
+                            PhysQuant._from_vector(1.0, dims).SI[1]))
+        plans.put(key, divisor)
+    if isinstance(result, PhysQuant):
+        return PhysQuant._from_vector(result._scale / divisor, result_dims)
+    return type(result)._from_values(result._values / divisor, result_dims)
+
+
+def _to_si(value, name, unit, scaling, plans, strict):
+    """ Returns the SI value of the argument value declared with unit, a
+    float or a numpy array.  Plain numbers are taken to be in unit and are
+    converted with scaling, the scale and offset of the unit.
+    """
+    if isinstance(value, PhysQuant):
+        si_value = value._scale
+    elif hasattr(value, "_values"):
+        si_value = value._values
+    elif isinstance(value, str):
+        return _to_si(pq(value), name, unit, scaling, plans, strict)
+    else:
+        # A number or numpy array in the declared unit
+        scale, offset = scaling
+        if scale == 1.0 and not offset:
+            return value
+        return value * scale + offset
+    dims = value._dims
+    if dims is unit._dims or not strict:
+        return si_value
+    key = (name, dims)
+    divisor = plans.get(key)
+    if divisor is None:
+        divisor = _output_scale(dims, PhysQuant._from_vector(1.0, unit._dims))
+        if divisor is None:
+            raise UnitError("{0} must be in {1}, not {2}".format(
+                            name, unit.SI[1],
+                            PhysQuant._from_vector(1.0, dims).SI[1]))
+        plans.put(key, divisor)
+    return si_value / divisor
@@ -0,0 +1,740 @@
+# -*- coding: utf-8 -*-
+"""
+Saving and loading PhysQuant and PhysQuantArray objects without eval.  The
+binary form is a stream of blocks holding the SI values as float64 and an
+index into a table of unit signatures, which is written into the stream
+as new units are met so files can be written and read a block at a time.
+The JSON form holds the same table and values for interchange.  Also
+reads CSV and TSV measurement files with units in their column headers,
+see MeasurementReader, and keeps arrays larger than memory on disk, see
+QuantityStore.  Needs numpy.
+Use:
+    save_quantities("params.pqb", [pq("1 uF/cm2"), pq("100 ohm.cm")])
+    cm, ra_cm = load_quantities("params.pqb")
+    columns = load_measurements("sweep.csv")
+"""
+import json
+import mmap
+import os
+import struct
+from time import perf_counter
+import warnings
+import numpy as np
+from PQ_math_reorg import PhysQuant, UnitError
+from PQ_array import PhysQuantArray
+
+# The first bytes of a binary file and the version of the layout
+MAGIC = b"PQB\x01"
+
+# Block layouts.  A signature block is b"S", the length of the JSON text of
+# the unit powers and the text.  A scalar block is b"Q", a count and that
+# many records of signature index and value.  An array block is b"A", the
+# signature index, the length and the values
+_LENGTH = struct.Struct("<I")
+_ARRAY = struct.Struct("<IQ")
+_RECORD = np.dtype([("sig", "<u4"), ("value", "<f8")])
+
+
+def _powers(dims):
+    """ Returns the dictionary of unit: power of a dimension vector, which
+    does not depend on the order units were first seen in
+    """
+    return {PhysQuant._unit_names[indx]: power
+            for indx, power in enumerate(dims) if power}
+
+
+def _dims(powers):
+    """ Returns the interned dimension vector of a dictionary of unit: power
+    after checking it only holds whole powers of units PhysQuant already
+    knows, so a file cannot add names to the unit table
+    """
+    if not isinstance(powers, dict) or not all(
+            isinstance(unit, str) and type(power) is int
+            for unit, power in powers.items()):
+        raise ValueError("{0} is not a unit signature".format(powers))
+    for unit in powers:
+        if unit not in PhysQuant._unit_index:
+            raise ValueError("{0} is not a known unit".format(unit))
+    return PhysQuant._powers_to_dims(powers)
+
+
+class QuantityWriter(object):
+    """ Writes PhysQuant and PhysQuantArray objects to a binary file or
+    stream.  Single quantities are gathered into blocks of up to chunk_size
+    records.  Use as a context manager, or call close, so the last block is
+    written.
+    """
+    def __init__(self, target, chunk_size=65536):
+        if isinstance(target, (str, os.PathLike)):
+            self._stream = open(target, "wb")
+            self._owned = True
+        else:
+            self._stream = target
+            self._owned = False
+        self.chunk_size = chunk_size
+        self._signatures = {}
+        self._sigs = []
+        self._values = []
+        self.count = 0
+        self._stream.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _signature(self, dims):
+        """ Returns the index of dims in the signature table, writing it
+        into the stream the first time it is used
+        """
+        index = self._signatures.get(dims)
+        if index is None:
+            self._flush()
+            index = len(self._signatures)
+            self._signatures[dims] = index
+            text = json.dumps(_powers(dims)).encode("utf-8")
+            self._stream.write(b"S" + _LENGTH.pack(len(text)) + text)
+        return index
+
+    def write(self, quant):
+        """ Writes one PhysQuant or PhysQuantArray"""
+        if isinstance(quant, PhysQuant):
+            index = self._signature(quant._dims)
+            self._sigs.append(index)
+            self._values.append(quant._scale)
+            self.count += 1
+            if len(self._values) >= self.chunk_size:
+                self._flush()
+        elif isinstance(quant, PhysQuantArray):
+            index = self._signature(quant._dims)
+            self._flush()
+            values = np.ascontiguousarray(quant._values, dtype="<f8")
+            self._stream.write(b"A" + _ARRAY.pack(index, values.size))
+            self._stream.write(values.tobytes())
+            self.count += 1
+        else:
+            raise ValueError("{0} is not a PhysQuant or PhysQuantArray"
+                             .format(quant))
+
+    def write_all(self, quantities):
+        """ Writes every object of an iterable"""
+        for quant in quantities:
+            self.write(quant)
+
+    def _flush(self):
+        if not self._values:
+            return
+        records = np.empty(len(self._values), dtype=_RECORD)
+        records["sig"] = self._sigs
+        records["value"] = self._values
+        self._stream.write(b"Q" + _LENGTH.pack(len(records)))
+        self._stream.write(records.tobytes())
+        self._sigs = []
+        self._values = []
+
+    def close(self):
+        """ Writes the last block, and closes the file if a path was given"""
+        self._flush()
+        if self._owned:
+            self._stream.close()
+        else:
+            self._stream.flush()
+
+
+def save_quantities(target, quantities, chunk_size=65536):
+    """ Writes an iterable of PhysQuant and PhysQuantArray objects to
+    target, a path or a binary stream.  Returns the number written.
+    """
+    with QuantityWriter(target, chunk_size) as writer:
+        writer.write_all(quantities)
+    return writer.count
+
+
+def iter_blocks(source):
+    """ Reads a binary file or stream written by QuantityWriter a block at a
+    time.  Yields (dims, values, scalars) for each block, where dims is a
+    list of the dimension vector of each value for a block of single
+    quantities, with scalars True, or the one dimension vector of an array.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as stream:
+            for block in iter_blocks(stream):
+                yield block
+        return
+    if _read(source, len(MAGIC)) != MAGIC:
+        raise ValueError("Not a PhysQuant binary file")
+    table = []
+    while True:
+        tag = source.read(1)
+        if not tag:
+            return
+        if tag == b"S":
+            length, = _LENGTH.unpack(_read(source, _LENGTH.size))
+            table.append(_dims(json.loads(_read(source, length).decode(
+                                          "utf-8"))))
+        elif tag == b"Q":
+            count, = _LENGTH.unpack(_read(source, _LENGTH.size))
+            records = np.frombuffer(_read(source, count * _RECORD.itemsize),
+                                    dtype=_RECORD)
+            try:
+                dims = [table[sig] for sig in records["sig"].tolist()]
+            except IndexError:
+                raise ValueError("Unknown unit signature in file")
+            yield dims, records["value"], True
+        elif tag == b"A":
+            index, size = _ARRAY.unpack(_read(source, _ARRAY.size))
+            if index >= len(table):
+                raise ValueError("Unknown unit signature in file")
+            values = np.frombuffer(_read(source, size * 8), dtype="<f8")
+            yield table[index], values.astype(np.float64), False
+        else:
+            raise ValueError("Unknown block {0!r} in file".format(tag))
+
+
+def _read(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("File ends in the middle of a block")
+    return data
+
+
+def iter_quantities(source):
+    """ Yields the PhysQuant and PhysQuantArray objects of a binary file or
+    stream in the order they were written
+    """
+    for dims, values, scalars in iter_blocks(source):
+        if scalars:
+            for scale, vector in zip(values.tolist(), dims):
+                yield PhysQuant._from_vector(scale, vector)
+        else:
+            yield PhysQuantArray._from_values(values, dims)
+
+
+def load_quantities(source):
+    """ Returns a list of the objects in a binary file or stream"""
+    return list(iter_quantities(source))
+
+
+def to_json(quantities, **kwargs):
+    """ Returns JSON text for a PhysQuant, a PhysQuantArray or a list of
+    them.  The text holds a table of the unit powers of each signature and
+    the items as [signature, value] or [signature, [values]].  kwargs are
+    passed on to json.dumps.
+    """
+    single = isinstance(quantities, (PhysQuant, PhysQuantArray))
+    if single:
+        quantities = [quantities]
+    signatures = {}
+    items = []
+    for quant in quantities:
+        index = signatures.setdefault(quant._dims, len(signatures))
+        if isinstance(quant, PhysQuant):
+            items.append([index, quant._scale])
+        elif isinstance(quant, PhysQuantArray):
+            items.append([index, quant._values.tolist()])
+        else:
+            raise ValueError("{0} is not a PhysQuant or PhysQuantArray"
+                             .format(quant))
+    document = {"format": "PhysQuant", "version": 1,
+                "signatures": [_powers(dims) for dims in signatures],
+                "items": items}
+    if single:
+        document["single"] = True
+    return json.dumps(document, **kwargs)
+
+
+def from_json(text):
+    """ Returns the PhysQuant or PhysQuantArray, or list of them, saved by
+    to_json
+    """
+    document = json.loads(text)
+    if not isinstance(document, dict) or \
+            document.get("format") != "PhysQuant":
+        raise ValueError("Not PhysQuant JSON")
+    table = [_dims(powers) for powers in document["signatures"]]
+    result = []
+    for item in document["items"]:
+        if not isinstance(item, list) or len(item) != 2 or \
+                not isinstance(item[0], int) or \
+                not 0 <= item[0] < len(table):
+            raise ValueError("{0} is not a saved quantity".format(item))
+        index, value = item
+        if isinstance(value, list):
+            result.append(PhysQuantArray._from_values(
+                np.array(value, dtype=np.float64), table[index]))
+        elif isinstance(value, (int, float)):
+            result.append(PhysQuant._from_vector(float(value), table[index]))
+        else:
+            raise ValueError("{0} is not a saved quantity".format(item))
+    if document.get("single"):
+        return result[0]
+    return result
+
+
+def _split_header(field):
+    """ Returns the column name and unit string of a column header like
+    "Vm (mV)", "I [pA]" or "R (J/(mol.K))".  A header without a unit in
+    brackets at its end has an empty unit.
+    """
+    field = field.strip().strip('"').strip()
+    if field[-1:] in (")", "]"):
+        close = field[-1]
+        opening = "(" if close == ")" else "["
+        depth = 0
+        for index in range(len(field) - 1, -1, -1):
+            if field[index] == close:
+                depth += 1
+            elif field[index] == opening:
+                depth -= 1
+                if not depth:
+                    name = field[:index].strip()
+                    if name:
+                        return name, field[index + 1:-1].strip()
+                    break
+    return field, ""
+
+
+class MeasurementReader(object):
+    """ Streams a CSV or TSV file of measurements whose column headers give
+    the unit of each column, like "Vm (mV)", "I (pA)" or "T (oC)".  The
+    unit of each header is parsed once, with the offset of temperature
+    units, and the numbers are converted to SI by numpy chunk_size rows at a
+    time.  Files given by path are read through a memory map, so only one
+    chunk of text and values is held at a time whatever the size of the
+    file.  Cells must be plain numbers, an empty cell is read as nan.
+    The reader counts the rows and bytes read and the seconds spent reading,
+    and mb_per_sec gives the throughput.
+    Use:
+        reader = MeasurementReader("sweep.csv")
+        for columns in reader.chunks():
+            peak = max(peak, columns["Vm"].max())
+        print(reader.mb_per_sec)
+    source is a path or an iterable of lines.  The delimiter is a tab if
+    the header has one and a comma otherwise, unless given.
+    """
+    def __init__(self, source, chunk_size=65536, delimiter=None):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.delimiter = delimiter
+        self.names = []
+        self.units = []
+        self.dims = []
+        self._scales = None
+        self._offsets = None
+        self.rows = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def mb_per_sec(self):
+        if not self.seconds:
+            return 0.0
+        return self.bytes / self.seconds / 1e6
+
+    def _header(self, line):
+        """ Reads the column names and parses the unit of each column"""
+        line = line.lstrip("\ufeff").rstrip("\r\n")
+        if self.delimiter is None:
+            self.delimiter = "\t" if "\t" in line else ","
+        names = []
+        scales = []
+        offsets = []
+        for field in line.split(self.delimiter):
+            name, unit = _split_header(field)
+            if name in names:
+                raise ValueError("Column {0} is given twice".format(name))
+            scale, offset, dims = PhysQuant._unit_factors(unit)
+            names.append(name)
+            self.units.append(unit)
+            self.dims.append(dims)
+            scales.append(scale)
+            offsets.append(offset)
+        self.names = names
+        self._scales = np.array(scales)
+        self._offsets = np.array(offsets)
+
+    def _texts(self):
+        """ Reads the header and yields the text of up to chunk_size rows at
+        a time.  Blank lines and lines starting with # before the header are
+        skipped.
+        """
+        if not isinstance(self.source, (str, os.PathLike)):
+            rows = []
+            for line in self.source:
+                if not self.names:
+                    if line.strip() and line.lstrip()[0] != "#":
+                        self._header(line)
+                    continue
+                self.bytes += len(line)
+                rows.append(line.rstrip("\r\n"))
+                if len(rows) >= self.chunk_size:
+                    yield "\n".join(rows)
+                    rows = []
+            if rows:
+                yield "\n".join(rows)
+            return
+        with open(self.source, "rb") as data_file:
+            size = os.fstat(data_file.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(data_file.fileno(), 0,
+                           access=mmap.ACCESS_READ) as mapped:
+                for line in iter(mapped.readline, b""):
+                    line = line.decode("utf-8")
+                    if line.strip() and line.lstrip("\ufeff")[0] != "#":
+                        self._header(line)
+                        break
+                pos = mapped.tell()
+                # The chunk ends at the chunk_size-th newline, found by numpy
+                # in a window of the map that grows until it holds enough
+                view = np.frombuffer(mapped, dtype=np.uint8)
+                try:
+                    step = 32 * self.chunk_size
+                    while pos < size:
+                        newlines = np.flatnonzero(view[pos:pos + step] == 10)
+                        if len(newlines) >= self.chunk_size:
+                            end = pos + int(newlines[self.chunk_size - 1]) + 1
+                        elif pos + step >= size:
+                            end = size
+                        else:
+                            step *= 2
+                            continue
+                        text = mapped[pos:end].decode("utf-8")
+                        self.bytes += end - pos
+                        pos = end
+                        yield text
+                finally:
+                    del view
+
+    def _even(self, text, delimiters):
+        """ Returns True if every line of text has the given number of
+        delimiters, counted by numpy on the encoded text, so ragged rows
+        whose values happen to add up are not reshaped into the block
+        """
+        delimiter = self.delimiter.encode("utf-8")
+        if len(delimiter) != 1:
+            return all(line.count(self.delimiter) == delimiters
+                       for line in text.split("\n"))
+        data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        ends = np.flatnonzero(data == 10)
+        if not text.endswith("\n"):
+            ends = np.append(ends, len(data))
+        # Delimiters before each position, then the count on each line
+        before = np.concatenate(([0], np.cumsum(data == delimiter[0])))
+        counts = np.diff(before[ends], prepend=0)
+        return bool(np.all(counts == delimiters))
+
+    def _parse(self, text):
+        """ Returns the rows of a block of text as a 2 dimensional array"""
+        columns = len(self.names)
+        rows = text.count("\n") + (not text.endswith("\n"))
+        # numpy warns, or in later versions raises, when the text has cells
+        # that are not numbers, which are then read line by line
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            try:
+                values = np.fromstring(text.replace(self.delimiter, " "),
+                                       sep=" ")
+            except ValueError:
+                values = None
+        if values is not None and values.size == rows * columns and \
+                self._even(text, columns - 1):
+            self.rows += rows
+            return values.reshape(rows, columns)
+        # Blank lines, empty cells or a bad row, so go line by line
+        parsed = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            fields = line.split(self.delimiter)
+            if len(fields) != columns:
+                raise ValueError("Row {0} has {1} values, the header has {2}"
+                                 .format(self.rows + len(parsed) + 1,
+                                         len(fields), columns))
+            try:
+                parsed.append([float(field) if field.strip() else np.nan
+                               for field in fields])
+            except ValueError:
+                raise ValueError("Row {0} is not numbers: {1}".format(
+                                 self.rows + len(parsed) + 1, line))
+        self.rows += len(parsed)
+        return np.array(parsed, dtype=np.float64).reshape(-1, columns)
+
+    def blocks(self):
+        """ Yields the SI values of up to chunk_size rows at a time, as 2
+        dimensional arrays with a row for each row of the file
+        """
+        start = perf_counter()
+        for text in self._texts():
+            block = self._parse(text)
+            block *= self._scales
+            block += self._offsets
+            self.seconds += perf_counter() - start
+            yield block
+            start = perf_counter()
+        self.seconds += perf_counter() - start
+
+    def chunks(self):
+        """ Yields dictionaries of column name: PhysQuantArray of SI values,
+        with up to chunk_size values in each array
+        """
+        for block in self.blocks():
+            values = block.T.copy()
+            yield {name: PhysQuantArray._from_values(values[indx], dims)
+                   for indx, (name, dims) in enumerate(zip(self.names,
+                                                           self.dims))}
+
+    def si_header(self):
+        """ Returns the column headers with the SI unit of each column"""
+        headers = []
+        for name, unit, dims in zip(self.names, self.units, self.dims):
+            if unit:
+                unit = PhysQuant._from_vector(1.0, dims).SI[1]
+                headers.append("{0} ({1})".format(name, unit))
+            else:
+                headers.append(name)
+        return headers
+
+    def write_si(self, target, delimiter=None, fmt="%.15g"):
+        """ Writes the file with every column converted to SI to target, a
+        path or a text stream, a chunk at a time.  The delimiter is that of
+        the source unless given.  Returns the number of rows written.
+        """
+        if isinstance(target, (str, os.PathLike)):
+            with open(target, "w", newline="") as stream:
+                return self.write_si(stream, delimiter, fmt)
+        rows = 0
+        line = None
+        for block in self.blocks():
+            if line is None:
+                delimiter = delimiter or self.delimiter
+                target.write(delimiter.join(self.si_header()) + "\n")
+                line = delimiter.join([fmt] * len(self.names)) + "\n"
+            # One formatting call for the whole chunk
+            target.write((line * len(block)) % tuple(block.ravel().tolist()))
+            rows += len(block)
+        if line is None and self.names:
+            target.write((delimiter or self.delimiter).join(
+                         self.si_header()) + "\n")
+        return rows
+
+
+def load_measurements(source, delimiter=None):
+    """ Reads a CSV or TSV file with units in its column headers into a
+    dictionary of column name: PhysQuantArray of SI values.  See
+    MeasurementReader for streaming large files in chunks.
+    """
+    reader = MeasurementReader(source, delimiter=delimiter)
+    chunks = list(reader.chunks())
+    # A file with only a header gives empty columns
+    return {name: PhysQuantArray._from_values(
+                np.concatenate([chunk[name]._values for chunk in chunks])
+                if chunks else np.empty(0), dims)
+            for name, dims in zip(reader.names, reader.dims)}
+
+
+class QuantityStore(object):
+    """ An array of quantities of one unit kept on disk.  The SI values are
+    a raw little endian float64 file opened with numpy.memmap, and a small
+    JSON sidecar next to it, the path with ".json" added, holds the unit as
+    a dictionary of unit: power, the signature the binary and JSON forms
+    use.  Slices are PhysQuantArray objects over the map, so nothing is
+    copied until the values are used, and change_unit gives a StoreView
+    that converts values only as they are read.  Stores opened with mode "r"
+    are read only and can be opened by many processes at once, which share
+    the pages of the file.  Mode "r+" allows writing values and append.
+    Use:
+        store = QuantityStore.create("vm.f8", PhysQuantArray(trace, "mV"))
+        store.append(PhysQuantArray(more, "mV"))
+        window = QuantityStore("vm.f8")[1000:2000]
+        for block in store.change_unit("mV").chunks():
+            ...
+    """
+    def __init__(self, path, mode="r"):
+        if mode not in ("r", "r+"):
+            raise ValueError("mode must be 'r' or 'r+', not {0!r}".format(mode))
+        self.path = os.fspath(path)
+        self.mode = mode
+        with open(self.sidecar(self.path)) as sidecar:
+            document = json.load(sidecar)
+        if not isinstance(document, dict) or \
+                document.get("format") != "PhysQuantStore" or \
+                "unit" not in document:
+            raise ValueError("{0} is not a PhysQuant store".format(self.path))
+        self._dims = _dims(document["unit"])
+        self._values = None
+        self.refresh()
+
+    @staticmethod
+    def sidecar(path):
+        """ Returns the path of the JSON file holding the unit of a store"""
+        return os.fspath(path) + ".json"
+
+    @classmethod
+    def create(cls, path, values=(), unit="", mode="r+"):
+        """ Makes a new store at path, replacing any store there, and opens
+        it.  values are a PhysQuantArray, whose unit is used, or numbers in
+        unit, which are converted to SI.
+        """
+        si_values, dims = _si_values(values, unit)
+        document = {"format": "PhysQuantStore", "version": 1,
+                    "unit": _powers(dims)}
+        with open(cls.sidecar(path), "w") as sidecar:
+            json.dump(document, sidecar)
+        with open(path, "wb") as data_file:
+            data_file.write(si_values.tobytes())
+        return cls(path, mode)
+
+    def refresh(self):
+        """ Maps the file again, to see values appended since it was
+        opened
+        """
+        size = os.path.getsize(self.path)
+        if size % 8:
+            raise ValueError("{0} does not hold whole float64 values".format(
+                             self.path))
+        self._values = None
+        if size:
+            self._values = np.memmap(self.path, dtype="<f8", mode=self.mode,
+                                     shape=(size // 8,))
+        else:
+            # numpy cannot map an empty file
+            self._values = np.empty(0, dtype="<f8")
+            self._values.flags.writeable = self.mode != "r"
+
+    @property
+    def values(self):
+        """ The memory mapped numpy array of SI values"""
+        return self._values
+
+    @property
+    def unit(self):
+        """ The SI based unit string of the values"""
+        return PhysQuant._from_vector(1.0, self._dims).SI[1]
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return "QuantityStore({0!r}, {1} values in {2!r})".format(
+            self.path, len(self), self.unit)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getitem__(self, index):
+        """ An integer index gives a PhysQuant, and a slice gives a
+        PhysQuantArray over the map without copying the values
+        """
+        values = self._values[index]
+        if isinstance(values, np.ndarray):
+            return PhysQuantArray._from_values(values, self._dims)
+        return PhysQuant._from_vector(float(values), self._dims)
+
+    def __setitem__(self, index, values):
+        self._check_writable()
+        si_values, dims = _si_values(values, self.unit, scalars=True)
+        if dims is not self._dims:
+            raise UnitError("{0} does not have the unit of the store".format(
+                            values))
+        self._values[index] = si_values
+
+    def _check_writable(self):
+        if self.mode == "r":
+            raise ValueError("{0} is opened read only".format(self.path))
+
+    def append(self, values, unit=None):
+        """ Adds values, a PhysQuantArray or numbers in unit, by default the
+        SI unit of the store, to the end of the file.  Returns the new
+        length.
+        """
+        self._check_writable()
+        si_values, dims = _si_values(values, self.unit if unit is None
+                                     else unit)
+        if dims is not self._dims:
+            raise UnitError("{0} does not have the unit of the store".format(
+                            values))
+        self.flush()
+        with open(self.path, "ab") as data_file:
+            data_file.write(si_values.tobytes())
+        self.refresh()
+        return len(self)
+
+    def change_unit(self, new_unit_str):
+        """ Returns a StoreView of the values in new_unit_str.  Nothing is
+        converted until values are read from the view.  Raises a UnitError
+        if the units are not compatible.
+        """
+        plan = PhysQuant.conversion_plan(self, new_unit_str)
+        if not plan.compatible:
+            raise UnitError("Conversion to {0} not Compatible".format(
+                            new_unit_str))
+        return StoreView(self, plan)
+
+    def chunks(self, chunk_size=65536):
+        """ Yields PhysQuantArray objects over up to chunk_size values of the
+        map at a time
+        """
+        for start in range(0, len(self), chunk_size):
+            yield self[start:start + chunk_size]
+
+    def flush(self):
+        """ Writes changed values back to the file"""
+        if isinstance(self._values, np.memmap) and self.mode != "r":
+            self._values.flush()
+
+    def close(self):
+        """ Writes changed values and lets go of the map"""
+        self.flush()
+        self._values = np.empty(0, dtype="<f8")
+
+
+class StoreView(object):
+    """ The values of a QuantityStore in another unit, as given by
+    QuantityStore.change_unit.  Indexing the view converts only the values
+    asked for, with the ConversionPlan of the unit, so a view of a store of
+    any size costs nothing until it is read.
+    """
+    __slots__ = ("store", "plan")
+
+    def __init__(self, store, plan):
+        self.store = store
+        self.plan = plan
+
+    @property
+    def unit(self):
+        return self.plan.unit_str
+
+    def __len__(self):
+        return len(self.store)
+
+    def __repr__(self):
+        return "StoreView({0!r} in {1!r})".format(self.store.path, self.unit)
+
+    def __getitem__(self, index):
+        return self.plan.convert(self.store.values[index])
+
+    def chunks(self, chunk_size=65536):
+        """ Yields the values in the new unit up to chunk_size at a time"""
+        for start in range(0, len(self.store), chunk_size):
+            yield self[start:start + chunk_size]
+
+
+def _si_values(values, unit, scalars=False):
+    """ Returns the contiguous float64 SI values and dimension vector of a
+    PhysQuantArray, or of numbers in unit.  With scalars a PhysQuant or a
+    single number is allowed as well.
+    """
+    if isinstance(values, PhysQuantArray):
+        return np.ascontiguousarray(values._values, dtype="<f8"), values._dims
+    if scalars and isinstance(values, PhysQuant):
+        return values._scale, values._dims
+    scale, offset, dims = PhysQuant._unit_factors(unit)
+    si_values = np.asarray(values, dtype=np.float64) * scale + offset
+    if scalars and not si_values.ndim:
+        return float(si_values), dims
+    return np.ascontiguousarray(si_values.ravel(), dtype="<f8"), dims
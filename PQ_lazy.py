@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Deferred math on PhysQuant and PhysQuantArray objects.  Math on a LazyQuant
+builds a small expression graph instead of making a new quantity at every
+operator.  The graph is evaluated in one pass the first time its value,
+unit or string form is needed.  Only needs numpy when arrays are used.
+"""
+from PQ_math_reorg import PhysQuant, UnitError, pq, _NO_DIMS
+
+
+def lazy(quant):
+    """ Wraps a PhysQuant, a PhysQuantArray, a number or a string that pq()
+    understands as a LazyQuant, so that math done with it is deferred.
+    Use:
+        ra = lazy(seg.vol).inverted() * seg.ra_cm * seg.sa
+        print(ra)
+    """
+    node = LazyQuant._node(quant)
+    if node is None:
+        raise ValueError("{0} is not understood".format(quant))
+    return node
+
+
+class LazyQuant(object):
+    """ A node of a deferred expression over PhysQuant and PhysQuantArray
+    objects.  Leaves hold the quantities the expression was built from, which
+    are treated as constants, and the other nodes hold an operation and its
+    operands.  Supports *, /, +, -, ** with a number, unary -, and
+    inverted().  The scalar, SI, prefixed, unitless, values and unit
+    properties, change_unit and printing all evaluate the graph.  The result
+    is kept in the node so the graph is only evaluated once.
+
+    While evaluating, operations that appear more than once in the graph
+    are done once, multiplying by an inverted quantity is done as a
+    division, and arrays made by one operation and only used by the next are
+    reused for its result instead of allocating a new array at each step.
+    The units are only worked out once for the whole graph, and only the
+    final result is made into a PhysQuant or PhysQuantArray.  This pays off
+    for arrays and for graphs with repeated parts.  Short chains of single
+    PhysQuant objects are faster done eagerly, since each eager operation
+    only makes one small object.
+    """
+    __slots__ = ("op", "args", "_result")
+
+    # Makes numpy hand operations with arrays over to the LazyQuant methods
+    __array_ufunc__ = None
+
+    def __init__(self, op, args):
+        self.op = op
+        self.args = args
+        self._result = None
+
+    @staticmethod
+    def _node(other):
+        """ Returns other as a LazyQuant node, or None if it is not something
+        that can be used in an expression.
+        """
+        if isinstance(other, LazyQuant):
+            return other
+        if isinstance(other, str):
+            other = pq(other)
+        if isinstance(other, (PhysQuant, int, float)) or \
+                hasattr(other, "_values") or hasattr(other, "shape"):
+            return LazyQuant("leaf", (other,))
+        return None
+
+    def _binary(self, op, other, reflected=False):
+        other = LazyQuant._node(other)
+        if other is None:
+            return NotImplemented
+        if reflected:
+            return LazyQuant(op, (other, self))
+        return LazyQuant(op, (self, other))
+
+    def __mul__(self, other):
+        return self._binary("mul", other)
+
+    def __rmul__(self, other):
+        return self._binary("mul", other, reflected=True)
+
+    def __truediv__(self, other):
+        return self._binary("div", other)
+
+    def __rtruediv__(self, other):
+        return self._binary("div", other, reflected=True)
+
+    def __add__(self, other):
+        return self._binary("add", other)
+
+    def __radd__(self, other):
+        return self._binary("add", other, reflected=True)
+
+    def __sub__(self, other):
+        return self._binary("sub", other)
+
+    def __rsub__(self, other):
+        return self._binary("sub", other, reflected=True)
+
+    def __neg__(self):
+        return LazyQuant("neg", (self,))
+
+    def __pow__(self, exponent):
+        if not isinstance(exponent, (int, float)):
+            raise ValueError("Exponent must be a float or int")
+        return LazyQuant("pow", (self, exponent))
+
+    def inverted(self):
+        """ Returns the deferred reciprocal of this expression"""
+        return LazyQuant("inv", (self,))
+
+    def evaluate(self):
+        """ Evaluates the expression and returns a PhysQuant, or a
+        PhysQuantArray if any of the quantities in it is an array
+        """
+        if self._result is None:
+            self._result = _Evaluation(self).result()
+        return self._result
+
+    @property
+    def scalar(self):
+        return self.evaluate().scalar
+
+    @property
+    def SI(self):
+        return self.evaluate().SI
+
+    @property
+    def prefixed(self):
+        return self.evaluate().prefixed
+
+    @property
+    def unitless(self):
+        return self.evaluate().unitless
+
+    @property
+    def values(self):
+        return self.evaluate().values
+
+    @property
+    def unit(self):
+        return self.evaluate().unit
+
+    def change_unit(self, new_unit_str, *args, **kwargs):
+        return self.evaluate().change_unit(new_unit_str, *args, **kwargs)
+
+    def __repr__(self):
+        return repr(self.evaluate())
+
+    def __str__(self):
+        return str(self.evaluate())
+
+    def __format__(self, format_spec):
+        return format(self.evaluate(), format_spec)
+
+
+class _Evaluation(object):
+    """ One evaluation of a LazyQuant graph.  Every node is given a key made
+    from its operation and the keys of its operands, so nodes that do the
+    same operation on the same quantities share a key and are evaluated
+    once.  The number of nodes using each key is counted first, so that an
+    array made by a node used only once can be changed in place and values
+    can be dropped once they have been used.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.keys = {}
+        self.uses = {}
+        self.done = {}
+        self._count(root)
+        self.remaining = dict(self.uses)
+
+    @staticmethod
+    def _operands(node):
+        """ Returns the LazyQuant operands of a node"""
+        if node.op == "pow":
+            return node.args[:1]
+        return node.args
+
+    def _key(self, node):
+        key = self.keys.get(id(node))
+        if key is None:
+            if node.op == "leaf":
+                key = ("leaf", id(node.args[0]))
+            elif node.op == "pow":
+                key = ("pow", self._key(node.args[0]), node.args[1])
+            else:
+                key = (node.op,) + tuple(self._key(arg) for arg in node.args)
+            self.keys[id(node)] = key
+        return key
+
+    def _count(self, root):
+        seen = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            key = self._key(node)
+            if key in seen or node.op == "leaf":
+                continue
+            seen.add(key)
+            for arg in _Evaluation._operands(node):
+                arg_key = self._key(arg)
+                self.uses[arg_key] = self.uses.get(arg_key, 0) + 1
+                stack.append(arg)
+
+    def _owned(self, node):
+        """ True if the value of node was made during this evaluation and
+        nothing else uses it, so it may be changed in place.
+        """
+        return node.op != "leaf" and self.uses.get(self._key(node), 0) <= 1
+
+    def result(self):
+        value, dims = self.evaluate(self.root)
+        if getattr(value, "ndim", 0):
+            from PQ_array import PhysQuantArray
+            return PhysQuantArray._from_values(value, dims)
+        return PhysQuant._from_vector(float(value), dims)
+
+    def evaluate(self, node):
+        """ Returns the value, a float or a numpy array, and the dimension
+        vector of node.  Values are only kept until the last node using them
+        has been evaluated, so arrays are freed as early as they would be
+        without the graph.
+        """
+        key = self._key(node)
+        done = self.done.pop(key, None)
+        if done is None:
+            done = self._apply(node)
+        remaining = self.remaining.get(key, 0) - 1
+        if remaining > 0:
+            self.done[key] = done
+            self.remaining[key] = remaining
+        return done
+
+    def _apply(self, node):
+        op = node.op
+        if op == "leaf":
+            quant = node.args[0]
+            if isinstance(quant, PhysQuant):
+                return quant._scale, quant._dims
+            if hasattr(quant, "_values"):
+                return quant._values, quant._dims
+            return quant, _NO_DIMS
+        if op == "pow":
+            value, dims = self.evaluate(node.args[0])
+            return value ** node.args[1], PhysQuant._scale_dims(dims,
+                                                                node.args[1])
+        if op == "inv":
+            value, dims = self.evaluate(node.args[0])
+            return 1.0 / value, PhysQuant._scale_dims(dims, -1)
+        if op == "neg":
+            value, dims = self.evaluate(node.args[0])
+            if self._owned(node.args[0]):
+                value *= -1.0
+                return value, dims
+            return -value, dims
+        left, right = node.args
+        if op == "mul":
+            # Multiplying by an inverted quantity is done as a division so
+            # the reciprocal is never made
+            if right.op == "inv":
+                return self._divide(left, right.args[0])
+            if left.op == "inv":
+                return self._divide(right, left.args[0])
+        elif op == "div":
+            return self._divide(left, right)
+        left_value, left_dims = self.evaluate(left)
+        right_value, right_dims = self.evaluate(right)
+        if op == "mul":
+            dims = PhysQuant._add_dims(left_dims, right_dims)
+            return self._combine(left, left_value, right_value, "mul"), dims
+        if left_dims is not right_dims:
+            raise UnitError("Cannot {0} {1} and {2}, units differ".format(
+                            "add" if op == "add" else "subtract",
+                            PhysQuant._from_vector(1.0, left_dims).SI[1],
+                            PhysQuant._from_vector(1.0, right_dims).SI[1]))
+        return self._combine(left, left_value, right_value, op), left_dims
+
+    def _divide(self, left, right):
+        left_value, left_dims = self.evaluate(left)
+        right_value, right_dims = self.evaluate(right)
+        dims = PhysQuant._sub_dims(left_dims, right_dims)
+        return self._combine(left, left_value, right_value, "div"), dims
+
+    def _combine(self, left, left_value, right_value, op):
+        """ Does op on the two values.  An array made by the left node and
+        used nowhere else is reused for the result.
+        """
+        if getattr(left_value, "ndim", 0) and self._owned(left):
+            try:
+                if op == "mul":
+                    left_value *= right_value
+                elif op == "div":
+                    left_value /= right_value
+                elif op == "add":
+                    left_value += right_value
+                else:
+                    left_value -= right_value
+                return left_value
+            except (ValueError, TypeError):
+                # The result is larger than the left array or of another
+                # type, so it has to be a new one
+                pass
+        if op == "mul":
+            return left_value * right_value
+        if op == "div":
+            return left_value / right_value
+        if op == "add":
+            return left_value + right_value
+        return left_value - right_value
+
@@ -5,15 +5,404 @@ Created on Fri Aug 28 08:29:29 2015
 @author: paulp
 """
 from math import log10 as log
+from math import floor
 from math import pi
-from copy import deepcopy
-import unittest
-import cProfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+import re
+import sys
 
 class UnitError(Exception):
         pass
 
 
+class UnitParseError(ValueError):
+    """ Raised for a unit string that does not follow the unit grammar.
+    position is the index in text where reading stopped.
+    """
+    def __init__(self, message, text, position):
+        ValueError.__init__(self, "{0} at position {1} in {2!r}".format(
+                            message, position, text))
+        self.text = text
+        self.position = position
+
+
+class _LRUCache(object):
+    """ Small size-bounded mapping that forgets the least recently used entry
+    once it holds more than maxsize items.  Used to memoize expensive
+    PhysQuant computations.  Keeps hit, miss and eviction counters so the
+    usefulness of a cache can be checked at run time with info().
+    A maxsize of 0 turns the cache off.
+    """
+    def __init__(self, maxsize=512):
+        self._data = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """ Returns the value stored for key and marks it as recently used, or
+        default if key is not in the cache"""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """ Stores value under key, evicting the oldest entries if needed"""
+        if self.maxsize <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._trim()
+
+    def resize(self, maxsize):
+        """ Changes the bound of the cache, evicting entries if it shrinks"""
+        self.maxsize = int(maxsize)
+        self._trim()
+
+    def clear(self):
+        """ Empties the cache and resets the counters"""
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def info(self):
+        """ Returns a dictionary with the counters and the current size"""
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "currsize": len(self._data),
+                "maxsize": self.maxsize}
+
+    def _trim(self):
+        while len(self._data) > max(self.maxsize, 0):
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+class _Signature(tuple):
+    """ A dimension vector that has been interned by _intern_dims.  There is
+    only ever one live _Signature for each dimension vector, so two
+    quantities have the same units exactly when their _dims are the same
+    object and units can be compared with is.  Copying or unpickling gives
+    back the interned signature.
+    """
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (_unpickle_signature, (tuple(self),))
+
+
+class _SignatureTable(object):
+    """ The table of interned signatures, keyed on the plain tuple of their
+    powers.  Tuples cannot be weakly referenced, so the table is bounded
+    instead: once it holds more than maxsize signatures, those that nothing
+    but the table refers to any more are dropped.  Signatures still in use
+    are never dropped, since that would leave two live signatures for the
+    same units, so if most are in use the bound is raised instead.
+
+    Since signatures are unique, the results of multiplying, dividing and
+    raising them to powers are kept in products, quotients and powers,
+    keyed on the ids of the
+    signatures.  Each entry holds the signatures it was made from so the ids
+    stay valid, and the entries are dropped whenever the table is pruned.
+    """
+    def __init__(self, maxsize=1024):
+        self._data = {}
+        self.maxsize = maxsize
+        self._limit = maxsize
+        self.evictions = 0
+        self.products = {}
+        self.quotients = {}
+        self.powers = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def intern(self, dims):
+        """ Returns the one _Signature for the dimension vector dims, a tuple
+        of powers without trailing zeros, making it if it is not in use yet.
+        """
+        signature = self._data.get(dims)
+        if signature is None:
+            signature = _Signature(dims)
+            self._data[tuple(dims)] = signature
+            if len(self._data) > self._limit:
+                self.prune()
+        return signature
+
+    def remember(self, memo, key, entry):
+        """ Stores entry in one of the memos, emptying the memo
+        first if it has grown well past the number of signatures
+        """
+        if len(memo) > 4 * self._limit:
+            memo.clear()
+        memo[key] = entry
+
+    def prune(self):
+        """ Drops the signatures that are only referred to by the table"""
+        self.products.clear()
+        self.quotients.clear()
+        self.powers.clear()
+        # The table and the argument of getrefcount are the only references
+        # to a signature that is not used
+        unused = [key for key in self._data
+                  if sys.getrefcount(self._data[key]) <= 2]
+        for key in unused:
+            del self._data[key]
+        self.evictions += len(unused)
+        self._limit = max(self.maxsize, 2 * len(self._data))
+
+    def info(self):
+        """ Returns a dictionary with the evictions and the current size"""
+        return {"evictions": self.evictions, "currsize": len(self._data),
+                "maxsize": self.maxsize}
+
+
+_signatures = _SignatureTable()
+_intern_dims = _signatures.intern
+
+
+def _unpickle_signature(dims):
+    """ Gives back the interned signature when a quantity is unpickled"""
+    return _signatures.intern(dims)
+
+
+# The signature of unitless quantities
+_NO_DIMS = _intern_dims(())
+
+
+class _Instruments(object):
+    """ Call counters and cumulative timings for groups of PhysQuant methods,
+    given as a dictionary of operation: method names.  While switched off
+    the methods are the plain ones and cost nothing extra.  Switching on puts
+    a wrapper around each method of the class that counts and times its
+    calls, and switching off puts the original methods back.  Timings of an
+    operation include the time spent in the operations it calls.
+    """
+    def __init__(self, operations):
+        self.operations = operations
+        self.originals = {}
+        self.calls = {}
+        self.seconds = {}
+        self.reset()
+
+    @property
+    def enabled(self):
+        return bool(self.originals)
+
+    def enable(self, cls):
+        """ Wraps the methods of cls so their calls are counted and timed"""
+        if self.originals:
+            return
+        for operation, names in self.operations.items():
+            for name in names:
+                original = cls.__dict__[name]
+                self.originals[name] = original
+                setattr(cls, name, self._wrap(original, operation))
+
+    def disable(self, cls):
+        """ Puts the original methods back on cls"""
+        for name, original in self.originals.items():
+            setattr(cls, name, original)
+        self.originals = {}
+
+    def reset(self):
+        """ Sets all the counters and timings back to zero"""
+        for operation in self.operations:
+            self.calls[operation] = 0
+            self.seconds[operation] = 0.0
+
+    def snapshot(self):
+        """ Returns a dictionary of operation: {"calls": ..., "seconds": ...}
+        with the counts and timings so far
+        """
+        return {operation: {"calls": self.calls[operation],
+                            "seconds": self.seconds[operation]}
+                for operation in self.operations}
+
+    def _wrap(self, original, operation):
+        if isinstance(original, (classmethod, staticmethod)):
+            return type(original)(self._wrap(original.__func__, operation))
+        calls = self.calls
+        seconds = self.seconds
+
+        @wraps(original)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                seconds[operation] += perf_counter() - start
+                calls[operation] += 1
+        return timed
+
+
+class _UnitParser(object):
+    """ Reads a unit string in one pass and returns its scale and powers of
+    units, without building unit lists.  The grammar is
+        expression := group ("/" group)*
+        group      := [number] [product]
+        product    := factor (("." | "*") factor)*
+        factor     := (unit | "(" expression ")") [["^"] integer]
+    so "8.314 J/mol.K", "J/(mol.K)", "9.8 m.s-2", "100 mS/50 cm2" and
+    "coul2/(J.sec.S)" are all read.  As before, "." binds tighter than "/",
+    so everything after a "/" up to the next "/" is in the denominator.
+    Units lose their prefix and are renamed as clean_unit and replace_prefix
+    did.  Temperature units that are converted to K with an offset have to
+    be the only unit of the string.
+    """
+    __slots__ = ("text", "pos", "scale", "powers", "offset")
+
+    _number = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+    _name = re.compile(r"[^\W\d_]+")
+    _power = re.compile(r"\^?([-+]?\d+)")
+    _space = re.compile(r"\s*")
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.scale = 1.0
+        self.powers = {}
+        self.offset = None
+
+    def parse(self):
+        """ Returns the scale and the interned dimension vector"""
+        self._expression(1)
+        if self.pos < len(self.text):
+            self._fail("Unexpected {0!r}".format(self.text[self.pos]))
+        if self.offset is not None:
+            unit, position = self.offset
+            if self.powers != {"K": 1}:
+                raise UnitParseError("{0} is measured from an offset and "
+                                     "cannot be combined with other units"
+                                     .format(unit), self.text, position)
+            self.scale = PhysQuant.convert_to_kelvins(self.scale, unit)
+        return self.scale, PhysQuant._powers_to_dims(self.powers)
+
+    def _fail(self, message):
+        raise UnitParseError(message, self.text, self.pos)
+
+    def _skip_space(self):
+        self.pos = self._space.match(self.text, self.pos).end()
+
+    def _expression(self, sign):
+        self._group(sign)
+        text = self.text
+        while self.pos < len(text) and text[self.pos] == "/":
+            self.pos += 1
+            self._group(-sign)
+
+    def _group(self, sign):
+        self._skip_space()
+        match = self._number.match(self.text, self.pos)
+        if match:
+            value = float(match.group())
+            if sign > 0:
+                self.scale *= value
+            elif value:
+                self.scale /= value
+            else:
+                self._fail("Division by zero")
+            self.pos = match.end()
+            self._skip_space()
+        if self.pos < len(self.text) and (self.text[self.pos] == "(" or
+                self._name.match(self.text, self.pos)):
+            self._product(sign)
+            self._skip_space()
+        elif not match:
+            self._fail("Expected a number or a unit")
+
+    def _product(self, sign):
+        text = self.text
+        self._factor(sign)
+        while self.pos < len(text) and text[self.pos] in ".*":
+            self.pos += 1
+            self._factor(sign)
+
+    def _exponent(self):
+        match = self._power.match(self.text, self.pos)
+        if match is None:
+            return 1
+        self.pos = match.end()
+        return int(match.group(1))
+
+    def _factor(self, sign):
+        text = self.text
+        start = self.pos
+        if start < len(text) and text[start] == "(":
+            # The inner expression is read on its own so the exponent after
+            # the closing parenthesis can be applied to all of it
+            outer = self.scale, self.powers
+            self.scale, self.powers = 1.0, {}
+            self.pos += 1
+            self._expression(1)
+            if self.pos >= len(text) or text[self.pos] != ")":
+                self._fail("Expected ')'")
+            self.pos += 1
+            power = sign * self._exponent()
+            inner_scale, inner_powers = self.scale, self.powers
+            self.scale, self.powers = outer
+            self.scale *= inner_scale ** power
+            for unit, unit_power in inner_powers.items():
+                self.powers[unit] = self.powers.get(unit, 0) + unit_power * power
+            return
+        match = self._name.match(text, start)
+        if match is None:
+            self._fail("Expected a unit")
+        self.pos = match.end()
+        power = sign * self._exponent()
+        prefix_scale, unit = self._unit(match.group())
+        if prefix_scale != 1.0:
+            self.scale *= prefix_scale ** power
+        if unit in PhysQuant.temp_units:
+            if self.offset is not None or power != 1:
+                raise UnitParseError("{0} is measured from an offset and "
+                                     "cannot be combined with other units"
+                                     .format(unit), text, start)
+            self.offset = unit, start
+            unit = "K"
+        elif unit == "S":
+            # S is stored as a negative power of Ω
+            unit = "Ω"
+            power = -power
+        self.powers[unit] = self.powers.get(unit, 0) + power
+
+    @staticmethod
+    def _unit(name):
+        """ Returns the prefix scale and the preferred name of a unit.  Units
+        named in better_unit.values(), one letter units and temperature units
+        never have a prefix.
+        """
+        better = PhysQuant.better_unit
+        unit = better.get(name, name)
+        if len(unit) < 2 or unit in PhysQuant._preferred or \
+                unit in PhysQuant.temp_units:
+            return 1.0, unit
+        prefix_scale = PhysQuant.prefix.get(name[0])
+        if prefix_scale is None:
+            return 1.0, unit
+        rest = name[1:]
+        return prefix_scale, better.get(rest, rest)
+
+
 class PhysQuant(object):
     """ This Class defines objects with a scalar value and a unit.  It can
     handle simple cases of scaled units.  The object stores the values as SI
@@ -39,8 +428,18 @@ class PhysQuant(object):
         "10 pF/ 20 um2"
         "100 Ohm.cm"
         
-    Physical Quantities are stored as a Dictionary of a primary unit and 
-    a unit that is scaling the primary unit.  So:
+    Physical Quantities are stored as a single float scale and a tuple of
+    integer powers, one for each unit in PhysQuant.base_units.  Ω and S
+    share one entry, positive powers are Ω and negative ones S.  Units that
+    are not base units get an entry of their own the first time they are
+    seen.  Trailing zero powers are dropped, so equal units always have equal
+    tuples.  Examples: "1 uF/cm2" is stored as 0.01, (1, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, -2) and "100 ohm.cm" as 1.0, (0, 1, 0, 0, 0, 0, 0, 0, 0, 0,
+    0, 1).
+
+    For backward compatibility the unit_dict property produces the
+    Dictionary of a primary unit and a unit that is scaling the primary unit
+    that older versions stored.  So:
     
     Key: "num": list of [scalar, [unit strings], and 1] to indicate
                 a numerator
@@ -54,8 +453,10 @@ class PhysQuant(object):
                                "denom": (1.0, [], -1) }
     """
 
+    # _rendered keeps the printed form of the object, see _rendering
+    __slots__ = ("_scale", "_dims", "_frozen", "_rendered")
+
     # Class Parameters
-    debug = False
     _SI_grams = True
     # Dicitonary of preferred unit values
     better_unit = {"ohm": "Ω", "Ohm": "Ω", "ohms": "Ω", "Ohms": "Ω",
@@ -63,10 +464,181 @@ class PhysQuant(object):
                    "mole": "mol", "moles": "mol", "liter": "l",
                    "Liter": "l", "liters": "l", "L": "l", "second": "sec",
                    "gram": "g", "q": "coul", "Q": "coul"}
+    # Units from better_unit that are never read as a prefixed unit
+    _preferred = frozenset(better_unit.values())
     # Dicitonary of potential unit prefixes and their values
     prefix = {"m": 1e-3, "u": 1e-6, "n": 1e-9, "p": 1e-12, "f": 1e-15,
               "K": 1.0e3, "M": 1.0e6, "G": 1.0e9, "μ": 1e-6,
               "c": 1e-2, "k": 1e3, "a": 1e-18}
+    # Units of the dimension vector in the order they are written out.  Ω
+    # also stands for S, which is stored as a negative power of Ω
+    base_units = ("F", "Ω", "V", "J", "coul", "A", "M", "l", "mol", "K", "g",
+                  "m", "sec")
+    # Position of every known unit in the dimension vector.  Other units are
+    # added to the end of _unit_names as they are first seen
+    _unit_names = list(base_units)
+    _unit_index = {unit: indx for indx, unit in enumerate(base_units)}
+    # Temperature units converted to K by an offset rather than a factor
+    temp_units = ("oC", "C", "Celsius", "oF", "Fahrenheit")
+    # Size of a degree of the temperature units that are not K sized
+    temp_scales = {"oF": 5.0 / 9.0, "Fahrenheit": 5.0 / 9.0}
+    # Cache of parsed unit strings keyed on the unit part of the string.
+    # Resize with set_parse_cache_size, inspect with parse_cache_info
+    _parse_cache = _LRUCache(512)
+    # Cache of ConversionPlan objects used by change_unit
+    _plan_cache = _LRUCache(256)
+    # Unit strings for printing, keyed on the dimension vector
+    _render_cache = _LRUCache(512)
+    # Results of math on frozen objects, keyed on the operation and the
+    # scale and interned signature of the operands.  Off until sized with
+    # set_constant_memo_size
+    _constant_memo = _LRUCache(0)
+    # The operators that look in the constant memo, put in place of the
+    # plain ones while it is on.  Filled in after the class, see _folding
+    _plain_ops = {}
+    _folding_ops = {}
+    # Counters and timings of the main operations.  Switch on with
+    # set_instrumentation, inspect with instrumentation_info
+    _instruments = _Instruments({
+        "parse": ("_make_vector",),
+        "unit_parser": ("_parse_vector",),
+        "clean": ("clean_unit",),
+        "replace_prefix": ("replace_prefix",),
+        "multiply": ("__mul__", "__rmul__"),
+        "reduce": ("reduce",),
+        "reduce_all": ("reduce_all",),
+        "format": ("__repr__", "__str__", "__format__"),
+        "allocate": ("__init__", "_from_vector")})
+
+    @classmethod
+    def set_parse_cache_size(cls, maxsize):
+        """ Sets the number of distinct unit strings whose parsed form is
+        kept.  0 turns the parse cache off.
+        """
+        PhysQuant._parse_cache.resize(maxsize)
+
+    @classmethod
+    def parse_cache_info(cls):
+        """ Returns the hits, misses, evictions and size of the parse cache
+        as a dictionary
+        """
+        return PhysQuant._parse_cache.info()
+
+    @classmethod
+    def clear_parse_cache(cls):
+        """ Empties the parse cache and resets its counters"""
+        PhysQuant._parse_cache.clear()
+
+    @classmethod
+    def set_constant_memo_size(cls, maxsize):
+        """ Sets the number of results of math on frozen objects that are
+        kept, so that folding the same constants again, as in R * T / F with
+        a frozen T, is a lookup.  While the memo is on, math on two frozen
+        objects gives a frozen result shared by every call with the same
+        values and units, and melt gives a changeable copy.  0, the default,
+        turns the memo off and puts back the plain operators, so it costs
+        nothing while off.
+        """
+        maxsize = int(maxsize)
+        if (maxsize > 0) != (PhysQuant._constant_memo.maxsize > 0):
+            # Swap the operators under any instrumentation wrappers
+            instrumented = PhysQuant._instruments.enabled
+            if instrumented:
+                PhysQuant._instruments.disable(PhysQuant)
+            ops = PhysQuant._folding_ops if maxsize > 0 else \
+                PhysQuant._plain_ops
+            for name, method in ops.items():
+                setattr(PhysQuant, name, method)
+            if instrumented:
+                PhysQuant._instruments.enable(PhysQuant)
+        PhysQuant._constant_memo.resize(maxsize)
+
+    @classmethod
+    def constant_memo_info(cls):
+        """ Returns the hits, misses, evictions and size of the constant memo
+        as a dictionary
+        """
+        return PhysQuant._constant_memo.info()
+
+    @classmethod
+    def clear_constant_memo(cls):
+        """ Empties the constant memo and resets its counters"""
+        PhysQuant._constant_memo.clear()
+
+    @classmethod
+    def signature_info(cls):
+        """ Returns the evictions and size of the table of unit signatures,
+        the interned dimension vectors shared by all quantities with the same
+        units, as a dictionary
+        """
+        return _signatures.info()
+
+    @classmethod
+    def set_instrumentation(cls, on=True):
+        """ Switches the counting and timing of parsing, reading unit strings,
+        cleaning, prefix replacement, multiplication, reduce, reduce_all,
+        formatting and object allocation on or off.  It is off by default and
+        then costs nothing.
+        """
+        if on:
+            PhysQuant._instruments.enable(PhysQuant)
+        else:
+            PhysQuant._instruments.disable(PhysQuant)
+
+    @classmethod
+    def instrumentation_info(cls):
+        """ Returns the calls and cumulative seconds of each instrumented
+        operation as a dictionary
+        """
+        return PhysQuant._instruments.snapshot()
+
+    @classmethod
+    def reset_instrumentation(cls):
+        """ Sets the instrumentation counters and timings back to zero"""
+        PhysQuant._instruments.reset()
+
+    @classmethod
+    @contextmanager
+    def profile(cls, sort="cumulative", limit=20, stream=None):
+        """ Runs cProfile around the code in a with block and prints the
+        limit most expensive functions sorted by sort when the block ends.
+        The profiler is given to the block for further use with pstats, and
+        a limit of 0 prints nothing.
+        Use:
+            with PhysQuant.profile(limit=10):
+                run_model()
+        """
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+        if limit:
+            pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(limit)
+
+    @classmethod
+    def conversion_plan(cls, source, new_unit_str, with_prefix=False):
+        """ Returns the ConversionPlan that converts quantities with the unit
+        of source, a PhysQuant or anything else with a dimension vector, into
+        new_unit_str.  Plans are kept in the plan cache, so new_unit_str is
+        only interpreted once for each unit it is used with.
+        """
+        key = (source._dims, new_unit_str, with_prefix)
+        plan = PhysQuant._plan_cache.get(key)
+        if plan is None:
+            plan = ConversionPlan(source._dims, new_unit_str, with_prefix)
+            PhysQuant._plan_cache.put(key, plan)
+        return plan
+
+    @classmethod
+    def plan_cache_info(cls):
+        """ Returns the hits, misses, evictions and size of the conversion
+        plan cache as a dictionary
+        """
+        return PhysQuant._plan_cache.info()
 
     @classmethod
     def clean_unit(cls, units_dict):
@@ -76,12 +648,10 @@ class PhysQuant(object):
         accordingly.  Ensures that all units are stored in the same way in all
         instances
         """
-        tmp_units_dict = deepcopy(units_dict)
-        if PhysQuant.debug: 
-            print("Enter clean_unit")
-            print(units_dict, "NUM", units_dict["num"], "DENOM", units_dict["denom"])
+        # The unit lists are cleaned in place so only the outer dictionary
+        # is copied
+        tmp_units_dict = dict(units_dict)
         for key, value in units_dict.items():
-            if PhysQuant.debug: print("Units to process", key, len(value), value)
             if len(value) == 3:
                 for indx, str_unit in enumerate(value[1]):
                     unit = str_unit
@@ -91,7 +661,6 @@ class PhysQuant(object):
                         # replace it with the preferred better_unit string
                             for bad_unit in cls.better_unit.keys():
                                 # print(key)
-                                if PhysQuant.debug: print(str_unit, bad_unit)
                                 #if we find a better unit replace the string
                                 pos = str_unit.find(bad_unit)
                                 if pos >= 0:
@@ -99,7 +668,6 @@ class PhysQuant(object):
                                                         cls.better_unit[bad_unit])
                     value[1][indx] = unit
                     tmp_units_dict[key] = value
-                if PhysQuant.debug: print("replaced ", units_dict)
             else:
                 print("{0}: {1} not understood in ".format(key, value), units_dict)
         return tmp_units_dict
@@ -107,19 +675,58 @@ class PhysQuant(object):
     @classmethod
     def find_prefix(cls, in_scalar, use_centi=False):
         """ Classmethod to generate the appropriate prefix to add and adjust
-        the scalar by the appropriate amount.
+        the scalar by the appropriate amount.  The first prefix in the prefix
+        dictionary that scales the value to between 0.9 and 999 is used.  The
+        prefixes that can do this for a value are looked up by the value's
+        power of ten in _prefix_table, so only those few are tested.
         """
         output_value = in_scalar
         best_prefix = ""
-        for prefix, value in PhysQuant.prefix.items():
-            if prefix == "c" and not use_centi:
-                continue
-            scaled_value = in_scalar / value
-            if 0.9 <= scaled_value < 999:
-                output_value = scaled_value
-                best_prefix = prefix
-                break
+        if 0 < in_scalar < float("inf"):
+            candidates = PhysQuant._prefix_table[bool(use_centi)].get(
+                floor(log(in_scalar)), ())
+            for prefix, value in candidates:
+                scaled_value = in_scalar / value
+                if 0.9 <= scaled_value < 999:
+                    output_value = scaled_value
+                    best_prefix = prefix
+                    break
         return output_value, best_prefix
+
+    @classmethod
+    def build_prefix_table(cls):
+        """ Precomputes the table used by find_prefix.  For each power of ten
+        it lists, in the order of the prefix dictionary, the prefixes that can
+        scale a value of that power to between 0.9 and 999.  Must be called
+        again if the prefix dictionary is changed.
+        """
+        tables = {}
+        for use_centi in (False, True):
+            table = {}
+            for power in range(-22, 16):
+                candidates = []
+                for prefix, value in PhysQuant.prefix.items():
+                    if prefix == "c" and not use_centi:
+                        continue
+                    # A prefix covers 0.9 to 999 times its value, which spans
+                    # the power below it up to two powers above it
+                    prefix_power = round(log(value))
+                    if prefix_power - 2 <= power <= prefix_power + 3:
+                        candidates.append((prefix, value))
+                table[power] = tuple(candidates)
+            tables[use_centi] = table
+        PhysQuant._prefix_table = tables
+        # _assign_prefix table of the prefix to use for each integer power
+        my_prefix = {-3: "m", -6: "μ", -9: "n", -12: "p", -15: "f", 3: "K",
+                     0: ""}
+        assign_table = {}
+        for log_numb in range(-20, 8):
+            for power in my_prefix.keys():
+                if 0 <= log_numb - power < 3:
+                    assign_table[log_numb] = (power, my_prefix[power])
+                    break
+        PhysQuant._assign_table = assign_table
+        PhysQuant._render_cache.clear()
         
     @classmethod
     def _interpret(cls, *args, **kwargs):
@@ -131,8 +738,6 @@ class PhysQuant(object):
         basic form needed to create the PhysQuant object
         """
         temp_dict = {"num": [1.0, [], 1], "denom": [1.0, [], -1]}
-        if PhysQuant.debug: print("Enter _interpret")
-        if PhysQuant.debug: print("args {0}, kwargs {1}".format(args, kwargs))
 
         if args:
             # if non-dictionary object was passed determine what it is. Most
@@ -147,16 +752,19 @@ class PhysQuant(object):
                 # Two types of strings can be handled, repr() type strings that
                 # can be interpreted as unit_dict definitions, and strings
                 # of the unit = scalar type.
-                if PhysQuant.debug: print("An args string")
                 if var[:2] == "**":
                     # If we have a keyword string dict definition in under the
                     # args input, process it if possible.  First remove "**"
                     kwargs_def = var[2:]
-                    if PhysQuant.debug: print("An args kwargs", kwargs_def)
-                    # Then convert string to a dictionary object
-                    kwargs = eval(kwargs_def)
-                    if PhysQuant.debug: print("kwargs {0}, type: {1}".format(
-                                              kwargs, type(kwargs)))
+                    # Then convert string to a dictionary object.  Only
+                    # literals are read, the string is never run as code
+                    from ast import literal_eval
+                    try:
+                        kwargs = literal_eval(kwargs_def.strip())
+                    except (ValueError, SyntaxError):
+                        raise ValueError("{0} is not a unit_dict".format(var))
+                    if not isinstance(kwargs, dict):
+                        raise ValueError("{0} is not a unit_dict".format(var))
                     for key, value in kwargs.items():
                         # Then prepare it for use if possible
 
@@ -183,7 +791,6 @@ class PhysQuant(object):
             temp_dict = {"num": [1.0, [], 1], "denom": [1.0, [], -1]}
             holding_dict = {}
             # Keywords need to define a numerator, denominator or both
-            if PhysQuant.debug: print("A kwargs input", kwargs)
             for key, value in kwargs.items():
                 if key == "num" or key == "denom":
                     # Make sure unti_dict items are properly configured
@@ -206,22 +813,69 @@ class PhysQuant(object):
                     unit_str = str(value) + " " + str(key)
                     temp_dict = PhysQuant._make_dict(unit_str)
                 
-        if PhysQuant.debug: print(temp_dict)
         return temp_dict
 
     @classmethod
     def _make_dict(cls, unit_str):
-        """ Runs through the steps to create a unit_dict from a unit_string"""
-        if PhysQuant.debug: print("Enter _make_dict")
-        temp_dict = PhysQuant.id_scaled_unit(unit_str)
-        if PhysQuant.debug: print("id_scaled_dict", temp_dict)
-        temp_dict = cls.clean_unit(temp_dict)
-        if PhysQuant.debug: print("clean_unit_dict", temp_dict)
-        temp_dict = cls.replace_prefix(temp_dict)
-        if PhysQuant.debug: print("replaced_prefix_dict", temp_dict)
-        temp_dict = PhysQuant.normalize_denom(temp_dict)
-        if PhysQuant.debug: print("normalized_dict", temp_dict)
-        return temp_dict
+        """ Creates a unit_dict from a unit_string, with fresh unit lists that
+        the caller is free to change.
+        """
+        scale, dims = cls._make_vector(unit_str)
+        num_units, denom_units = PhysQuant._dims_to_units(dims)
+        return {"num": [scale, num_units, 1], "denom": [1.0, denom_units, -1]}
+
+    @classmethod
+    def _make_vector(cls, unit_str):
+        """ Returns the scale and dimension vector for a unit_string.  The
+        numbers in the string are split from the units first, so that the units
+        only have to be parsed once.  The parsed units are kept in the parse
+        cache and the immutable dimension vector is shared by every quantity
+        made from the same units.  Strings with temperature units are not
+        cached since converting them to K is not a simple scaling.
+        """
+        split = PhysQuant._split_scalars(unit_str)
+        if split is None:
+            return cls._parse_vector(unit_str)
+        unit_key, num_value, denom_value = split
+        cached = PhysQuant._parse_cache.get(unit_key)
+        if cached is None:
+            if PhysQuant._has_temp_unit(unit_key):
+                cached = False
+            else:
+                scale, dims = cls._parse_vector(unit_key)
+                # The scale only comes from products of the prefixes, so it
+                # is a power of ten and rounding removes accumulated error
+                cached = (float("{0:.15g}".format(scale)), dims)
+            PhysQuant._parse_cache.put(unit_key, cached)
+        if cached is False:
+            return cls._parse_vector(unit_str)
+        scale, dims = cached
+        return scale * num_value / denom_value, dims
+
+    @classmethod
+    def _parse_vector(cls, unit_str):
+        """ Returns the scale and dimension vector of a unit_string, read in
+        one pass by _UnitParser.  Raises UnitParseError, a ValueError, with
+        the position of the problem for strings it cannot read.
+        """
+        return _UnitParser(unit_str).parse()
+
+    @classmethod
+    def _unit_factors(cls, unit):
+        """ Returns the scale, offset and dimension vector that convert
+        numbers in a unit string to SI.  The offset is only non-zero for
+        temperature units converted to K, and is taken apart from the scale
+        so neither loses precision, 100 oC is exactly 373.15 K.
+        """
+        if not unit:
+            return 1.0, 0.0, _NO_DIMS
+        parser = _UnitParser(unit)
+        scale, dims = parser.parse()
+        if parser.offset is None:
+            return scale, 0.0, dims
+        temp_unit = parser.offset[0]
+        return (PhysQuant.temp_scales.get(temp_unit, 1.0),
+                PhysQuant.convert_to_kelvins(0.0, temp_unit), dims)
 
 
     @classmethod
@@ -233,27 +887,26 @@ class PhysQuant(object):
         be interpreted to be PhysQuant objects.
         """
         temp_dict_product = {}
-        # Gathers the two unit_dict dictionaries to multiply together
+        # Gathers the two unit_dict dictionaries to multiply together.  They
+        # are only read, the product gets new unit lists
         if isinstance(pq1, PhysQuant):
-            temp_dict_pq1 = deepcopy(pq1.unit_dict)
+            temp_dict_pq1 = pq1.unit_dict
         elif isinstance(pq1, dict):
-            temp_dict_pq1 = deepcopy(pq1)
+            temp_dict_pq1 = pq1
         else:
             # strings, floats, int...
             try:
-                temp_pq1 = pq(pq1)
-                temp_dict_pq1 = deepcopy(temp_pq1)
+                temp_dict_pq1 = pq(pq1).unit_dict
             except:
                 raise ValueError("{0} is not a good PhysQuant".format(pq1))
 
         if isinstance(pq2, PhysQuant):
-            temp_dict_pq2 = deepcopy(pq2.unit_dict)
+            temp_dict_pq2 = pq2.unit_dict
         elif isinstance(pq2, dict):
-            temp_dict_pq2 = deepcopy(pq2)
+            temp_dict_pq2 = pq2
         else:
             try:
-                temp_pq2 = pq(pq2)
-                temp_dict_pq2 = deepcopy(temp_pq2)
+                temp_dict_pq2 = pq(pq2).unit_dict
             except:
                 raise ValueError("{0} is not a good PhysQuant".format(pq2))
         
@@ -266,11 +919,131 @@ class PhysQuant(object):
             else:
                 raise ValueError("powers of pq1.{0}={1} and pq2.{0}={2} not compatible".format(key, value, temp_dict_pq2[key]))
             out_scalar = value[0] * temp_dict_pq2[key][0]
-            unit = deepcopy(value[1])
+            unit = list(value[1])
             unit.extend(temp_dict_pq2[key][1])
             temp_dict_product[key] = [out_scalar, unit, power]
         return temp_dict_product
 
+    @classmethod
+    def _dict_to_vector(cls, units_dict):
+        """ Converts a unit_dict into the scale and dimension vector stored in
+        PhysQuant objects.  The scalar of an entry with a negative power is
+        divided into the scale and its units count as negative powers.  S is
+        stored as a negative power of Ω.
+        """
+        scale = 1.0
+        powers = {}
+        for key, value in units_dict.items():
+            if value[2] >= 0:
+                scale *= float(value[0])
+                sign = 1
+            else:
+                scale /= float(value[0])
+                sign = -1
+            for unit in value[1]:
+                if unit == "S":
+                    unit = "Ω"
+                    step = -sign
+                else:
+                    step = sign
+                powers[unit] = powers.get(unit, 0) + step
+        return scale, cls._powers_to_dims(powers)
+
+    @classmethod
+    def _powers_to_dims(cls, powers):
+        """ Builds the dimension vector from a dictionary of unit: power.
+        Units that are not in the vector yet are given the next free position.
+        """
+        dims = []
+        for unit, power in powers.items():
+            if not power:
+                continue
+            indx = PhysQuant._unit_index.get(unit)
+            if indx is None:
+                indx = len(PhysQuant._unit_names)
+                PhysQuant._unit_names.append(unit)
+                PhysQuant._unit_index[unit] = indx
+            if indx >= len(dims):
+                dims.extend([0] * (indx + 1 - len(dims)))
+            dims[indx] = power
+        return _intern_dims(tuple(dims))
+
+    @classmethod
+    def _dims_to_units(cls, dims):
+        """ Returns the numerator and denominator unit lists for a dimension
+        vector, with each unit repeated by its power.  Powers of Ω are always
+        put in the numerator, as S when they are negative.
+        """
+        num_units = []
+        denom_units = []
+        for indx, power in enumerate(dims):
+            if not power:
+                continue
+            unit = PhysQuant._unit_names[indx]
+            if unit == "Ω":
+                if power > 0:
+                    num_units.extend(["Ω"] * power)
+                else:
+                    num_units.extend(["S"] * -power)
+            elif power > 0:
+                num_units.extend([unit] * power)
+            else:
+                denom_units.extend([unit] * -power)
+        return num_units, denom_units
+
+    @classmethod
+    def _gram_dims(cls):
+        """ Dimension vector of a mass in g"""
+        return cls._powers_to_dims({"g": 1})
+
+    @classmethod
+    def _render_info(cls, dims):
+        """ Returns whether values with the dimension vector may use the centi
+        prefix, and a dictionary of the prefixed unit strings made so far.
+        Kept in the render cache so each unit is only worked out once.
+        """
+        render = PhysQuant._render_cache.get(dims)
+        if render is None:
+            num_units, denom_units = cls._dims_to_units(dims)
+            render = ("m" in num_units, {})
+            PhysQuant._render_cache.put(dims, render)
+        return render
+
+    @classmethod
+    def _prefixed_unit(cls, dims, to_add_prefix):
+        """ Builds the unit string for a dimension vector with to_add_prefix
+        on the first unit of the numerator.
+        """
+        num_units, denom_units = cls._dims_to_units(dims)
+        num_string = PhysQuant.prefixed_list_to_string(to_add_prefix,
+                                                      num_units)
+        denom_string = PhysQuant.prefixed_list_to_string("", denom_units)
+        if denom_string:
+            return num_string + "/" + denom_string
+        return num_string
+
+    @classmethod
+    def _from_vector(cls, scale, dims):
+        """ Private constructor that makes a PhysQuant directly from a scale
+        and a dimension vector that are known to be valid, without going
+        through _interpret.
+        """
+        new_pq = object.__new__(PhysQuant)
+        new_pq._scale = scale
+        new_pq._dims = dims
+        new_pq._frozen = False
+        new_pq._rendered = None
+        return new_pq
+
+    @classmethod
+    def _from_powers(cls, scale, powers):
+        """ Private constructor that makes a PhysQuant from a scale and a
+        dictionary of unit: power, with S given as a negative power of Ω.
+        Used for constants whose units are known in advance, so their unit
+        strings do not have to be parsed.
+        """
+        return cls._from_vector(float(scale), cls._powers_to_dims(powers))
+
     @classmethod
     def replace_prefix(cls, units_dict):
         """ This method removes the prefixes from units and adjusts the scalar
@@ -282,14 +1055,12 @@ class PhysQuant(object):
         Input: Dictionary of list [scalar, unit with prefix, power]
         Output: Dictionary of list [scaled scalar, unit w/o prefix, power]
         """
-        tmp_units_dict = deepcopy(units_dict)
+        # The unit lists are changed in place so only the outer dictionary
+        # is copied
+        tmp_units_dict = dict(units_dict)
         #print("tmpunitsdict", tmp_units_dict)
         prefix_value = 1.0        
-        if PhysQuant.debug: print("Enter replace_prefix")    
         for key, value in units_dict.items():
-            if PhysQuant.debug: print("Unit0", value[0], type(value[0]),
-                                      "Unit1", value[1], type(value[1]),
-                                      "Unit3", value[2], type(value[2]))
             # Temp variables are assigned to the tuple contents
             unit_value = float(value[0])
             units = value[1]
@@ -306,8 +1077,6 @@ class PhysQuant(object):
                     in the unit_value using eval() to generate a float"""
                     if unit and len(unit) > 1:
                         for prefix, scale in PhysQuant.prefix.items():
-                            if PhysQuant.debug: print("Key Test", prefix, unit,
-                                                      unit.startswith(prefix))
                             # if the 1st char matches a prefix in the dictionary...
                             if unit.startswith(prefix):
                                 if prefix == "m" and unit == "mol":
@@ -316,11 +1085,9 @@ class PhysQuant(object):
                                     unit = unit.replace(prefix, "")
                                     units.pop(index)
                                     units.insert(index, unit)
-                                    if PhysQuant.debug: print("replaced", unit)
                                     prefix_value = scale
                                     break
                         unit_value *= prefix_value
-                        if PhysQuant.debug: print(unit_value, unit)
                     # String with math expression for the scalar is evaluated to make
                     # a float scalar.  The results are packaged into a tuple for
                     # placement back in the dictionary
@@ -335,11 +1102,26 @@ class PhysQuant(object):
         return tmp_units_dict
 
     def __init__(self, *args, **kwargs):
-        """This is the internal dictionary containing the info for the Physical
-        Quantity that is represented in this Class. It is hidden from the 
-        Outside and its values are retrieved using unit property.
+        """The scale and dimension vector of the Physical Quantity that is
+        represented in this Class are hidden from the Outside.  Its values are
+        retrieved using the properties, and unit_dict rebuilds the dictionary
+        form of the quantity.
         """
-        self._unit_dict = PhysQuant._interpret(*args, **kwargs)
+        var = args[0] if len(args) == 1 and not kwargs else None
+        if isinstance(var, PhysQuant):
+            # The dimension vector is an immutable tuple and can be shared
+            self._scale = var._scale
+            self._dims = var._dims
+        elif isinstance(var, str) and var[:2] != "**":
+            self._scale, self._dims = PhysQuant._make_vector(var)
+        elif isinstance(var, (int, float)):
+            self._scale = float(var)
+            self._dims = _NO_DIMS
+        else:
+            temp_dict = PhysQuant._interpret(*args, **kwargs)
+            self._scale, self._dims = PhysQuant._dict_to_vector(temp_dict)
+        self._frozen = False
+        self._rendered = None
 
     @property
     def prefixed(self):
@@ -348,32 +1130,38 @@ class PhysQuant(object):
         Output is a tuple composed of the value as a float and the appropriate
         prefixed unit.
         """
-        use_centi = False
-        self.reduce()
-        self._unit_dict = self.normalize_denom(self.unit_dict)
-        unit_scalar = self.unit_dict["num"][0]
-        if "m" in self.unit_dict["num"][1]:
-            # Only use centi prefix on meters units
-            use_centi = True
-        output_value, to_add_prefix = self.find_prefix(unit_scalar, use_centi)
-        num_string = PhysQuant.prefixed_list_to_string(to_add_prefix,
-                                                      self.unit_dict["num"][1])
-        denom_string = PhysQuant.prefixed_list_to_string("",
-                                                    self.unit_dict["denom"][1])
-        if denom_string:
-            output_unit = num_string + "/" + denom_string
-        else:  
-            output_unit = num_string
-        if PhysQuant.debug: print("unit Output", output_value, output_unit)
-        return output_value, output_unit
+        return self._rendering()[2]
+
+    def _rendering(self):
+        """ Returns the scale and dimension vector the printed form of this
+        object was made from, the prefixed value and unit, and the string
+        given by str and repr.  These are kept in the object and only made
+        again once its value has changed, so printing an object repeatedly
+        costs a comparison.  Printing never changes the value.
+        """
+        rendered = self._rendered
+        if rendered is not None and rendered[1] is self._dims and \
+                rendered[0] == self._scale:
+            return rendered
+        render = PhysQuant._render_info(self._dims)
+        # Only use centi prefix on meters units
+        output_value, to_add_prefix = self.find_prefix(self._scale, render[0])
+        output_unit = render[1].get(to_add_prefix)
+        if output_unit is None:
+            output_unit = PhysQuant._prefixed_unit(self._dims, to_add_prefix)
+            render[1][to_add_prefix] = output_unit
+        rendered = (self._scale, self._dims, (output_value, output_unit),
+                    "{0:.3f} {1}".format(output_value, output_unit))
+        self._rendered = rendered
+        return rendered
         
     @property
     def scalar(self):
         """ Returns the internal scalar stored in the unit_dict.  However if
         flag SI_grams=False, convers g to kg by dividing by 1000.0
         """
-        stored_scalar = self._unit_dict["num"][0]
-        if not self._SI_grams and self._unit_dict["num"][1] == 'g':
+        stored_scalar = self._scale
+        if not self._SI_grams and self._dims is PhysQuant._gram_dims():
             stored_scalar = stored_scalar / 1000.0
         return stored_scalar
 
@@ -382,9 +1170,8 @@ class PhysQuant(object):
         """ Returns the internal scalar stored in the unit_dict only if there
         are no units remaining in the unit_dict
         """
-        stored_scalar = self._unit_dict["num"][0]
-        if not self.unit_dict["num"][1] and not self.unit_dict["denom"][1]:
-            return stored_scalar
+        if not self._dims:
+            return self._scale
         else:
             raise ValueError("Scalar still has attached Units")
         
@@ -395,64 +1182,97 @@ class PhysQuant(object):
         SI will return grams if the hidden class level flag _SI_grams
         is set to True, otherwise returns kg.
         """
-        output_unit = ".".join(self._unit_dict["num"][1])
-        scale_unit = ".".join(self._unit_dict["denom"][1])
-        local_scalar = self._unit_dict["num"][0]
-        if self._unit_dict["denom"][2] == -1 and self._unit_dict["denom"][1]:
-            output_unit = output_unit + "/" + scale_unit
-        if not self._SI_grams and self._unit_dict["num"][1] == 'g':
+        num_units, denom_units = PhysQuant._dims_to_units(self._dims)
+        output_unit = ".".join(num_units)
+        local_scalar = self._scale
+        if denom_units:
+            output_unit = output_unit + "/" + ".".join(denom_units)
+        if not self._SI_grams and self._dims is PhysQuant._gram_dims():
             output_unit = "kg"
             local_scalar = local_scalar / 1000.0
         return local_scalar, output_unit
 
     @property
     def unit_dict(self):
-        return self._unit_dict
+        """ Builds the unit_dict form of the stored scale and dimension
+        vector.  Each call returns a new dictionary.  The entries are tuples
+        if the object is frozen.
+        """
+        num_units, denom_units = PhysQuant._dims_to_units(self._dims)
+        if self._frozen:
+            return {"num": (self._scale, tuple(num_units), 1),
+                    "denom": (1.0, tuple(denom_units), -1)}
+        return {"num": [self._scale, num_units, 1],
+                "denom": [1.0, denom_units, -1]}
 
     @property
-    def unitless(self):
-        """ Returns the internal scalar stored in the unit_dict only if there
-        are no units remaining in the unit_dict
-        """
-        stored_scalar = self._unit_dict["num"][0]
-        if not self.unit_dict["num"][1] and not self.unit_dict["denom"][1]:
-            return stored_scalar
-        else:
-            raise ValueError("Scalar still has attached Units")
+    def _unit_dict(self):
+        return self.unit_dict
+
+    @_unit_dict.setter
+    def _unit_dict(self, units_dict):
+        self._check_not_frozen()
+        self._scale, self._dims = PhysQuant._dict_to_vector(units_dict)
         
     def __call__(self, var):
         #def __call__(self):
         """Call can make a new PhysQuant object the same as using pq"""
-        if PhysQuant.debug: print("Enter __call__")    
         #return self.scalar, self.SI
         return PhysQuant(var)
 
 
+    def _other_scale(self, other, operation):
+        """ Returns the scale of other after checking it has the same units
+        as this object, as needed to add, subtract or compare.  Strings are
+        parsed and numbers can be used with unitless quantities.  Returns
+        None if other is not something that can be used, so the operator
+        can return NotImplemented.  Neither object is changed.
+        """
+        if isinstance(other, PhysQuant):
+            if other._dims is self._dims:
+                return other._scale
+            other_unit = other.SI[1]
+        elif isinstance(other, str):
+            return self._other_scale(pq(other), operation)
+        elif isinstance(other, (int, float)):
+            if not self._dims:
+                return float(other)
+            other_unit = "no unit"
+        else:
+            return None
+        raise UnitError("Cannot {0} {1} and {2}, units differ".format(
+                        operation, self.SI[1] or "no unit", other_unit))
+
     def __add__(self, pq_obj):
         """ redefines addition for PhysQuant objects.  Method adds the scalar
-        values if the unit_lists are the same.  Otherwise the method fails.
-        Both objects must be PhysQuant objects or a ValueError is raised.
+        values if the units are the same, which is checked by comparing the
+        interned dimension vectors, and raises a UnitError otherwise.  Neither
+        object is changed.
         """
+        scale = self._other_scale(pq_obj, "add")
+        if scale is None:
+            return NotImplemented
+        return PhysQuant._from_vector(self._scale + scale, self._dims)
+
+    def __radd__(self, pq_obj):
+        scale = self._other_scale(pq_obj, "add")
+        if scale is None:
+            return NotImplemented
+        return PhysQuant._from_vector(scale + self._scale, self._dims)
+
+    def __sub__(self, pq_obj):
+        """ Subtracts quantities with the same units, see __add__"""
+        scale = self._other_scale(pq_obj, "subtract")
+        if scale is None:
+            return NotImplemented
+        return PhysQuant._from_vector(self._scale - scale, self._dims)
+
+    def __rsub__(self, pq_obj):
+        scale = self._other_scale(pq_obj, "subtract")
+        if scale is None:
+            return NotImplemented
+        return PhysQuant._from_vector(scale - self._scale, self._dims)
 
-        if PhysQuant.debug: 
-            print("add", self.unit_dict, pq_obj.unit_dict)
-        try:
-            self.melt
-            self.reduce()
-            pq_obj.melt
-            pq_obj.reduce()
-            temp_unit_dict = self.unit_dict
-            my_temp_denom_unit_list = list(self._unit_dict["denom"][1])
-            pq_obj_temp_denom_unit_list = list(pq_obj._unit_dict["denom"][1])
-            my_temp_num_unit_list = list(self._unit_dict["num"][1])
-            pq_obj_temp_num_unit_list = list(pq_obj._unit_dict["num"][1])
-            if my_temp_denom_unit_list == pq_obj_temp_denom_unit_list and my_temp_num_unit_list == pq_obj_temp_num_unit_list:
-                scalar_sum = self.unit_dict["num"][0] + pq_obj.unit_dict["num"][0]
-                temp_unit_dict["num"][0] = scalar_sum
-                return pq(**temp_unit_dict)
-        except ValueError as e:
-            e("PhysQuant Object units are not identical")
- 
     def __mul__(self, multiplier):
         """ redefines multiplication for PhysQuant objects if PhysQuant is the
         item preceding the "*" operator.  Method multiplies the scalar values
@@ -461,38 +1281,25 @@ class PhysQuant(object):
         cancelled.If one of the objects is not a PhysQuant object a
         conversion is attempted as a first step in the process
         """
-        if PhysQuant.debug: 
-            print("Multiply by", multiplier)
         if isinstance(multiplier, (int, float)):
+            return PhysQuant._from_vector(self._scale * multiplier, self._dims)
+        if isinstance(multiplier, str):
             multiplier = pq(multiplier)
-        
-        the_dict = PhysQuant._multiply_unit_dicts(self.unit_dict,
-                                                   multiplier.unit_dict)
-        pq_prod = pq(**the_dict)
-        pq_prod.melt
-        pq_prod.reduce()
-        return pq_prod
+        elif not isinstance(multiplier, PhysQuant):
+            # Let the other object, such as a PhysQuantArray, handle it
+            return NotImplemented
+        # Multiplying quantities adds their dimension vectors
+        dims = PhysQuant._add_dims(self._dims, multiplier._dims)
+        return PhysQuant._from_vector(self._scale * multiplier._scale, dims)
 
     def __pow__(self, exponent):
         """ redefines exponentiation for PhysQuant objects.  Basically raises
-        the scalar in the numerator by the supplied power then creates a unit
-        list that is repeted exponent number of times.
+        the scalar by the supplied power and multiplies the dimension vector
+        by it.  The resulting powers of the units must be whole numbers.
         """
-        if PhysQuant.debug: 
-            print("Multiply by", multiplier)
         if isinstance(exponent, (int, float)):
-            temp_dict = deepcopy(self._unit_dict)
-            ratio = temp_dict["num"][0] / temp_dict["denom"][0]
-            temp_dict["num"][0] = ratio ** exponent
-            temp_dict["denom"][0] = 1.0
-            denom_unit_list = temp_dict["denom"][1]
-            temp_dict["denom"][1] = denom_unit_list * exponent
-            num_unit_list = temp_dict["num"][1]
-            temp_dict["num"][1] = num_unit_list * exponent
-            pq_prod = pq(**temp_dict)
-            pq_prod.melt
-            pq_prod.reduce()
-            return pq_prod
+            dims = PhysQuant._scale_dims(self._dims, exponent)
+            return PhysQuant._from_vector(self._scale ** exponent, dims)
         else:
             raise ValueError("Exponent must be a float or int")
 
@@ -504,28 +1311,143 @@ class PhysQuant(object):
         cancelled.  If one of the objects is not a PhysQuant object a
         conversion is attempted as a first step in the process
         """
-        if PhysQuant.debug: 
-            print("Multiply by", multiplier)
         if isinstance(multiplier, (int, float)):
+            return PhysQuant._from_vector(self._scale * multiplier, self._dims)
+        if isinstance(multiplier, str):
             multiplier = pq(multiplier)
-        the_dict = PhysQuant._multiply_unit_dicts(self.unit_dict,
-                                                   multiplier.unit_dict)
-        pq_prod = pq(**the_dict)
-        pq_prod.melt
-        pq_prod.reduce()
-        return pq_prod
-       
+        elif not isinstance(multiplier, PhysQuant):
+            # Let the other object, such as a PhysQuantArray, handle it
+            return NotImplemented
+        dims = PhysQuant._add_dims(self._dims, multiplier._dims)
+        return PhysQuant._from_vector(self._scale * multiplier._scale, dims)
+
+    def __truediv__(self, divisor):
+        """ Divides by a number or another PhysQuant object.  The dimension
+        vector of the divisor is subtracted, so no inverted copy of the
+        divisor is made as with self * divisor.inverted().
+        """
+        if isinstance(divisor, (int, float)):
+            return PhysQuant._from_vector(self._scale / divisor, self._dims)
+        if isinstance(divisor, str):
+            divisor = pq(divisor)
+        elif not isinstance(divisor, PhysQuant):
+            return NotImplemented
+        dims = PhysQuant._sub_dims(self._dims, divisor._dims)
+        return PhysQuant._from_vector(self._scale / divisor._scale, dims)
+
+    def __rtruediv__(self, dividend):
+        """ Divides a number or a unit string by this object"""
+        if isinstance(dividend, (int, float)):
+            return PhysQuant._from_vector(dividend / self._scale,
+                                          PhysQuant._scale_dims(self._dims, -1))
+        if isinstance(dividend, str):
+            return pq(dividend) / self
+        return NotImplemented
+
+    def __floordiv__(self, divisor):
+        """ Returns how many whole times divisor, which must have the same
+        units, goes into this object, as a float
+        """
+        scale = self._other_scale(divisor, "divide")
+        if scale is None:
+            return NotImplemented
+        return self._scale // scale
+
+    def __mod__(self, divisor):
+        """ Returns what is left of this object after taking out divisor,
+        which must have the same units, a whole number of times
+        """
+        scale = self._other_scale(divisor, "divide")
+        if scale is None:
+            return NotImplemented
+        return PhysQuant._from_vector(self._scale % scale, self._dims)
+
+    def __divmod__(self, divisor):
+        return self // divisor, self % divisor
+
+    def __neg__(self):
+        return PhysQuant._from_vector(-self._scale, self._dims)
+
+    def __pos__(self):
+        return PhysQuant._from_vector(self._scale, self._dims)
+
+    def __abs__(self):
+        return PhysQuant._from_vector(abs(self._scale), self._dims)
+
+    # The in place operators make a new object, like the ones above, so that
+    # a += b never changes a constant or any other object that a refers to
+    __iadd__ = __add__
+    __isub__ = __sub__
+    __imul__ = __mul__
+    __itruediv__ = __truediv__
+    __ifloordiv__ = __floordiv__
+    __imod__ = __mod__
+    __ipow__ = __pow__
+
+    def __eq__(self, other):
+        """ Quantities are equal if they have the same units and the same
+        SI value.  Quantities with different units are never equal.
+        """
+        if isinstance(other, PhysQuant):
+            # Subclasses like segment have no units and compare as objects
+            dims = getattr(other, "_dims", None)
+            if dims is None:
+                return NotImplemented
+            return dims is self._dims and other._scale == self._scale
+        if isinstance(other, (int, float)):
+            return not self._dims and self._scale == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def __hash__(self):
+        # Only frozen objects, which cannot change, are hashable.  Consistent
+        # with __eq__, so unitless quantities hash as the number they equal
+        if not self._frozen:
+            raise TypeError("Only frozen PhysQuant objects can be hashed, "
+                            "see freeze")
+        if not self._dims:
+            return hash(self._scale)
+        return hash((self._scale, self._dims))
+
+    def __lt__(self, other):
+        """ Orders quantities with the same units by value.  Raises a
+        UnitError if the units differ.
+        """
+        scale = self._other_scale(other, "compare")
+        if scale is None:
+            return NotImplemented
+        return self._scale < scale
+
+    def __le__(self, other):
+        scale = self._other_scale(other, "compare")
+        if scale is None:
+            return NotImplemented
+        return self._scale <= scale
+
+    def __gt__(self, other):
+        scale = self._other_scale(other, "compare")
+        if scale is None:
+            return NotImplemented
+        return self._scale > scale
+
+    def __ge__(self, other):
+        scale = self._other_scale(other, "compare")
+        if scale is None:
+            return NotImplemented
+        return self._scale >= scale
+
     def __repr__(self):
         """This produces a string representation of the unit and scalar stored
         in this object. It works the same as self.prefix property above except
         it produces a string output with prefixed units.  It is primarily used
         for producing nice string outputs using iPython.
         """
-        if PhysQuant.debug: print("Enter __repr__")    
-        stored_scalar, unit = self.prefixed
-        if PhysQuant.debug: print("__str__ unit Output", stored_scalar, unit)
-
-        return "{0:.3f} {1}".format(stored_scalar, unit)  
+        return self._rendering()[3]
 
 
     def __str__(self):
@@ -535,10 +1457,18 @@ class PhysQuant(object):
         print outputs.  Currently produces the same output as __repr__() but
         could be defined differently in the future if desired
         """
-        if PhysQuant.debug: print("Enter __str__")    
-        stored_scalar, unit = self.prefixed
-        if PhysQuant.debug: print("__str__ unit Output", stored_scalar, unit)
-        return "{0:.3f} {1}".format(stored_scalar, unit)  
+        return self._rendering()[3]
+
+    def __format__(self, format_spec):
+        """ Lets f-strings and format() print the prefixed value with their
+        own format spec, as in f"{cap:.1f}", followed by the prefixed unit.
+        An empty format spec gives the same output as str().
+        """
+        if not format_spec:
+            return self._rendering()[3]
+        stored_scalar, unit = self._rendering()[2]
+        return "{0} {1}".format(format(stored_scalar, format_spec),
+                                unit)
 
     def _assign_prefix(self, number):
         """ This function determines the proper prefix to use for a number.  
@@ -548,25 +1478,17 @@ class PhysQuant(object):
         Input: floating point number
         Output: floating point number scaled, with the appropriate unit prefix
         """
-        if PhysQuant.debug: print("Enter _assign_prefix")    
         if abs(number) < 1e-18:
             amt = 0
             prefix_to_use = ""
         else:
              # Returns the number's integer power of 10
             log_numb = int(log(abs(number)))
-            my_prefix = {-3: "m", -6: "μ",
-                         -9: "n", -12: "p",
-                         -15: "f", 3: "K", 0: ""}
-            # This loop finds the prefix that displays the value as a number
-            # Greater than 1 and less than 1000
-            for power in my_prefix.keys():
-                diff = log_numb - power
-                if 0 <= diff < 3:
-                    prefix_to_use = my_prefix[power]
-                    amt = number / (10**power)
-                    break
-        if PhysQuant.debug: print(amt, prefix_to_use)
+            # The prefix that displays the value as a number Greater than 1
+            # and less than 1000 is looked up in a precomputed table.  Values
+            # past the largest prefix are returned without one
+            power, prefix_to_use = PhysQuant._assign_table.get(log_numb, (0, ""))
+            amt = number / (10**power)
         return amt, prefix_to_use
     
     def change_unit(self, new_unit_str, with_prefix=False):
@@ -579,48 +1501,33 @@ class PhysQuant(object):
         Output: String printout of the value in the desired unit with the 
         proper prefix on the top unit.  Example: parameter is 25 mF/m2. Returns
         in F/cm2 as 25 μF/cm2 or in F/μm2 as 25 fF/μm2"""
-        if PhysQuant.debug: print("Enter change_unit")    
-        change_unit_dict = {}
-        temp_unit_dict = {}
-        # Make a copy of the new_unit_str
-        process_str = new_unit_str[:]
-        # Run through _interpret method to get out the dict for the new unit.
-        change_unit_dict = self._interpret(process_str)
-        if PhysQuant.debug: print("New_Dict", change_unit_dict)
-        # Check to see if the we have a compatible unit conversion.  If so
-        # then run the conversion to get the scalar rescaled into the new unit
-        # Then run assign_prefix to get the returned prefix correct.        
-        if self._unit_dict["num"][1] == change_unit_dict["num"][1] and self._unit_dict["denom"][1] == change_unit_dict["denom"][1]:
-               rescaled = self._unit_dict["num"][0] / change_unit_dict["num"][0]
-               temp_unit_dict["num"] = (rescaled, process_str, 1)
-               if with_prefix:
-                   scaled, prefix_to_add = self._assign_prefix(temp_unit_dict["num"][0])
-                   # Produces a formatted string output
-                   return scaled, prefix_to_add + process_str
-               else:
-                   return temp_unit_dict["num"][0], process_str
+        # The plan for this unit and new_unit_str is only made on the first
+        # call and then comes from the plan cache
+        plan = PhysQuant.conversion_plan(self, new_unit_str, with_prefix)
+        if plan.compatible:
+            return plan.apply(self)
         else:
             print("Conversion not Compatible")
             return None
 
     def freeze(self):
-        """ This method converts the dictionary entries into immutable tuples
-        in order to keep important constants from being accidentally
-        redefined.
-        """
-
-        temp_frozen_unit_dict = {}
-        temp_frozen_unit_dict = self.unit_dict
-        #print("pq_in", pq_in.unit_dict)
-        frozen_num_units = tuple(temp_frozen_unit_dict["num"][1])
-        frozen_denom_units = tuple(temp_frozen_unit_dict["denom"][1])
-        temp_num_tuple = (temp_frozen_unit_dict["num"][0], frozen_num_units,
-                          temp_frozen_unit_dict["num"][2])
-        temp_denom_tuple = (temp_frozen_unit_dict["denom"][0], frozen_denom_units,
-                          temp_frozen_unit_dict["denom"][2])
-        temp_frozen_unit_dict["num"] = temp_num_tuple
-        temp_frozen_unit_dict["denom"] = temp_denom_tuple
-        self._unit_dict = temp_frozen_unit_dict
+        """ This method marks the object as frozen so that it can no longer
+        be changed, in order to keep important constants from being
+        accidentally redefined.  The unit_dict entries are given out as
+        immutable tuples and reduce_all and setting _unit_dict raise a
+        ValueError.  Only frozen objects can be hashed, so they can be
+        dictionary keys.  Freezing cannot be undone, melt gives a changeable
+        copy.
+        The module constants, such as R, F and N, are frozen.  Returns the
+        object.
+        """
+        self._frozen = True
+        return self
+
+    def _check_not_frozen(self):
+        if self._frozen:
+            raise ValueError("{0} is frozen and cannot be changed".format(
+                             self))
 
     def inverted(self):
         """ Returns an inverted version of the unit_dict in this instance for
@@ -628,102 +1535,41 @@ class PhysQuant(object):
         Does not change the unit_dict in this instance.  For ohms and siemens,
         converts the unit to its reciprocal unit
         """
-        if PhysQuant.debug: print("Enter invert")    
-        inverted = False
-        # Creates a deepcopy to make sure we don't mess with self.unit_dict
-        temp_dict = deepcopy(self.unit_dict)
-        scale_unit_list = temp_dict["denom"][1]
-        scale_power = temp_dict["denom"][2]
-        num_to_denom = temp_dict["num"]
-        #print("scales", scale_unit, scale_power)
-        invert_power = - num_to_denom[2]
-        new_denom = [num_to_denom[0], num_to_denom[1], invert_power]
-        #print("new_tuple", new_list)
-        temp_dict["denom"]= new_denom
-        temp_dict["num"] = [1, scale_unit_list, -scale_power]
-        inv_pq = pq(**temp_dict)
-        inv_pq.reduce()
-        inv_pq._unit_dict = inv_pq.normalize_denom(inv_pq._unit_dict)
-        
-        return inv_pq
+        # Inverting negates the dimension vector, so Ω becomes S and back
+        inv_dims = PhysQuant._scale_dims(self._dims, -1)
+        return PhysQuant._from_vector(1.0 / self._scale, inv_dims)
 
     def melt(self):
-        """ This method converts the dictionary entries into mutable lists in
-        case they are unmutable tuples
-        """
-        temp_melt_unit_dict = {}
-        temp_melt_unit_dict = self.unit_dict
-        #print("pq_in", pq_in.unit_dict)
-        melt_num_units = list(temp_melt_unit_dict["num"][1])
-        melt_denom_units = list(temp_melt_unit_dict["denom"][1])
-        temp_num_list = [temp_melt_unit_dict["num"][0], melt_num_units,
-                          temp_melt_unit_dict["num"][2]]
-        temp_denom_list = [temp_melt_unit_dict["denom"][0], melt_denom_units,
-                          temp_melt_unit_dict["denom"][2]]
-        temp_melt_unit_dict["num"] = temp_num_list
-        temp_melt_unit_dict["denom"] = temp_denom_list
-        self._unit_dict = temp_melt_unit_dict
+        """ This method returns a copy of the object that is not frozen, so
+        that it can be changed and its unit_dict entries are given out as
+        mutable lists again.  A frozen object itself stays frozen.
+        """
+        return PhysQuant._from_vector(self._scale, self._dims)
 
     def reduce(self):
-        """ reduct cancels units in the numerator and denominator"""
-        temp_denom_unit_list = list(self._unit_dict["denom"][1])
-        # Cancel any units present in both the num and denom unit lists
-        self._unit_dict["denom"][1] = deepcopy(temp_denom_unit_list)
-        temp_num_unit_list = list(self._unit_dict["num"][1])
-        index_denom_unit_list = deepcopy(self._unit_dict["denom"][1])
-        for indx, unit in enumerate(index_denom_unit_list):
-            cnt = temp_num_unit_list.count(unit)
-            if cnt >= 1:
-                temp_denom_unit_list.remove(unit)
-                temp_num_unit_list.remove(unit)
-        # Next check if ohms and S in same unit list in which case they cancel
-        if "Ω" in temp_denom_unit_list and "S" in temp_denom_unit_list:
-                temp_denom_unit_list.remove("Ω")
-                temp_denom_unit_list.remove("S")
-        if "Ω" in temp_num_unit_list and "S" in temp_num_unit_list:
-                temp_num_unit_list.remove("Ω")
-                temp_num_unit_list.remove("S")
-        # if either ohm or S in denom unit list put reciprocal
-        # unit in the temp num unit list
-        iter_denom = deepcopy(temp_denom_unit_list)
-        for unit in iter_denom:
-            if unit in ("Ω", "S"):
-                temp_denom_unit_list.remove(unit)
-                if unit == "Ω":
-                    temp_num_unit_list.append("S")
-                else:
-                    temp_num_unit_list.append("Ω")
-        # revactor the values for the unit_dictionary keys
-        numerator = [self._unit_dict["num"][0], temp_num_unit_list,
-                     self._unit_dict["num"][2]]
-        denominator = [self._unit_dict["denom"][0], temp_denom_unit_list,
-                       self._unit_dict["denom"][2]]
-        return_dict = {}
-        return_dict["num"] = numerator
-        return_dict["denom"] = denominator
-        self._unit_dict = return_dict
+        """ reduce cancels units in the numerator and denominator.  The
+        dimension vector keeps a single power for each unit, with Ω and S
+        sharing one, so units are always cancelled and nothing is left to do.
+        Kept so older code calling reduce() keeps working.
+        """
+        pass
 
     def reduce_all(self):
         """Extends reduce method to change dictionary to use fully reduced units
         as defined in the reduced_units dictionary"""
-        temp_dict = deepcopy(self._unit_dict)
-        temp_pq= pq(**temp_dict)
-        # create unit list copies to iterate over to ensure good behavior when
-        # deleting elements from the list
-        iter_list = deepcopy(temp_dict["num"][1])
-        denom_iter_list = deepcopy(temp_dict["denom"][1])
+        self._check_not_frozen()
+        temp_pq = PhysQuant._from_vector(self._scale, self._dims)
+        num_units, denom_units = PhysQuant._dims_to_units(self._dims)
         # Use multiplication of the conversion factors to change units
-        # After reduce() is run the unit will be changed
-        for indx, unit in enumerate(iter_list):
+        for unit in num_units:
             if unit in Converters.reduced_units.keys():
                 temp_pq = Converters.reduced_units[unit] * temp_pq
         # for the denom the conversion factor needed to be inverted
-        for unit in denom_iter_list:
+        for unit in denom_units:
             if unit in Converters.reduced_units.keys():
-                pq_unit_inv = Converters.reduced_units[unit].inverted()
-                temp_pq = pq_unit_inv * temp_pq
-        temp_pq.reduce()
-        self._unit_dict = temp_pq._unit_dict
+                temp_pq = temp_pq / Converters.reduced_units[unit]
+        self._scale = temp_pq._scale
+        self._dims = temp_pq._dims
 
     @staticmethod
     def add_prefix(in_scalar, unit_str):
@@ -766,7 +1612,6 @@ class PhysQuant(object):
     def convert_to_kelvins(in_scalar, temp_unit):
         # converts input temp unit string to a sting that evaluates in Kelvins
         toKelvins = in_scalar        
-        if PhysQuant.debug: print("Enter convert_to_kelvins")    
         if temp_unit in ("oC", "C", "Celsius"):
             toKelvins = in_scalar + 273.15
         elif temp_unit in ("oF", "Fahrenheit"):
@@ -778,7 +1623,6 @@ class PhysQuant(object):
         """ Input unit string parsing function.  First parses on "/" to split
         into unit and denom parts.  If compound unit will split at "*"
         Returns the unit and denom tuples in an dictionary"""
-        if PhysQuant.debug: print("Enter id_scaled_unit")    
         scaled_by_list = []
         str_unit_list = []
         if "/" in str_unit:
@@ -789,11 +1633,6 @@ class PhysQuant(object):
             str_unit_list.append(1)
             scaled_by_list = scale_base_list[1].split(" ")
             scaled_by_list.append(-1)
-            if PhysQuant.debug: 
-                print("num", scale_base_list, str_unit_list, scaled_by_list)
-            if PhysQuant.debug: 
-                print("denom", scaled_by_list, len(scaled_by_list),
-                                      scaled_by_list[0][0].isnumeric())
             # If numerator or denominator only had one term, check to see if
             # it was a number or a unit and place accordingly
             if len(scaled_by_list) == 2 and scaled_by_list[0][0].isnumeric():
@@ -830,18 +1669,12 @@ class PhysQuant(object):
                 # Got everything so just make a list from the unit string
                 str_unit_list[1] = PhysQuant.parse_unit_string(str_unit_list[1])            
             
-            for index, value in enumerate(str_unit_list[1]):
+            for value in list(str_unit_list[1]):
                 if value.endswith("-1"):
                     # If unit in numerator has -1 power move to denominator after
                     # removing the -1 power.  Scalar stays in denominator
-                    scaled_by_list.append(value[:-2])
-                    str_unit_list.remove(index)
-            for index, value in enumerate(scaled_by_list[1]):
-                if value.endswith("-1"):
-                    # If unit in numerator has -1 power move to denominator after
-                    # removing the -1 power.  Scalar stays in denominator
-                    str_unit_list.append(value[:-2])
-                    scaled_by_list.remove(index)
+                    str_unit_list[1].remove(value)
+                    scaled_by_list[1].append(value[:-2])
         return {"num": str_unit_list, "denom": scaled_by_list}
 
     @staticmethod
@@ -853,7 +1686,6 @@ class PhysQuant(object):
         Output: The same dictionary with the scalar for "denom" divided into
             the "denom" and "num" scalar terms.
         """
-        if PhysQuant.debug: print("Enter normalize_denom", units_dict)    
         scaled = units_dict["num"][0] / units_dict["denom"][0]
         units_dict["num"] = [scaled, units_dict["num"][1],
                               units_dict["num"][2]]
@@ -893,7 +1725,6 @@ class PhysQuant(object):
         Output: float and unprefixed unit
         """
         unit_value = float(scalar)
-        if PhysQuant.debug: print("Enter replace_prefix")    
         # if unit is already SI or one char or less, then nothing to do        
         if str_unit in PhysQuant.better_unit.values() or len(str_unit) < 2:
             return unit_value, str_unit
@@ -904,15 +1735,11 @@ class PhysQuant(object):
         value multiplied against the scalar"""
         if str_unit and len(str_unit) > 1:
             for key, power in PhysQuant.prefix.items():
-                if PhysQuant.debug: print("Key Test", key, power,
-                                          str_unit.startswith(key))
                 # if the 1st char matches a prefix in the dictionary...
                 if str_unit.startswith(key):
                     str_unit = str_unit.replace(key, "")
-                    if PhysQuant.debug: print("replaced", str_unit)
                     unit_value *=  power
                     break
-            if PhysQuant.debug: print(unit_value, str_unit)
         # String with math expression for the scalar is evaluated to make
         # a float scalar.  The results are packaged into a tuple for
         # placement back in the dictionary
@@ -935,7 +1762,6 @@ class PhysQuant(object):
         """ This method forces lists to conform to the type needed to properly
         instantiate a new PhysQuant for "num" or "denom"""
         temp_list = []
-        if PhysQuant.debug: print("In conform_list", in_list)
         if len(in_list) == 3:
             temp_list = list(in_list)
             temp_list[1] = list(in_list[1])
@@ -943,57 +1769,382 @@ class PhysQuant(object):
             raise ValueError("Entered invalid unit_dict list {0}".format( in_list))
         return temp_list
 
-class rnd_cell(PhysQuant):
+    @staticmethod
+    def _add_dims(dims1, dims2):
+        """ Adds two dimension vectors, as is done when multiplying two
+        quantities, and drops trailing zero powers from the result.  The
+        result is remembered for each pair of signatures.
+        """
+        if not dims2:
+            return dims1
+        if not dims1:
+            return dims2
+        key = (id(dims1), id(dims2))
+        found = _signatures.products.get(key)
+        if found is not None:
+            return found[2]
+        if len(dims1) < len(dims2):
+            long_dims, short_dims = dims2, dims1
+        else:
+            long_dims, short_dims = dims1, dims2
+        dims = list(long_dims)
+        for indx, power in enumerate(short_dims):
+            dims[indx] += power
+        while dims and not dims[-1]:
+            dims.pop()
+        result = _intern_dims(tuple(dims))
+        _signatures.remember(_signatures.products, key, (dims1, dims2, result))
+        return result
+
+    @staticmethod
+    def _sub_dims(dims1, dims2):
+        """ Subtracts dims2 from dims1, as is done when dividing two
+        quantities.  The result is remembered for each pair of signatures.
+        """
+        if not dims2:
+            return dims1
+        key = (id(dims1), id(dims2))
+        found = _signatures.quotients.get(key)
+        if found is not None:
+            return found[2]
+        result = PhysQuant._add_dims(dims1, PhysQuant._scale_dims(dims2, -1))
+        _signatures.remember(_signatures.quotients, key, (dims1, dims2, result))
+        return result
+
+    @staticmethod
+    def _scale_dims(dims, factor):
+        """ Multiplies a dimension vector by factor, as is done when raising
+        a quantity to a power.  Raises a UnitError if a unit would be left
+        with a power that is not a whole number.  The result is remembered
+        for each signature and factor.
+        """
+        key = (id(dims), factor)
+        found = _signatures.powers.get(key)
+        if found is not None:
+            return found[1]
+        scaled = []
+        for power in dims:
+            new_power = power * factor
+            if new_power != int(new_power):
+                raise UnitError("Units cannot be raised to {0}".format(factor))
+            scaled.append(int(new_power))
+        while scaled and not scaled[-1]:
+            scaled.pop()
+        result = _intern_dims(tuple(scaled))
+        _signatures.remember(_signatures.powers, key, (dims, result))
+        return result
+
+    @staticmethod
+    def _split_scalars(unit_str):
+        """ Helper function for the parse cache that separates the numbers in
+        a unit string from its units, following the same rules as
+        id_scaled_unit.  Returns the unit part with each number replaced by 1
+        along with the numerator and denominator values, so that
+        "100 mS/50 cm2" gives ("1 mS/1 cm2", 100.0, 50.0).  Returns None for
+        strings that do not have the simple "scalar unit/scalar unit" layout
+        so they can be parsed without the cache.
+        """
+        split = PhysQuant._split_scalar_text(unit_str)
+        if split is None:
+            return None
+        unit_key, num_text, denom_text = split
+        try:
+            num_value = float(num_text) if num_text else 1.0
+            denom_value = float(denom_text) if denom_text else 1.0
+        except ValueError:
+            return None
+        return unit_key, num_value, denom_value
+
+    @staticmethod
+    def _split_scalar_text(unit_str):
+        """ Does the splitting for _split_scalars but leaves the numbers as
+        strings, with None for a part that has no number, so that many of
+        them can be converted at once.
+        """
+        if "/" in unit_str:
+            parts = [part.strip() for part in unit_str.split("/")]
+            if len(parts) != 2:
+                return None
+        else:
+            parts = [unit_str]
+        texts = [None, None]
+        key_parts = []
+        for indx, part in enumerate(parts):
+            tokens = part.split(" ")
+            if not 1 <= len(tokens) <= 2 or not all(tokens):
+                return None
+            if len(tokens) == 2 or tokens[0][0].isnumeric():
+                texts[indx] = tokens[0]
+                tokens[0] = "1"
+            key_parts.append(" ".join(tokens))
+        return "/".join(key_parts), texts[0], texts[1]
+
+    @staticmethod
+    def _has_temp_unit(unit_str):
+        """ Helper function that checks if any unit in a unit string is a
+        temperature unit that would need an offset to convert to K, with or
+        without a prefix.
+        """
+        for unit in _UnitParser._name.findall(unit_str):
+            if unit in PhysQuant.temp_units or unit[1:] in PhysQuant.temp_units:
+                return True
+        return False
+
+PhysQuant.build_prefix_table()
+
+
+def _folding(plain):
+    """ Returns the version of the PhysQuant operator plain that looks in
+    the constant memo when both operands are frozen, or for ** and inverted
+    when the object is.  The memo is keyed on the operator, the scales and
+    the ids of the interned signatures, which each entry holds so the ids
+    stay valid, and gives back one frozen result for all calls.
+    """
+    memo = PhysQuant._constant_memo
+    data = memo._data
+    power = plain.__name__ == "__pow__"
+
+    def fold(key, *operands):
+        memo.misses += 1
+        result = plain(*operands)
+        result._frozen = True
+        memo.put(key, (result,) + tuple(operand._dims for operand in operands
+                                        if isinstance(operand, PhysQuant)))
+        return result
+
+    # The hit paths below are the one of _LRUCache.get, inlined
+    if plain.__name__ == "inverted":
+        @wraps(plain)
+        def folding(self):
+            if not self._frozen:
+                return plain(self)
+            key = (plain, self._scale, id(self._dims))
+            entry = data.get(key)
+            if entry is None:
+                return fold(key, self)
+            data.move_to_end(key)
+            memo.hits += 1
+            return entry[0]
+        return folding
+
+    @wraps(plain)
+    def folding(self, other):
+        if not self._frozen:
+            return plain(self, other)
+        if isinstance(other, PhysQuant):
+            if not other._frozen:
+                return plain(self, other)
+            key = (plain, self._scale, id(self._dims), other._scale,
+                   id(other._dims))
+        elif power and isinstance(other, (int, float)):
+            key = (plain, self._scale, id(self._dims), other)
+        else:
+            return plain(self, other)
+        entry = data.get(key)
+        if entry is None:
+            return fold(key, self, other)
+        data.move_to_end(key)
+        memo.hits += 1
+        return entry[0]
+    return folding
+
+for _name in ("__add__", "__sub__", "__mul__", "__truediv__", "__pow__",
+              "__iadd__", "__isub__", "__imul__", "__itruediv__", "__ipow__",
+              "inverted"):
+    PhysQuant._plain_ops[_name] = PhysQuant.__dict__[_name]
+    PhysQuant._folding_ops[_name] = _folding(PhysQuant.__dict__[_name])
+del _name
+
+
+class ConversionPlan(object):
+    """ A conversion of quantities with one unit into another unit given as
+    a string, as done by change_unit.  Plans are normally made through
+    PhysQuant.conversion_plan, which caches them, so the new unit string is
+    only interpreted once.  A plan holds whether the units are compatible,
+    the SI scale of the new unit that values are divided by, and whether a
+    prefix is added to the output unit.  convert() works the same on a float
+    or a numpy array of SI values, so converting many values is one lookup
+    and one vectorized division.
+    """
+    __slots__ = ("dims", "unit_str", "with_prefix", "compatible", "scale")
+
+    def __init__(self, dims, new_unit_str, with_prefix=False):
+        new_unit = PhysQuant(new_unit_str)
+        self.dims = dims
+        self.unit_str = new_unit_str
+        self.with_prefix = with_prefix
+        self.compatible = new_unit._dims is dims
+        self.scale = new_unit._scale
+
+    def __repr__(self):
+        return "ConversionPlan({0} -> {1})".format(
+            PhysQuant._from_vector(1.0, self.dims).SI[1], self.unit_str)
+
+    def convert(self, values):
+        """ Converts SI values, a float or a numpy array, into the new unit.
+        No prefix is applied.
+        """
+        if not self.compatible:
+            raise UnitError("Conversion to {0} not Compatible".format(
+                            self.unit_str))
+        return values / self.scale
+
+    def apply(self, quant):
+        """ Returns the value of quant in the new unit and the unit string,
+        with a prefix added if the plan was made with_prefix, the same way as
+        change_unit.
+        """
+        if not self.compatible or quant._dims is not self.dims:
+            raise UnitError("Conversion to {0} not Compatible".format(
+                            self.unit_str))
+        rescaled = quant._scale / self.scale
+        if self.with_prefix:
+            scaled, prefix_to_add = quant._assign_prefix(rescaled)
+            # Produces a formatted string output
+            return scaled, prefix_to_add + self.unit_str
+        return rescaled, self.unit_str
+
+
+class _GeometryCache(object):
+    """ Mixin for the cell shapes that keep their derived geometry, such as
+    the surface area and volume, once it has been computed.  Values are
+    kept as a scale and dimension vector and every access returns a new
+    PhysQuant, so changing a returned value does not change the cache.
+    Each class counts the hits and misses of all its instances, which are
+    reported by geometry_cache_info.
+    """
+    __slots__ = ()
+
+    def _cached(self, name, compute):
+        """ Returns the geometry called name, calling compute to make it if
+        it is not kept yet
+        """
+        stored = self._geometry.get(name)
+        if stored is None:
+            self._geometry_info["misses"] += 1
+            value = compute()
+            self._geometry[name] = (value._scale, value._dims)
+            return value
+        self._geometry_info["hits"] += 1
+        return PhysQuant._from_vector(stored[0], stored[1])
+
+    def _invalidate(self):
+        """ Forgets the kept geometry after the shape has changed"""
+        self._geometry = {}
+
+    @classmethod
+    def geometry_cache_info(cls):
+        """ Returns the hits and misses of the geometry kept by all objects
+        of the class as a dictionary
+        """
+        return dict(cls._geometry_info)
+
+    @classmethod
+    def clear_geometry_cache_info(cls):
+        """ Sets the hit and miss counts back to zero"""
+        cls._geometry_info["hits"] = 0
+        cls._geometry_info["misses"] = 0
+
+
+class rnd_cell(_GeometryCache, PhysQuant):
     """ Creates a round cell object when given a diameter.  Provides easy
     access to volume, surface area and membrane capacitance for a standard
-    cell
+    cell.  These are computed from the stored diameter the first time they
+    are used and kept until the diameter changes.
     """
+    # Hits and misses of the geometry kept by all rnd_cell objects
+    _geometry_info = {"hits": 0, "misses": 0}
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self._invalidate()
+        self._geometry_key = (self._scale, self._dims)
 
     def __call__(self):
         """ call takes the diam and converts it to a pq if it isn't already. 
         diam can be an valid term that can be interpreted as a pq, like
         srings, floats,integers, and other PhysQuant items.  Returns a pq
         object for the Surface Area and the Volume"""
-        SA = pi * pq(self.__repr__()) ** 2
-        Vol = (pi / 6.0)* (pq(self.__repr__()))**3
-        return SA, Vol
-    
+        return self.sa, self.vol
+
+    def _cached(self, name, compute):
+        # The diameter is the value of the object itself, so the geometry
+        # is forgotten if it no longer matches the value it was made from
+        key = (self._scale, self._dims)
+        if key != self._geometry_key:
+            self._invalidate()
+            self._geometry_key = key
+        return super()._cached(name, compute)
+
+    def _diameter(self):
+        return PhysQuant._from_vector(self._scale, self._dims)
+
     @property
     def vol(self):
-        return (pi / 6.0)* (pq(self.__repr__()))**3
-    
+        return self._cached("vol", lambda: (pi / 6.0) * self._diameter() ** 3)
+
     @property
     def sa(self):
-        return pi * pq(self.__repr__()) ** 2
+        return self._cached("sa", lambda: pi * self._diameter() ** 2)
 
     @property
     def cm(self):
-        return self.sa * pq("1 uF/cm2")
+        return self._cached("cm", lambda: self.sa * pq("1 uF/cm2"))
 
 def pq(*args, **kwargs):
     return PhysQuant(*args, **kwargs)
 
 
 class Converters(PhysQuant):
-    reduced_units = {"V": pq("1 J/V.coul"), "M": pq("1 mol/1000 M.cm.cm.cm"),
-                  "Ω": pq("1 J.sec/Ω.coul.coul"), "l": pq("1000 cm.cm.cm /l"),
-                  "S": pq("1 coul.coul/J.sec"), "A": pq("1 coul/A.sec"),
-                  "F": pq("1 coul.coul/F.J")}
-                  
-    conversion_factors = {"N": pq("6.0224e23 obj/ mol"), "R": pq("8.314 J.mol/K"),
-                          "F": pq("96500 coul/z.mol")}              
+    # The factors are built from their precomputed scale and unit powers so
+    # importing does not parse them.  The unit string each one stands for is
+    # given in the comment above it
+    reduced_units = {
+        # "1 J/V.coul"
+        "V": PhysQuant._from_powers(1.0, {"J": 1, "V": -1, "coul": -1}),
+        # "1 mol/1000 M.cm.cm.cm"
+        "M": PhysQuant._from_powers(1000.0, {"mol": 1, "M": -1, "m": -3}),
+        # "1 J.sec/Ω.coul.coul"
+        "Ω": PhysQuant._from_powers(1.0, {"J": 1, "sec": 1, "Ω": -1,
+                                          "coul": -2}),
+        # "1000 cm.cm.cm /l"
+        "l": PhysQuant._from_powers(0.001, {"m": 3, "l": -1}),
+        # "1 coul.coul/J.sec"
+        "S": PhysQuant._from_powers(1.0, {"coul": 2, "J": -1, "sec": -1}),
+        # "1 coul/A.sec"
+        "A": PhysQuant._from_powers(1.0, {"coul": 1, "A": -1, "sec": -1}),
+        # "1 coul.coul/F.J"
+        "F": PhysQuant._from_powers(1.0, {"coul": 2, "F": -1, "J": -1})}
+
+    conversion_factors = {
+        # "6.0224e23 obj/ mol"
+        "N": PhysQuant._from_powers(6.0224e23, {"obj": 1, "mol": -1}),
+        # "8.314 J.mol/K"
+        "R": PhysQuant._from_powers(8.314, {"J": 1, "mol": 1, "K": -1}),
+        # "96500 coul/z.mol"
+        "F": PhysQuant._from_powers(96500.0, {"coul": 1, "z": -1, "mol": -1})}
 
 
         
-class segment(PhysQuant):
+class segment(_GeometryCache, PhysQuant):
     """ Creates a cylindrical cell object when given a diameter and a length
     as pq objects. Provides easy  access to volume, surface area, membrane 
     capacitance and internal resistance.  cm can be flagged for mylenation.
     Note area of cylinder ends are not added to the surface area.
+    These are computed the first time they are used and kept until d, l,
+    myelin or ra_cm are set again.
     """
+    # Hits and misses of the geometry kept by all segment objects
+    _geometry_info = {"hits": 0, "misses": 0}
+    # A segment has no scale or units of its own, so it is compared and
+    # hashed as an object rather than as a quantity
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
     def __init__(self, myelin=False, **kwargs):
+        self._invalidate()
+        self._rendered = None
         self._l = kwargs["l"]
         self._d = kwargs["d"]
         self._myelin = myelin
@@ -1002,20 +2153,36 @@ class segment(PhysQuant):
     def __call__(self):
         """ call uses the self.d and self.l to return pq
         objects for the Surface Area and the Volume"""
-        SA = ((pi) * pq(self._d)) * self._l
-        Vol = ((pi / 4.0)* (pq(self._d))**2) * self._l
-        return SA, Vol
+        return self.sa, self.vol
+
+    def __repr__(self):
+        """ A segment is printed by its shape, as it has no value itself"""
+        return "segment(d={0}, l={1}, myelin={2})".format(
+            pq(self._d), pq(self._l), self._myelin)
+
+    __str__ = __repr__
+    __format__ = object.__format__
 
     @property
     def l(self):
         """ The cylinder length"""
         return self._l
+
+    @l.setter
+    def l(self, length):
+        self._l = length
+        self._invalidate()
     
     @property
     def d(self):
         """ The cylinder diam"""
         return self._d
 
+    @d.setter
+    def d(self, diam):
+        self._d = diam
+        self._invalidate()
+
     @property
     def myelin(self):
         """ Cm changes based on myeling."""
@@ -1027,43 +2194,78 @@ class segment(PhysQuant):
             self._myelin = True
         else:
             self._myelin = False    
+        self._invalidate()
+
+    @property
+    def ra_cm(self):
+        """ The axial resistivity"""
+        return self._ra_cm
+
+    @ra_cm.setter
+    def ra_cm(self, resistivity):
+        self._ra_cm = resistivity
+        self._invalidate()
         
     @property
     def vol(self):
-        return ((pi / 4.0)* (pq(self._d))**2) * pq(self._l)
+        return self._cached("vol", lambda: ((pi / 4.0) * pq(self._d) ** 2) *
+                                           pq(self._l))
     
     @property
     def sa(self):
-        return ((pi) * pq(self._d)) * pq(self._l)
+        return self._cached("sa", lambda: ((pi) * pq(self._d)) * pq(self._l))
 
-    @property
-    def cm(self):
+    def _cm(self):
         if self._myelin:
             cm_s = "0.0167 uF/cm2"
         else:
             cm_s = "1 uF/cm2"
         return self.sa * pq(cm_s)
 
+    @property
+    def cm(self):
+        return self._cached("cm", self._cm)
+
+    def _ra(self):
+        return self.ra_cm / self.vol * self.sa
+
     @property
     def ra(self):
-        inv_vol = self.vol.inverted()
-        return inv_vol * self.ra_cm * self.sa
+        return self._cached("ra", self._ra)
 
 def pq(*args, **kwargs):
     return PhysQuant(*args, **kwargs)
 
 # This code defines pq object constants that can be used after PhysQuant
-# is imported
-
-N= pq("6.0224e23 / mol")
-R = pq("8.314 J.mol/K")
-VtoBase = pq("1.0 J/V.coul")
-StoBase = pq("1.0 coul.coul/J.sec.S")
+# is imported.  They are built from their precomputed scale and unit powers
+# and the unit string each one stands for is given in the comment above it
+
+# "6.0224e23 / mol"
+N = PhysQuant._from_powers(6.0224e23, {"mol": -1})
+# "8.314 J.mol/K"
+R = PhysQuant._from_powers(8.314, {"J": 1, "mol": 1, "K": -1})
+# "1.0 J/V.coul"
+VtoBase = PhysQuant._from_powers(1.0, {"J": 1, "V": -1, "coul": -1})
+# "1.0 coul.coul/J.sec.S"
+StoBase = PhysQuant._from_powers(1.0, {"coul": 2, "Ω": 1, "J": -1,
+                                       "sec": -1})
 RtoBase = StoBase.inverted()
-AtoBase = pq("1.0 coul/sec.A")
-F = pq("96500 coul/mol")
-tau_conv = pq("1.0 sec/ohm.F")
-to_sec = pq("1.0 sec/s")
+# "1.0 coul/sec.A"
+AtoBase = PhysQuant._from_powers(1.0, {"coul": 1, "sec": -1, "A": -1})
+# "96500 coul/mol"
+F = PhysQuant._from_powers(96500.0, {"coul": 1, "mol": -1})
+# "1.0 sec/ohm.F"
+tau_conv = PhysQuant._from_powers(1.0, {"sec": 1, "Ω": -1, "F": -1})
+# "1.0 sec/s"
+to_sec = PhysQuant._from_powers(1.0, {"sec": 1, "s": -1})
+
+for constant in (N, R, VtoBase, StoBase, RtoBase, AtoBase, F, tau_conv,
+                 to_sec):
+    constant.freeze()
+for constant in list(Converters.reduced_units.values()) + \
+        list(Converters.conversion_factors.values()):
+    constant.freeze()
+del constant
 
 
 if __name__ == "__main__":
@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar storage of many cylindrical compartments, the array version of the
+segment class in PQ_math_reorg, a streaming reader of SWC morphology files
+and parallel evaluation of many compartments.  Needs numpy.
+"""
+from math import pi
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from time import perf_counter
+import mmap
+import os
+import numpy as np
+from PQ_math_reorg import PhysQuant, UnitError, pq, segment
+from PQ_array import PhysQuantArray
+
+# Number of points SWCReader keeps before the current chunk by default
+SWC_WINDOW = 65536
+
+
+class MorphologyTable(object):
+    """ This Class holds the diameters, lengths, myelin flags and axial
+    resistivities of many segment compartments in numpy arrays, one entry
+    per compartment.  Surface area, volume, membrane capacitance and axial
+    resistance are computed for all compartments at once with the formulas
+    and units of segment, and are returned as PhysQuantArray objects.
+    Use:
+        table = MorphologyTable(diams, lengths, "um", myelin=flags)
+        total_cm = table.cm.sum()
+        seg = table[12]
+    diameters and lengths are numbers in unit or PhysQuantArray objects of
+    lengths.  ra_cm is a PhysQuant used for every compartment or a
+    PhysQuantArray with one value per compartment.
+    """
+    __slots__ = ("_d", "_l", "_myelin", "_ra_cm")
+
+    # Specific membrane capacitances of bare and myelinated membrane, as
+    # used by segment.cm
+    cm_bare = pq("1 uF/cm2").freeze()
+    cm_myelin = pq("0.0167 uF/cm2").freeze()
+
+    def __init__(self, diameters, lengths, unit="um", myelin=False,
+                 ra_cm=None):
+        self._d = MorphologyTable._lengths(diameters, unit)
+        self._l = MorphologyTable._lengths(lengths, unit)
+        if self._d.shape != self._l.shape or self._d._values.ndim != 1:
+            raise ValueError("diameters and lengths must be 1-d arrays of "
+                             "the same size")
+        size = self._d.size
+        self._myelin = np.broadcast_to(np.asarray(myelin, dtype=bool),
+                                       (size,)).copy()
+        if ra_cm is None:
+            ra_cm = pq("100 ohm.cm")
+        if isinstance(ra_cm, PhysQuant):
+            ra_cm = PhysQuantArray._from_values(np.full(size, ra_cm._scale),
+                                                ra_cm._dims)
+        elif ra_cm.shape != (size,):
+            raise ValueError("ra_cm needs one value per compartment")
+        self._ra_cm = ra_cm
+
+    @staticmethod
+    def _lengths(values, unit):
+        """ Returns values as a PhysQuantArray, checking it is a length"""
+        if not isinstance(values, PhysQuantArray):
+            values = PhysQuantArray(values, unit)
+        if values._dims is not pq("1 m")._dims:
+            raise UnitError("{0} is not a length".format(values.unit))
+        return values
+
+    @classmethod
+    def _from_columns(cls, d, l, myelin, ra_cm):
+        """ Private constructor from columns that are known to be valid.  The
+        columns are not copied.
+        """
+        table = object.__new__(MorphologyTable)
+        table._d = d
+        table._l = l
+        table._myelin = myelin
+        table._ra_cm = ra_cm
+        return table
+
+    @classmethod
+    def from_segments(cls, segments):
+        """ Makes a table from a sequence of segment objects"""
+        segments = list(segments)
+        d = PhysQuantArray.from_quantities([pq(seg.d) for seg in segments])
+        l = PhysQuantArray.from_quantities([pq(seg.l) for seg in segments])
+        ra_cm = PhysQuantArray.from_quantities([seg.ra_cm for seg in segments])
+        myelin = np.array([seg.myelin for seg in segments], dtype=bool)
+        return MorphologyTable._from_columns(d, l, myelin, ra_cm)
+
+    def __len__(self):
+        return self._d.size
+
+    def __getitem__(self, index):
+        """ Integer indexes return a segment made from that compartment,
+        slices and index arrays return a MorphologyTable of the selection
+        """
+        if np.ndim(index) == 0 and not isinstance(index, slice):
+            return self.segment(index)
+        return MorphologyTable._from_columns(self._d[index], self._l[index],
+                                             self._myelin[index],
+                                             self._ra_cm[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.segment(index)
+
+    def __repr__(self):
+        return "MorphologyTable({0} compartments)".format(len(self))
+
+    def segment(self, index):
+        """ Returns a segment with the diameter, length, myelin flag and
+        ra_cm of one compartment.  The segment is a copy, changing it does
+        not change the table.
+        """
+        seg = segment(myelin=bool(self._myelin[index]), d=self._d[index],
+                      l=self._l[index])
+        seg.ra_cm = self._ra_cm[index]
+        return seg
+
+    @property
+    def d(self):
+        """ The compartment diameters"""
+        return self._d
+
+    @property
+    def l(self):
+        """ The compartment lengths"""
+        return self._l
+
+    @property
+    def myelin(self):
+        """ Boolean array of the myelinated compartments"""
+        return self._myelin
+
+    @property
+    def ra_cm(self):
+        """ The axial resistivity of each compartment"""
+        return self._ra_cm
+
+    @property
+    def vol(self):
+        return ((pi / 4.0) * self._d ** 2) * self._l
+
+    @property
+    def sa(self):
+        return (pi * self._d) * self._l
+
+    @property
+    def cm(self):
+        return self._cm(self.sa)
+
+    @property
+    def ra(self):
+        return self._ra(self.vol, self.sa)
+
+    def _cm(self, sa):
+        specific = np.where(self._myelin, MorphologyTable.cm_myelin._scale,
+                            MorphologyTable.cm_bare._scale)
+        return sa * PhysQuantArray._from_values(specific,
+                                                MorphologyTable.cm_bare._dims)
+
+    def _ra(self, vol, sa):
+        return self._ra_cm / vol * sa
+
+    def electrical(self):
+        """ Returns a dictionary of the sa, vol, cm and ra arrays, computing
+        the surface area and volume once for all four
+        """
+        sa = self.sa
+        vol = self.vol
+        return {"sa": sa, "vol": vol, "cm": self._cm(sa),
+                "ra": self._ra(vol, sa)}
+
+    @classmethod
+    def concatenate(cls, tables):
+        """ Joins tables end to end into one new table"""
+        tables = list(tables)
+        if not tables:
+            return MorphologyTable([], [])
+        columns = []
+        for name in ("_d", "_l", "_ra_cm"):
+            parts = [getattr(table, name) for table in tables]
+            dims = parts[0]._dims
+            if any(part._dims != dims for part in parts):
+                raise UnitError("Tables to join have different units")
+            columns.append(PhysQuantArray._from_values(
+                np.concatenate([part._values for part in parts]), dims))
+        myelin = np.concatenate([table._myelin for table in tables])
+        return MorphologyTable._from_columns(columns[0], columns[1], myelin,
+                                             columns[2])
+
+
+class _PointStore(object):
+    """ Coordinates of the points of a morphology read so far, looked up by
+    point id to find the parents of new points.  The coordinates are kept
+    in numpy arrays indexed by point id, so each point takes 32 bytes.
+    With a window the arrays are a ring of that many points, which bounds
+    the memory for files whose parents are never further back than that.
+    Soma and root points, which dendrites far down the file start from, are
+    also kept outside the ring.  Without a window the arrays grow to the
+    largest point id.
+    """
+    def __init__(self, window=None):
+        self.window = window
+        size = window or 1024
+        self.ids = np.full(size, -1, dtype=np.int64)
+        self.coords = np.zeros((size, 3))
+        self.roots = {}
+
+    def _slots(self, ids):
+        if self.window:
+            return ids % self.window
+        return ids
+
+    def add(self, ids, coords, roots=None):
+        """ Stores the coordinates, an array of rows of x, y, z, of the
+        points with ids.  roots marks the soma and root points to keep
+        after they leave the window.
+        """
+        if self.window and roots is not None and roots.any():
+            self.roots.update(zip(ids[roots].tolist(), coords[roots]))
+        slots = self._slots(ids)
+        if len(slots) and slots.max() >= len(self.ids):
+            size = max(2 * len(self.ids), int(slots.max()) + 1)
+            self.ids = np.concatenate([self.ids, np.full(size - len(self.ids),
+                                                         -1, dtype=np.int64)])
+            self.coords = np.concatenate([self.coords,
+                                          np.zeros((size - len(self.coords),
+                                                    3))])
+        self.ids[slots] = ids
+        self.coords[slots] = coords
+
+    def get(self, ids):
+        """ Returns the coordinates of the points with ids"""
+        slots = self._slots(ids)
+        found = (slots >= 0) & (slots < len(self.ids))
+        found[found] = self.ids[slots[found]] == ids[found]
+        if found.all():
+            return self.coords[slots]
+        coords = np.zeros((len(ids), 3))
+        coords[found] = self.coords[slots[found]]
+        for indx in np.flatnonzero(~found).tolist():
+            point = int(ids[indx])
+            if point not in self.roots:
+                raise ValueError("Parent point {0} has not been read or is "
+                                 "outside the window".format(point))
+            coords[indx] = self.roots[point]
+        return coords
+
+
+class SWCReader(object):
+    """ Streams a morphology from an SWC file, or from the same columns
+    separated by commas, and turns each point with a parent into a
+    compartment.  The compartment's diameter is the point's diameter, and
+    its length is the distance from the parent point.  Lines are read one at
+    a time, through a memory map for files given by path, and are converted
+    by numpy chunk_size points at a time.  Compartments are handed out in
+    the same chunks, as MorphologyTable objects or as lists of segment
+    objects, so only one chunk is held at a time.  The point coordinates
+    are kept to look up parents, see _PointStore.  Only window points
+    before the current chunk are kept, and the soma and root points, so
+    memory stays bounded whatever the size of the file.  A parent further
+    back raises a ValueError.  window=None keeps every point, for files
+    whose parents can be anywhere, at 32 bytes per point id.
+    The reader counts the points and compartments read and the seconds spent
+    reading, and points_per_sec gives the throughput.
+    Use:
+        reader = SWCReader("cell.swc")
+        for table in reader.tables():
+            total_cm = total_cm + table.cm.sum()
+        print(reader.points_per_sec)
+    source is a path or an iterable of lines.  Coordinates and radii are
+    numbers in unit.
+    """
+    def __init__(self, source, chunk_size=10000, unit="um",
+                 window=SWC_WINDOW):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.unit = unit
+        self.window = window
+        # The _PointStore of the file being read
+        self._store = None
+        self.points = 0
+        self.compartments = 0
+        self.seconds = 0.0
+
+    @property
+    def points_per_sec(self):
+        if not self.seconds:
+            return 0.0
+        return self.points / self.seconds
+
+    def _lines(self):
+        if not isinstance(self.source, str):
+            for line in self.source:
+                yield line
+            return
+        with open(self.source, "rb") as swc_file:
+            if os.fstat(swc_file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(swc_file.fileno(), 0,
+                           access=mmap.ACCESS_READ) as mapped:
+                for line in iter(mapped.readline, b""):
+                    yield line.decode("utf-8", "replace")
+
+    def _blocks(self):
+        """ Yields arrays of up to chunk_size rows of id, type, x, y, z,
+        radius and parent id.  Comments, blank lines and a CSV header line
+        are skipped.
+        """
+        rows = []
+        for line in self._lines():
+            line = line.strip()
+            if not line or line[0] == "#":
+                continue
+            if not rows and not self.points and not (line[0].isdigit() or
+                                                     line[0] in "+-."):
+                # A header line of column names
+                continue
+            rows.append(line)
+            if len(rows) >= self.chunk_size:
+                yield self._parse(rows)
+                rows = []
+        if rows:
+            yield self._parse(rows)
+
+    def _parse(self, rows):
+        try:
+            values = np.fromstring(" ".join(rows).replace(",", " "), sep=" ")
+        except ValueError:
+            values = None
+        if values is None or values.size != 7 * len(rows):
+            for line in rows:
+                fields = line.replace(",", " ").split()
+                try:
+                    if len(fields) != 7:
+                        raise ValueError
+                    [float(field) for field in fields]
+                except ValueError:
+                    raise ValueError("Not an SWC point: {0}".format(line))
+            raise ValueError("Could not read the SWC points")
+        self.points += len(rows)
+        return values.reshape(len(rows), 7)
+
+    def read_points(self):
+        """ Yields (id, type, x, y, z, radius, parent id) for each point"""
+        for block in self._blocks():
+            for row in block.tolist():
+                yield (int(row[0]), int(row[1]), row[2], row[3], row[4],
+                       row[5], int(row[6]))
+
+    def _chunks(self):
+        """ Yields the diameters and lengths of the compartments read, in
+        numpy arrays of up to chunk_size values
+        """
+        window = self.window
+        if window:
+            # Parents may be anywhere in the current chunk as well
+            window += self.chunk_size
+        store = self._store = _PointStore(window)
+        start = perf_counter()
+        for block in self._blocks():
+            ids = block[:, 0].astype(np.int64)
+            parents = block[:, 6].astype(np.int64)
+            store.add(ids, block[:, 2:5], (block[:, 1] == 1) | (parents < 0))
+            child = parents >= 0
+            diff = block[child, 2:5] - store.get(parents[child])
+            diameters = 2.0 * block[child, 5]
+            lengths = np.sqrt((diff * diff).sum(axis=1))
+            self.compartments += len(diameters)
+            self.seconds += perf_counter() - start
+            if len(diameters):
+                yield diameters, lengths
+            start = perf_counter()
+        self.seconds += perf_counter() - start
+
+    def tables(self):
+        """ Yields the compartments as MorphologyTable objects of up to
+        chunk_size compartments
+        """
+        for diameters, lengths in self._chunks():
+            yield MorphologyTable(diameters, lengths, self.unit)
+
+    def segments(self):
+        """ Yields the compartments as lists of up to chunk_size segment
+        objects, with the diameter and length as PhysQuant values
+        """
+        unit = pq("1 " + self.unit)
+        for diameters, lengths in self._chunks():
+            diameters = (diameters * unit._scale).tolist()
+            lengths = (lengths * unit._scale).tolist()
+            yield [segment(d=PhysQuant._from_vector(diam, unit._dims),
+                           l=PhysQuant._from_vector(length, unit._dims))
+                   for diam, length in zip(diameters, lengths)]
+
+    def table(self):
+        """ Reads the whole file into one MorphologyTable"""
+        return MorphologyTable.concatenate(self.tables())
+
+
+def load_swc(source, unit="um", window=SWC_WINDOW):
+    """ Reads an SWC file, or its comma separated variant, into a
+    MorphologyTable.  See SWCReader for streaming large files in chunks.
+    """
+    return SWCReader(source, unit=unit, window=window).table()
+
+
+def parallel_electrical(compartments, workers=None, chunk_size=100000,
+                        names=("cm", "ra"), executor=None):
+    """ Computes the electrical properties in names, any of sa, vol, cm and
+    ra, for many compartments on a pool of worker processes.  compartments
+    is a MorphologyTable or a sequence of segment objects.  The columns of
+    the table are copied once into shared memory and each worker is given
+    the bounds of a chunk of chunk_size compartments, so no PhysQuant
+    objects are pickled.  Workers compute their chunk with
+    MorphologyTable.electrical, so the values are exactly those of the
+    serial path, and write them into a shared output block.  workers=1 runs
+    the serial path in this process.  An existing ProcessPoolExecutor can
+    be given as executor to avoid starting a new pool for every call.
+    Returns a dictionary of name: PhysQuantArray.
+    """
+    if not isinstance(compartments, MorphologyTable):
+        compartments = MorphologyTable.from_segments(compartments)
+    size = len(compartments)
+    if workers == 1 or size <= chunk_size and executor is None:
+        results = compartments.electrical()
+        return {name: results[name] for name in names}
+    # The units of the results, from an empty table
+    dims = {name: quant._dims
+            for name, quant in compartments[:0].electrical().items()}
+    columns = (compartments._d, compartments._l, compartments._ra_cm)
+    column_dims = tuple(column._dims for column in columns)
+    shared_in = shared_memory.SharedMemory(create=True, size=max(1, 32 * size))
+    shared_out = shared_memory.SharedMemory(create=True,
+                                            size=max(1, 8 * len(names) * size))
+    try:
+        inputs = np.ndarray((4, size), dtype=np.float64, buffer=shared_in.buf)
+        for row, column in enumerate(columns):
+            inputs[row] = column._values
+        inputs[3] = compartments._myelin
+        del inputs
+        chunks = [(shared_in.name, shared_out.name, size, start,
+                   min(start + chunk_size, size), column_dims, names)
+                  for start in range(0, size, chunk_size)]
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_electrical_chunk, chunks))
+        else:
+            list(executor.map(_electrical_chunk, chunks))
+        outputs = np.ndarray((len(names), size), dtype=np.float64,
+                             buffer=shared_out.buf)
+        results = {name: PhysQuantArray._from_values(outputs[row].copy(),
+                                                     dims[name])
+                   for row, name in enumerate(names)}
+        del outputs
+    finally:
+        shared_in.close()
+        shared_in.unlink()
+        shared_out.close()
+        shared_out.unlink()
+    return results
+
+
+def _electrical_chunk(task):
+    """ Worker of parallel_electrical.  Computes one chunk of compartments
+    from the shared input block and writes it into the shared output block.
+    """
+    in_name, out_name, size, start, stop, column_dims, names = task
+    shared_in = shared_memory.SharedMemory(name=in_name)
+    shared_out = shared_memory.SharedMemory(name=out_name)
+    try:
+        inputs = np.ndarray((4, size), dtype=np.float64, buffer=shared_in.buf)
+        outputs = np.ndarray((len(names), size), dtype=np.float64,
+                             buffer=shared_out.buf)
+        d, l, ra_cm = [PhysQuantArray._from_values(inputs[row, start:stop],
+                                                   column_dims[row])
+                       for row in range(3)]
+        table = MorphologyTable._from_columns(d, l, inputs[3, start:stop] != 0,
+                                              ra_cm)
+        results = table.electrical()
+        for row, name in enumerate(names):
+            outputs[row, start:stop] = results[name]._values
+        del d, l, ra_cm, table, inputs, outputs
+    finally:
+        shared_in.close()
+        shared_out.close()
+    return stop - start
@@ -0,0 +1,613 @@
+# -*- coding: utf-8 -*-
+"""
+Program to run benchmarks on PhysQuant code, currently residing in the
+PQ_math_reorg file.  Runs offline and reports the operations per second and
+the peak memory of each benchmark.  Results can be saved as a JSON baseline
+and later runs compared against it, failing if a benchmark got slower by
+more than a threshold.
+Use:
+    python benchPQ.py --save baseline.json
+    python benchPQ.py --compare baseline.json --threshold 0.25
+    python benchPQ.py --import-time
+    python benchPQ.py --parallel 8
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+from copy import deepcopy
+from timeit import Timer, timeit
+from PQ_math_reorg import *
+
+
+class _DictQuant(object):
+    """ Stand in for a PhysQuant object as it was stored before the dimension
+    vector, an object holding a unit_dict of two lists with unit lists.
+    """
+    def __init__(self, unit_dict):
+        self._unit_dict = unit_dict
+
+
+def _allocated_bytes(make_objects):
+    """ Returns the bytes still allocated after make_objects() has run and
+    the objects it returns, which are kept alive while measuring.
+    """
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    objects = make_objects()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return end - start
+
+
+def bench_memory(n=100000, unit_str="uF/cm2"):
+    """ Memory benchmark.  Returns the bytes per instance of n PhysQuant
+    objects and of n objects holding the equivalent unit_dict layout that
+    PhysQuant used before.
+    """
+    pq("1 " + unit_str)
+    scalars = [float(i) for i in range(1, n + 1)]
+    # Build the unit_dict layout the way the old constructor did, with its
+    # own scalar and unit lists for every instance
+    template = pq("1 " + unit_str).unit_dict
+    before = _allocated_bytes(lambda: [_DictQuant(
+        {"num": [scalar * 1.0, list(template["num"][1]), 1],
+         "denom": [1.0, list(template["denom"][1]), -1]})
+        for scalar in scalars])
+    after = _allocated_bytes(lambda: [pq("{0} {1}".format(scalar, unit_str))
+                                      for scalar in scalars])
+    return {"before": before / n, "after": after / n}
+
+
+def _copying_mul(pq1, pq2):
+    """ Multiplication the way it was done before the dimension vector, by
+    deepcopying both unit_dicts, joining the unit lists and rebuilding the
+    product through _interpret.
+    """
+    if isinstance(pq1, (int, float)):
+        pq1 = pq(pq1)
+    the_dict = PhysQuant._multiply_unit_dicts(deepcopy(pq1.unit_dict),
+                                              deepcopy(pq2.unit_dict))
+    return pq(**the_dict)
+
+
+def _copying_pow(pq1, exponent):
+    """ Exponentiation the way it was done before the dimension vector"""
+    temp_dict = deepcopy(pq1.unit_dict)
+    temp_dict["num"][0] = temp_dict["num"][0] ** exponent
+    temp_dict["num"][1] = temp_dict["num"][1] * exponent
+    temp_dict["denom"][1] = temp_dict["denom"][1] * exponent
+    return pq(**temp_dict)
+
+
+def bench_chain(n=20000):
+    """ Micro-benchmark of the segment volume chain ((pi / 4.0) * d**2) * l.
+    Returns the chains per second for the copy-free arithmetic and for the
+    copying unit_dict arithmetic it replaced.
+    """
+    d = pq("10 um")
+    l = pq("100 um")
+    copy_free = timeit(lambda: ((pi / 4.0) * d**2) * l, number=n)
+    copying = timeit(lambda: _copying_mul(_copying_mul(pi / 4.0,
+                                                       _copying_pow(d, 2)), l),
+                     number=n)
+    return {"copy_free": n / copy_free, "copying": n / copying,
+            "speedup": copying / copy_free}
+
+
+# Unit strings of the module constants and Converters factors, which used
+# to be parsed when the module was imported
+CONSTANT_STRINGS = ("6.0224e23 / mol", "8.314 J.mol/K", "1.0 J/V.coul",
+                    "1.0 coul.coul/J.sec.S", "1.0 coul/sec.A",
+                    "96500 coul/mol", "1.0 sec/ohm.F", "1.0 sec/s",
+                    "1 J/V.coul", "1 mol/1000 M.cm.cm.cm",
+                    "1 J.sec/Ω.coul.coul", "1000 cm.cm.cm /l",
+                    "1 coul.coul/J.sec", "1 coul/A.sec", "1 coul.coul/F.J",
+                    "6.0224e23 obj/ mol", "96500 coul/z.mol")
+
+_IMPORT_SCRIPT = ("from time import perf_counter\n"
+                  "start = perf_counter()\n"
+                  "import PQ_math_reorg\n"
+                  "print(perf_counter() - start)\n")
+
+
+def bench_import(repeat=5):
+    """ Import time benchmark.  Imports PQ_math_reorg in repeat fresh
+    interpreters and returns the best time in seconds.  Also returns the
+    time it takes to parse the unit strings of the module constants with an
+    empty parse cache, which importing no longer does.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", _IMPORT_SCRIPT],
+                                         cwd=here)
+        times.append(float(output))
+    parse_times = []
+    for i in range(repeat):
+        PhysQuant.clear_parse_cache()
+        parse_times.append(timeit(lambda: [pq(unit_str) for unit_str in
+                                           CONSTANT_STRINGS], number=1))
+    return {"import": min(times), "parse_constants": min(parse_times)}
+
+
+def bench_lazy(n=20000, size=100000, number=20):
+    """ Compares the segment.ra formula vol.inverted() * ra_cm * sa done
+    eagerly with PhysQuant objects and deferred with LazyQuant, on single
+    quantities n times and on PhysQuantArray objects of size values number
+    times.  Returns the evaluations per second of each.  Needs numpy.
+    """
+    import numpy as np
+    from PQ_array import PhysQuantArray
+    from PQ_lazy import lazy
+    d = pq("10 um")
+    l = pq("100 um")
+    ra_cm = pq("100 ohm.cm")
+    results = {}
+    results["eager"] = n / timeit(
+        lambda: (((pi / 4.0) * d**2 * l).inverted() * ra_cm * (pi * d * l)),
+        number=n)
+    results["lazy"] = n / timeit(
+        lambda: (((pi / 4.0) * lazy(d)**2 * l).inverted() * ra_cm *
+                 (pi * lazy(d) * l)).evaluate(), number=n)
+    d = PhysQuantArray(np.linspace(1.0, 10.0, size), "um")
+    l = PhysQuantArray(np.linspace(10.0, 100.0, size), "um")
+    results["eager_array"] = number / timeit(
+        lambda: (((pi / 4.0) * d**2 * l).inverted() * ra_cm * (pi * d * l)),
+        number=number)
+    results["lazy_array"] = number / timeit(
+        lambda: (((pi / 4.0) * lazy(d)**2 * l).inverted() * ra_cm *
+                 (pi * lazy(d) * l)).evaluate(), number=number)
+    return results
+
+
+def bench_formula(n=20000, size=100000, number=20):
+    """ Compares the Nernst potential R*T/(z*F)*log(co/ci) done with
+    PhysQuant objects and with compile_formula on plain floats, n times,
+    and segment ra done with PhysQuantArray objects and compiled on arrays
+    of size values, number times.  Returns the evaluations per second of
+    each.  Needs numpy for the arrays.
+    """
+    import math
+    import numpy as np
+    from PQ_array import PhysQuantArray
+    from PQ_formula import compile_formula
+    results = {}
+    nernst = compile_formula("R*T/(z*F)*log(co/ci)",
+                             {"T": "K", "z": None, "co": "mM", "ci": "mM"})
+    results["pq_nernst"] = n / timeit(
+        lambda: R * pq("310 K") / (1 * F) *
+        math.log((pq("140 mM") / pq("10 mM")).unitless), number=n)
+    results["compiled_nernst"] = n / timeit(
+        lambda: nernst(310.0, 1, 140.0, 10.0), number=n)
+    ra = compile_formula(
+        lambda d, l, ra_cm: ra_cm / ((pi / 4.0) * d ** 2 * l) * (pi * d * l),
+        {"d": "um", "l": "um", "ra_cm": "ohm.cm"}, arrays=True)
+    d_values = np.linspace(1.0, 10.0, size)
+    l_values = np.linspace(10.0, 100.0, size)
+    d = PhysQuantArray(d_values, "um")
+    l = PhysQuantArray(l_values, "um")
+    ra_cm = pq("100 ohm.cm")
+    results["pq_array_ra"] = number / timeit(
+        lambda: ra_cm / ((pi / 4.0) * d ** 2 * l) * (pi * d * l), number=number)
+    results["compiled_array_ra"] = number / timeit(
+        lambda: ra(d_values, l_values, 100.0), number=number)
+    return results
+
+
+def bench_unit_checked(n=20000):
+    """ Times the sodium current g * m**3 * h * (v - e_na) on PhysQuant
+    arguments n times, done with PhysQuant math and by a unit_checked
+    function with the checks on and off.  Returns the calls per second of
+    each.
+    """
+    from PQ_formula import unit_checked, set_unit_checks
+
+    @unit_checked(returns="pA", v="mV", g="nS", e_na="mV")
+    def current(v, g, e_na, m, h):
+        return g * m**3 * h * (v - e_na)
+
+    v = pq("-65 mV")
+    g = pq("120 nS")
+    e_na = pq("50 mV")
+    m = 0.05
+    h = 0.6
+    results = {"physquant": n / timeit(lambda: g * m**3 * h * (v - e_na),
+                                       number=n),
+               "checked": n / timeit(lambda: current(v, g, e_na, m, h),
+                                     number=n)}
+    set_unit_checks(False)
+    try:
+        results["unchecked"] = n / timeit(lambda: current(v, g, e_na, m, h),
+                                          number=n)
+    finally:
+        set_unit_checks(True)
+    return results
+
+
+def bench_constant_memo(n=20000, repeat=5):
+    """ Times R * T / F, and the Nernst potential factor R * T / (z * F) **
+    2 * N, with a frozen temperature and valence n times with the constant
+    memo off and on, keeping the best of repeat timings.  Returns the
+    evaluations per second of each, off and on, keyed on the expression.
+    """
+    T = pq("310 K").freeze()
+    z = pq(2.0).freeze()
+    timers = {"R * T / F": Timer(lambda: R * T / F),
+              "R * T / (z * F) ** 2 * N": Timer(lambda: R * T / (z * F) ** 2
+                                                 * N)}
+    results = {name: [n / min(timer.repeat(repeat, n))]
+               for name, timer in timers.items()}
+    PhysQuant.set_constant_memo_size(256)
+    try:
+        for name, timer in timers.items():
+            results[name].append(n / min(timer.repeat(repeat, n)))
+    finally:
+        PhysQuant.set_constant_memo_size(0)
+        PhysQuant.clear_constant_memo()
+    return results
+
+
+def bench_unit_parser(n=20000, repeat=5):
+    """ Times reading each example unit string of the PhysQuant docstring n
+    times with the parser that split the string in several passes into unit
+    lists, and with the one pass unit parser.  Neither uses the parse cache.
+    Returns the strings per second of each for every example.
+    """
+    examples = ["100 MOhm", "1 uF/cm2", "9.8 m/sec2", "20 pS", "10 mV",
+                "10 pF/ 20 um2", "100 Ohm.cm"]
+
+    def split_lists(unit_str):
+        units_dict = PhysQuant.id_scaled_unit(unit_str)
+        units_dict = PhysQuant.clean_unit(units_dict)
+        units_dict = PhysQuant.replace_prefix(units_dict)
+        units_dict = PhysQuant.normalize_denom(units_dict)
+        return PhysQuant._dict_to_vector(units_dict)
+
+    results = {}
+    for unit_str in examples:
+        old = Timer(lambda: split_lists(unit_str))
+        new = Timer(lambda: PhysQuant._parse_vector(unit_str))
+        results[unit_str] = (n / min(old.repeat(repeat, n)),
+                             n / min(new.repeat(repeat, n)))
+    return results
+
+
+def bench_measurements(rows=1000000, chunk_size=65536, baseline_rows=20000):
+    """ Writes a CSV file of rows measurements in four columns with units in
+    the headers and reads it with MeasurementReader, into arrays and into
+    an SI copy of the file, and by making a PhysQuant of each cell of the
+    first baseline_rows rows.  Returns the MB per second of each, the size
+    of the file in MB and the peak bytes held while streaming it.
+    """
+    import tempfile
+    from time import perf_counter
+    from PQ_io import MeasurementReader
+    import numpy as np
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sweep.csv")
+        with open(path, "w") as csv_file:
+            csv_file.write("t (msec),Vm (mV),I (pA),T (oC)\n")
+            for start in range(0, rows, chunk_size):
+                size = min(chunk_size, rows - start)
+                block = np.column_stack((np.arange(start, start + size) * 0.02,
+                                         rng.normal(-65.0, 5.0, size),
+                                         rng.normal(0.0, 50.0, size),
+                                         rng.normal(23.0, 0.5, size)))
+                np.savetxt(csv_file, block, fmt="%.6g", delimiter=",")
+        megabytes = os.path.getsize(path) / 1e6
+        results = {"file_mb": megabytes}
+
+        reader = MeasurementReader(path, chunk_size)
+        for columns in reader.chunks():
+            pass
+        results["arrays"] = reader.mb_per_sec
+
+        start = perf_counter()
+        MeasurementReader(path, chunk_size).write_si(
+            os.path.join(directory, "sweep_si.csv"))
+        results["write_si"] = megabytes / (perf_counter() - start)
+
+        with open(path) as csv_file:
+            header = csv_file.readline().strip().split(",")
+            units = [name[name.index("(") + 1:-1] for name in header]
+            lines = [csv_file.readline() for row in range(baseline_rows)]
+        start = perf_counter()
+        for line in lines:
+            [PhysQuant("{0} {1}".format(cell, unit))
+             for cell, unit in zip(line.strip().split(","), units)]
+        results["physquant"] = (sum(len(line) for line in lines) / 1e6 /
+                                (perf_counter() - start))
+
+        tracemalloc.start()
+        for columns in MeasurementReader(path, chunk_size).chunks():
+            pass
+        results["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return results
+
+
+def bench_serialize(n=100000):
+    """ Saves and loads n quantities in two units through the repr text of
+    their unit_dict, which PhysQuant parses back, and through the binary
+    and JSON forms of PQ_io.  Returns the quantities per second of each
+    save and load, and the bytes per quantity of each form.
+    """
+    import io
+    from time import perf_counter
+    from PQ_io import save_quantities, load_quantities, to_json, from_json
+    quants = [pq("{0} mV".format(i)) if i % 2 else pq("{0} pA".format(i))
+              for i in range(1000)] * (n // 1000)
+    n = len(quants)
+    results = {}
+
+    start = perf_counter()
+    text = "\n".join("**" + repr(q.unit_dict) for q in quants)
+    middle = perf_counter()
+    [PhysQuant(line) for line in text.split("\n")]
+    end = perf_counter()
+    results["repr"] = (n / (middle - start), n / (end - middle),
+                       len(text.encode("utf-8")) / n)
+
+    start = perf_counter()
+    stream = io.BytesIO()
+    save_quantities(stream, quants)
+    middle = perf_counter()
+    stream.seek(0)
+    load_quantities(stream)
+    end = perf_counter()
+    results["binary"] = (n / (middle - start), n / (end - middle),
+                         len(stream.getvalue()) / n)
+
+    start = perf_counter()
+    text = to_json(quants)
+    middle = perf_counter()
+    from_json(text)
+    end = perf_counter()
+    results["json"] = (n / (middle - start), n / (end - middle),
+                       len(text.encode("utf-8")) / n)
+    return results
+
+
+def bench_parallel(size=2000000, max_workers=None, chunk_size=100000,
+                   repeat=3):
+    """ Times parallel_electrical on a MorphologyTable of size random
+    compartments with 1 up to max_workers worker processes, by default the
+    number of cores.  Returns a dictionary of workers: best seconds, where 1
+    worker is the serial path.  The pool is started before timing so only
+    the evaluation is timed.  Needs numpy.
+    """
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+    from PQ_morphology import MorphologyTable, parallel_electrical
+    max_workers = max_workers or os.cpu_count() or 1
+    rng = np.random.default_rng(0)
+    table = MorphologyTable(rng.uniform(0.5, 10.0, size),
+                            rng.uniform(1.0, 100.0, size),
+                            myelin=rng.random(size) < 0.5)
+    results = {1: min(Timer(lambda: parallel_electrical(table, workers=1))
+                      .repeat(repeat, 1))}
+    for workers in range(2, max_workers + 1):
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results[workers] = min(Timer(lambda: parallel_electrical(
+                table, chunk_size=chunk_size, executor=pool)).repeat(repeat, 1))
+    return results
+
+
+# Strings from the PhysQuant docstring used for the parsing benchmarks
+DOC_EXAMPLES = ("100 MOhm", "1 uF/cm2", "9.8 m/sec2", "20 pS", "10 mV",
+                "10 pF/ 20 um2", "100 Ohm.cm")
+
+
+def _parse_examples():
+    for unit_str in DOC_EXAMPLES:
+        PhysQuant(unit_str)
+
+
+def _reduce_all(quant):
+    quant.reduce_all()
+
+
+def suite():
+    """ Returns the benchmarks as a dictionary of name: (function, count),
+    where function does count operations each time it is called.
+    """
+    a = pq("100 mS/50 cm2")
+    b = pq("300 pA")
+    d = pq("10 um")
+    l = pq("100 um")
+    rf = pq("1 Ohm.F")
+    seg = segment(d=d, l=l)
+    cell = rnd_cell(um=10)
+    return {
+        "parse_doc_examples": (_parse_examples, len(DOC_EXAMPLES)),
+        "mul": (lambda: a * b, 1),
+        "rmul_float": (lambda: 1.45e-4 * a, 1),
+        "pow": (lambda: d ** 2, 1),
+        "inverted": (lambda: a.inverted(), 1),
+        "div": (lambda: a / b, 1),
+        "mul_inverted": (lambda: a * b.inverted(), 1),
+        "chain": (lambda: ((pi / 4.0) * d**2) * l, 1),
+        "reduce": (lambda: a.reduce(), 1),
+        "reduce_all": (lambda: _reduce_all(pq(rf)), 1),
+        "change_unit": (lambda: a.change_unit("mS/cm2"), 1),
+        "repr": (lambda: repr(a), 1),
+        "segment_sa": (lambda: seg.sa, 1),
+        "segment_vol": (lambda: seg.vol, 1),
+        "segment_cm": (lambda: seg.cm, 1),
+        "segment_ra": (lambda: seg.ra, 1),
+        "rnd_cell_vol": (lambda: cell.vol, 1),
+        "rnd_cell_sa": (lambda: cell.sa, 1),
+        "rnd_cell_cm": (lambda: cell.cm, 1),
+    }
+
+
+def run_benchmark(function, count=1, number=2000, repeat=5):
+    """ Times number calls of function, repeat times, and keeps the best.
+    Then runs number calls under tracemalloc for the peak memory.
+    Returns {"ops_per_sec": ..., "peak_bytes": ...}.
+    """
+    best = min(Timer(function).repeat(repeat=repeat, number=number))
+    tracemalloc.start()
+    for i in range(number):
+        function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ops_per_sec": number * count / best, "peak_bytes": peak}
+
+
+def run_suite(names=None, number=2000, repeat=5):
+    """ Runs the benchmarks of suite(), or only those in names, and returns
+    a dictionary of name: result.
+    """
+    results = {}
+    for name, (function, count) in suite().items():
+        if names and name not in names:
+            continue
+        results[name] = run_benchmark(function, count, number, repeat)
+    return results
+
+
+def save_baseline(results, path):
+    """ Writes the results to a JSON file to compare later runs with"""
+    with open(path, "w") as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def compare(results, baseline, threshold=0.25):
+    """ Returns a list of (name, baseline ops/sec, ops/sec) for every
+    benchmark that is slower than its baseline by more than threshold, a
+    fraction of the baseline speed.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base_speed = baseline[name]["ops_per_sec"]
+        if result["ops_per_sec"] < base_speed * (1.0 - threshold):
+            regressions.append((name, base_speed, result["ops_per_sec"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PhysQuant benchmarks")
+    parser.add_argument("names", nargs="*", help="benchmarks to run")
+    parser.add_argument("--number", type=int, default=2000,
+                        help="calls per timing")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="timings per benchmark, the best is kept")
+    parser.add_argument("--save", metavar="JSON", help="save a baseline")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="compare with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--layouts", action="store_true",
+                        help="also compare with the old unit_dict layout")
+    parser.add_argument("--import-time", action="store_true",
+                        help="also time importing PQ_math_reorg")
+    parser.add_argument("--lazy", action="store_true",
+                        help="also compare eager and deferred math")
+    parser.add_argument("--formula", action="store_true",
+                        help="also compare PhysQuant and compiled formulas")
+    parser.add_argument("--unit-checked", action="store_true",
+                        help="also time unit_checked functions")
+    parser.add_argument("--constant-memo", action="store_true",
+                        help="also time folding frozen constants")
+    parser.add_argument("--unit-parser", action="store_true",
+                        help="also compare the old and one pass unit parsers")
+    parser.add_argument("--measurements", action="store_true",
+                        help="also time reading a CSV file with unit headers")
+    parser.add_argument("--serialize", action="store_true",
+                        help="also time saving and loading quantities")
+    parser.add_argument("--parallel", type=int, nargs="?", const=0,
+                        metavar="WORKERS",
+                        help="also time parallel compartments on 1 to "
+                             "WORKERS processes, by default all cores")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.names, args.number, args.repeat)
+    for name, result in results.items():
+        print("{0:20s} {1:12.0f} ops/sec {2:10d} bytes peak".format(
+              name, result["ops_per_sec"], result["peak_bytes"]))
+    if args.layouts:
+        memory = bench_memory()
+        print("bytes per instance: unit_dict {0:.0f}, dimension vector {1:.0f}"
+              .format(memory["before"], memory["after"]))
+        chain = bench_chain()
+        print("((pi / 4.0) * d**2) * l per second: copying {0:.0f}, copy free "
+              "{1:.0f}, speedup {2:.1f}x".format(chain["copying"],
+                                                 chain["copy_free"],
+                                                 chain["speedup"]))
+    if args.import_time:
+        import_time = bench_import()
+        print("import PQ_math_reorg {0:.1f} ms, parsing the constants it no "
+              "longer parses {1:.2f} ms".format(import_time["import"] * 1e3,
+                                              import_time["parse_constants"]
+                                              * 1e3))
+    if args.lazy:
+        lazy_results = bench_lazy()
+        print("segment ra per second: eager {0:.0f}, lazy {1:.0f}; arrays "
+              "eager {2:.1f}, lazy {3:.1f}".format(
+              lazy_results["eager"], lazy_results["lazy"],
+              lazy_results["eager_array"], lazy_results["lazy_array"]))
+    if args.formula:
+        formula = bench_formula()
+        print("Nernst per second: PhysQuant {0:.0f}, compiled {1:.0f}; "
+              "segment ra arrays per second: PhysQuantArray {2:.1f}, "
+              "compiled {3:.1f}".format(
+              formula["pq_nernst"], formula["compiled_nernst"],
+              formula["pq_array_ra"], formula["compiled_array_ra"]))
+    if args.unit_checked:
+        checked = bench_unit_checked()
+        print("sodium current per second: PhysQuant {0:.0f}, unit_checked "
+              "{1:.0f}, checks off {2:.0f}".format(
+              checked["physquant"], checked["checked"], checked["unchecked"]))
+    if args.constant_memo:
+        for expression, (off, on) in bench_constant_memo().items():
+            print("{0} per second: memo off {1:.0f}, memo on {2:.0f}, "
+                  "speedup {3:.1f}x".format(expression, off, on, on / off))
+    if args.unit_parser:
+        for unit_str, (old, new) in bench_unit_parser().items():
+            print("{0:16s} split lists {1:9.0f}/sec, one pass {2:9.0f}/sec, "
+                  "speedup {3:.1f}x".format(repr(unit_str), old, new,
+                                            new / old))
+    if args.measurements:
+        measured = bench_measurements()
+        print("{0:.0f} MB CSV: arrays {1:.1f} MB/sec, SI copy {2:.1f} MB/sec, "
+              "PhysQuant per cell {3:.2f} MB/sec, {4} bytes peak".format(
+              measured["file_mb"], measured["arrays"], measured["write_si"],
+              measured["physquant"], measured["peak_bytes"]))
+    if args.serialize:
+        for form, (save, load, size) in bench_serialize().items():
+            print("{0:6s} save {1:10.0f}/sec, load {2:10.0f}/sec, {3:5.1f} "
+                  "bytes each".format(form, save, load, size))
+    if args.parallel is not None:
+        scaling = bench_parallel(max_workers=args.parallel or None)
+        for workers, seconds in scaling.items():
+            print("{0:3d} workers {1:8.3f} s, speedup {2:.2f}x".format(
+                  workers, seconds, scaling[1] / seconds))
+    if args.save:
+        save_baseline(results, args.save)
+    if args.compare:
+        regressions = compare(results, load_baseline(args.compare),
+                              args.threshold)
+        for name, base_speed, speed in regressions:
+            print("REGRESSION {0}: {1:.0f} -> {2:.0f} ops/sec".format(
+                  name, base_speed, speed))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
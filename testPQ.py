@@ -20,6 +20,11 @@ class PhysQuantTestCase(TestCase):
         """Test a kwarg type string passed in as an *arg"""
         kwa = '''**{"num": (100.0, [], 1), "denom": (1.0, ['sec'], -1)}'''
         self.assertIsInstance(PhysQuant(kwa), PhysQuant)
+    def test_PhysQuant_dictstr_not_run(self):
+        """A kwarg type string is only read as literals, never run"""
+        self.assertRaises(ValueError, PhysQuant,
+                          '**__import__("os").getcwd()')
+        self.assertRaises(ValueError, PhysQuant, '**["num", "denom"]')
     def test_PhysQuant_dict_kwargs(self):
         """Test a dict passed as a **kwarg"""
         self.assertIsInstance(PhysQuant(**{"num": (200.0, [], 1), "denom": (1.0, ['sec'], -1)}), PhysQuant)
@@ -81,8 +86,462 @@ class PhysQuantTestCase(TestCase):
         print("c dict", c.unit_dict)
         c.reduce_all()
         self.assertEqual(c.SI, (1.0, "sec"))
-      
-        
+
+
+class ParseCacheTestCase(TestCase):
+    """these tests check the cache of parsed unit strings"""
+    def setUp(self):
+        PhysQuant.clear_parse_cache()
+        PhysQuant.set_parse_cache_size(512)
+    def tearDown(self):
+        PhysQuant.set_parse_cache_size(512)
+    def test_parse_cache_hits(self):
+        """The same unit with different scalars is parsed only once"""
+        a = pq("100 mS/50 cm2")
+        b = pq("300 mS/10 cm2")
+        info = PhysQuant.parse_cache_info()
+        self.assertEqual(info["misses"], 1)
+        self.assertEqual(info["hits"], 1)
+        self.assertAlmostEqual(a.scalar, 20.0)
+        self.assertAlmostEqual(b.scalar, 300.0)
+    def test_parse_cache_fresh_lists(self):
+        """Changing a returned unit list does not change the cached entry"""
+        first = PhysQuant._make_dict("1 uF/cm2")
+        first["num"][1].append("m")
+        second = PhysQuant._make_dict("2 uF/cm2")
+        self.assertEqual(second["num"][1], ["F"])
+        self.assertAlmostEqual(second["num"][0], 0.02)
+    def test_parse_cache_evictions(self):
+        """The cache never grows past its bound"""
+        PhysQuant.set_parse_cache_size(2)
+        for unit_str in ("1 mV", "1 pA", "1 uF", "1 nS"):
+            pq(unit_str)
+        info = PhysQuant.parse_cache_info()
+        self.assertEqual(info["currsize"], 2)
+        self.assertEqual(info["evictions"], 2)
+    def test_parse_cache_temperature(self):
+        """Temperatures use an offset and are not cached"""
+        self.assertAlmostEqual(pq("23 oC").scalar, 273.15+23)
+        self.assertAlmostEqual(pq("32 oC").scalar, 273.15+32)
+
+
+class UnitParserTestCase(TestCase):
+    """these tests check the one pass unit string parser"""
+    def test_parser_grammar(self):
+        """Parentheses, several denominators and signed exponents are read"""
+        r = pq("8.314 J/mol.K")
+        self.assertIs(pq("8.314 J/(mol.K)")._dims, r._dims)
+        self.assertIs(pq("8.314 J/mol/K")._dims, r._dims)
+        self.assertIs(pq("9.8 m.sec-2")._dims, pq("9.8 m/sec2")._dims)
+        self.assertIs(pq("1 m^-2")._dims, pq("1/m2")._dims)
+        self.assertAlmostEqual(pq("3 (cm/msec)2").scalar, 300.0)
+        self.assertIs(pq("1 coul2/(J.sec.S)")._dims,
+                      (pq("1 coul") ** 2 / pq("1 J.sec.S"))._dims)
+        self.assertAlmostEqual(pq("2 um10").scalar / 2e-60, 1.0)
+    def test_parser_prefixes(self):
+        """Prefixes are removed only from the start of a unit"""
+        self.assertEqual(pq("1 mm").SI, (1e-3, "m"))
+        self.assertEqual(pq("1 mmol").SI, (1e-3, "mol"))
+        self.assertEqual(pq("2 ucoul").SI, (2e-6, "coul"))
+        self.assertEqual(pq("1 kOhms").SI, (1e3, "Ω"))
+        self.assertEqual(pq("5 mL").SI, (5e-3, "l"))
+    def test_parser_errors(self):
+        """Strings that break the grammar report where reading stopped"""
+        for unit_str, position in (("1 J/(mol.K", 10), ("1 mV nA", 5),
+                                   ("1 m2.5", 5), ("1 /", 3),
+                                   ("1 oC.m", 2)):
+            with self.assertRaises(UnitParseError) as caught:
+                PhysQuant._parse_vector(unit_str)
+            self.assertEqual(caught.exception.position, position)
+        self.assertRaises(ValueError, pq, "1 (m")
+    def test_old_negative_power(self):
+        """The split list parser moves units with a -1 power to the denominator"""
+        units_dict = PhysQuant.id_scaled_unit("5 sec-1.mV")
+        self.assertEqual(units_dict["num"][1], ["mV"])
+        self.assertEqual(units_dict["denom"][1], ["sec"])
+
+
+class DimensionVectorTestCase(TestCase):
+    """these tests check the scale and dimension vector representation"""
+    def test_dims_slots(self):
+        """PhysQuant objects have no instance dictionary"""
+        self.assertFalse(hasattr(pq("1 uF/cm2"), "__dict__"))
+    def test_dims_cancel(self):
+        """Units in the numerator and denominator cancel when multiplied"""
+        a = pq("10 mV") * pq("2 /V")
+        self.assertEqual(a._dims, ())
+        self.assertAlmostEqual(a.unitless, 0.02)
+    def test_dims_ohm_siemens(self):
+        """Ω and S share one power in the dimension vector"""
+        self.assertEqual(pq("1 S")._dims, pq("1 ohm").inverted()._dims)
+        self.assertEqual((pq("2 ohm") * pq("3 S")).SI, (6.0, ""))
+    def test_dims_pow(self):
+        """Raising to a power multiplies the dimension vector"""
+        area = pq("3 um") ** 2
+        self.assertEqual(area.SI[1], "m.m")
+        self.assertAlmostEqual(area.scalar, 9e-12)
+        self.assertEqual((area ** 0.5).SI[1], "m")
+        self.assertRaises(UnitError, area.__pow__, 0.25)
+    def test_dims_unit_dict(self):
+        """unit_dict rebuilds the dictionary form of the quantity"""
+        self.assertEqual(pq("100 mS/50 cm2").unit_dict,
+                         {"num": [20.0, ["S"], 1], "denom": [1.0, ["m", "m"], -1]})
+    def test_dims_shared(self):
+        """Quantities share the immutable dimension vector instead of copying"""
+        a = pq("1 uF/cm2")
+        self.assertIs(a._dims, pq("3 uF/cm2")._dims)
+        self.assertIs((a * 2.0)._dims, a._dims)
+        self.assertIs(pq(a)._dims, a._dims)
+
+
+class SignatureTestCase(TestCase):
+    """these tests check that unit signatures are interned"""
+    def test_signature_identity(self):
+        """Quantities with the same units share one signature however made"""
+        cm = pq("1 uF/cm2") * pq("2 um2")
+        self.assertIs(cm._dims, pq("3 pF")._dims)
+        self.assertIs(pq("1 S")._dims, pq("1 ohm").inverted()._dims)
+        self.assertIs((pq("2 um") ** 2)._dims, (pq("1 um") * pq("5 um"))._dims)
+        self.assertIs((pq("10 mV") * pq("2 /V"))._dims, pq(3.0)._dims)
+    def test_signature_copy(self):
+        """Copied and unpickled quantities keep the interned signature"""
+        import copy, pickle
+        a = pq("1 uF/cm2")
+        self.assertIs(copy.deepcopy(a)._dims, a._dims)
+        self.assertIs(pickle.loads(pickle.dumps(a))._dims, a._dims)
+    def test_signature_eviction(self):
+        """Signatures nothing uses are dropped once the table is full"""
+        from PQ_math_reorg import _SignatureTable
+        table = _SignatureTable(maxsize=2)
+        kept = table.intern((1, 2))
+        for power in range(3, 6):
+            table.intern((power,))
+        self.assertGreater(table.info()["evictions"], 0)
+        table.prune()
+        self.assertEqual(len(table), 1)
+        self.assertIs(table.intern((1, 2)), kept)
+        self.assertIn("currsize", PhysQuant.signature_info())
+
+
+class ArithmeticTestCase(TestCase):
+    """these tests check the unit checked operators"""
+    def test_add_sub(self):
+        """Adding and subtracting need the same units and change nothing"""
+        a = pq("10 mV")
+        b = pq("2 mV")
+        self.assertAlmostEqual((a + b).scalar, 12e-3)
+        self.assertAlmostEqual((a - b).scalar, 8e-3)
+        self.assertAlmostEqual((a - "1 mV").scalar, 9e-3)
+        self.assertAlmostEqual(("1 V" - a).scalar, 0.99)
+        self.assertAlmostEqual((pq("2 mV/V") + 1).unitless, 1.002)
+        self.assertRaises(UnitError, a.__add__, pq("1 pA"))
+        self.assertRaises(UnitError, a.__sub__, 1.0)
+        self.assertAlmostEqual(a.scalar, 10e-3)
+    def test_division(self):
+        """Dividing gives the same result as multiplying by the inverse"""
+        a = pq("100 mS/50 cm2")
+        b = pq("300 pA")
+        self.assertEqual((a / b).SI[1], (a * b.inverted()).SI[1])
+        self.assertAlmostEqual((a / b).scalar / (a * b.inverted()).scalar, 1.0)
+        self.assertEqual((2.0 / b).SI[1], b.inverted().SI[1])
+        self.assertAlmostEqual((a / 4).scalar, a.scalar / 4)
+        self.assertEqual(("1 V" / pq("2 ohm")).SI, (0.5, "S.V"))
+        self.assertEqual(pq("7 ms") // pq("2 ms"), 3.0)
+        self.assertAlmostEqual((pq("7 ms") % pq("2 ms")).scalar, 1e-3)
+        self.assertRaises(UnitError, divmod, pq("7 ms"), pq("2 mV"))
+    def test_unary(self):
+        """Unary operators keep the units"""
+        a = pq("-3 mV")
+        self.assertEqual((-a).SI, (3e-3, "V"))
+        self.assertEqual(abs(a), -a)
+        self.assertEqual(+a, a)
+    def test_in_place(self):
+        """In place operators make a new object instead of changing it"""
+        area = pq("1 um2")
+        total = area
+        total += pq("2 um2")
+        total *= 2
+        total /= pq("1 um")
+        self.assertAlmostEqual(area.scalar, 1e-12)
+        self.assertEqual(total.SI[1], "m")
+        self.assertAlmostEqual(total.scalar, 6e-6)
+    def test_compare(self):
+        """Quantities compare by SI value and need the same units to order"""
+        self.assertEqual(pq("1000 mV"), pq("1 V"))
+        self.assertNotEqual(pq("1 V"), pq("1 A"))
+        self.assertNotEqual(pq("1 V"), 1.0)
+        self.assertTrue(pq("1 mV") < pq("1 V") <= "1 V")
+        self.assertTrue(pq("2 V") > pq("1 V") >= pq("1000 mV"))
+        self.assertRaises(UnitError, pq("1 V").__lt__, pq("1 A"))
+        self.assertEqual(len({pq("1000 mV").freeze(), pq("1 V").freeze(),
+                              pq("1 A").freeze()}), 2)
+    def test_hash_numbers(self):
+        """Unitless quantities hash as the number they are equal to"""
+        self.assertEqual(pq(3.0), 3.0)
+        self.assertEqual(hash(pq(3.0).freeze()), hash(3.0))
+        self.assertIn(3.0, {pq(3.0).freeze()})
+    def test_segment_identity(self):
+        """Segments are compared and hashed as objects"""
+        seg = segment(d=pq("1 um"), l=pq("2 um"))
+        self.assertEqual(seg, seg)
+        self.assertNotEqual(seg, segment(d=pq("1 um"), l=pq("2 um")))
+        self.assertIn(seg, {seg})
+        self.assertNotIn(seg, [pq("1 m")])
+
+
+class RenderingTestCase(TestCase):
+    """these tests check that printing is kept and changes nothing"""
+    def test_segment_render(self):
+        """Segments have no value of their own and print their shape"""
+        seg = segment(d=pq("1 um"), l=pq("2 um"))
+        self.assertEqual(repr(seg), "segment(d=1.000 um, l=2.000 um, myelin=False)")
+        self.assertEqual(str(seg), repr(seg))
+        self.assertEqual(format(seg), repr(seg))
+    def test_render_kept(self):
+        """The printed string is made once and reused"""
+        a = pq("100 mS/50 cm2")
+        text = repr(a)
+        self.assertIs(str(a), text)
+        self.assertIs(format(a), text)
+        self.assertEqual(a.prefixed, (20.0, "S/m2"))
+        self.assertEqual(format(a, ".1f"), "20.0 S/m2")
+    def test_render_read_only(self):
+        """Printing leaves the value alone and follows changes to it"""
+        a = pq("1 Ohm.F")
+        before = (a._scale, a._dims)
+        str(a)
+        self.assertEqual((a._scale, a._dims), before)
+        a.reduce_all()
+        self.assertEqual(str(a), "1.000 sec")
+        a._unit_dict = {"num": [2.0, ["V"], 1], "denom": [1.0, [], -1]}
+        self.assertEqual(str(a), "2.000 V")
+
+
+class FrozenTestCase(TestCase):
+    """these tests check frozen quantities and the constant memo"""
+    def tearDown(self):
+        PhysQuant.set_constant_memo_size(0)
+        PhysQuant.clear_constant_memo()
+    def test_frozen_immutable(self):
+        """Frozen objects cannot be changed and melt gives a copy"""
+        r = pq("1 Ohm.F").freeze()
+        self.assertRaises(ValueError, r.reduce_all)
+        with self.assertRaises(ValueError):
+            r._unit_dict = {"num": [2.0, ["V"], 1], "denom": [1.0, [], -1]}
+        melted = r.melt()
+        melted.reduce_all()
+        self.assertEqual(melted.SI, (1.0, "sec"))
+        self.assertTrue(r._frozen)
+        self.assertTrue(R._frozen and F._frozen and N._frozen)
+    def test_frozen_hash(self):
+        """Frozen objects can be dictionary keys, found by value and units"""
+        table = {R: "R", F: "F"}
+        self.assertEqual(table[pq("8.314 J.mol/K").freeze()], "R")
+        self.assertNotIn(pq("8.314 J").freeze(), table)
+    def test_unfrozen_unhashable(self):
+        """Objects that can still change cannot be hashed"""
+        self.assertRaises(TypeError, hash, pq("8.314 J.mol/K"))
+        with self.assertRaises(TypeError):
+            {pq("1 V"): "V"}
+        self.assertRaises(TypeError, hash, R.melt())
+    def test_constant_memo(self):
+        """Math on frozen objects gives one shared frozen result"""
+        T = pq("310 K").freeze()
+        self.assertFalse((R * T)._frozen)
+        PhysQuant.set_constant_memo_size(64)
+        rt = R * T
+        self.assertTrue(rt._frozen)
+        self.assertIs(R * T, rt)
+        self.assertIs(R * pq("310 K").freeze(), rt)
+        self.assertIs(R * T / F, rt / F)
+        self.assertAlmostEqual((rt / F).scalar, 8.314 * 310 / 96500)
+        self.assertIs(F.inverted(), F.inverted())
+        self.assertIs(T ** 2, T ** 2)
+        self.assertAlmostEqual((T - pq("10 K").freeze()).scalar, 300.0)
+        info = PhysQuant.constant_memo_info()
+        self.assertEqual(info["hits"], 7)
+        self.assertEqual(info["maxsize"], 64)
+        self.assertFalse((R * pq("310 K"))._frozen)
+        self.assertFalse((R * 2.0)._frozen)
+    def test_constant_memo_results_melt(self):
+        """Results from the memo cannot be changed and melt gives a copy"""
+        T = pq("310 K").freeze()
+        PhysQuant.set_constant_memo_size(64)
+        rt = R * T
+        self.assertRaises(ValueError, rt.reduce_all)
+        melted = rt.melt()
+        melted.reduce_all()
+        self.assertIsNot(R * T, melted)
+        self.assertTrue((R * T)._frozen)
+    def test_constant_memo_off(self):
+        """Switching the memo off puts back the plain operators"""
+        plain = PhysQuant.__dict__["__mul__"]
+        PhysQuant.set_constant_memo_size(8)
+        self.assertIsNot(PhysQuant.__dict__["__mul__"], plain)
+        PhysQuant.set_instrumentation()
+        try:
+            PhysQuant.set_constant_memo_size(0)
+        finally:
+            PhysQuant.set_instrumentation(False)
+        self.assertIs(PhysQuant.__dict__["__mul__"], plain)
+        self.assertIs(PhysQuant.__dict__["__imul__"], plain)
+
+
+class ConversionPlanTestCase(TestCase):
+    """these tests check change_unit and its cached conversion plans"""
+    def test_change_unit(self):
+        """Values are returned in the new unit with an optional prefix"""
+        cap = pq("25 mF/m2")
+        value, unit = cap.change_unit("F/cm2")
+        self.assertAlmostEqual(value, 2.5e-6)
+        self.assertEqual(unit, "F/cm2")
+        value, unit = cap.change_unit("F/cm2", with_prefix=True)
+        self.assertAlmostEqual(value, 2.5)
+        self.assertEqual(unit, "μF/cm2")
+        self.assertIsNone(cap.change_unit("mV"))
+    def test_conversion_plan_cached(self):
+        """The plan for a unit and a target string is only made once"""
+        plan = PhysQuant.conversion_plan(pq("1 uF/cm2"), "F/um2")
+        self.assertIs(PhysQuant.conversion_plan(pq("3 pF/um2"), "F/um2"), plan)
+        self.assertTrue(plan.compatible)
+        self.assertAlmostEqual(plan.convert(0.01), 1e-14)
+        self.assertRaises(UnitError, PhysQuant.conversion_plan(pq("1 mV"),
+                                                               "F/um2").convert, 1.0)
+
+
+
+class PrefixTestCase(TestCase):
+    """these tests check picking prefixes and printing quantities"""
+    def test_find_prefix(self):
+        """The first prefix giving a value from 0.9 to 999 is used"""
+        self.assertEqual(PhysQuant.find_prefix(2.5e-6), (2.5e-6 / 1e-6, "u"))
+        self.assertEqual(PhysQuant.find_prefix(0.00095), (0.00095 / 1e-3, "m"))
+        self.assertEqual(PhysQuant.find_prefix(5.0), (5.0, ""))
+        self.assertEqual(PhysQuant.find_prefix(5.0, use_centi=True)[1], "c")
+        self.assertEqual(PhysQuant.find_prefix(-5.0), (-5.0, ""))
+    def test_assign_prefix(self):
+        """_assign_prefix uses the engineering prefixes"""
+        self.assertEqual(pq(1.0)._assign_prefix(2.5e-6), (2.5e-6 / 1e-6, "μ"))
+        self.assertEqual(pq(1.0)._assign_prefix(5e9), (5e9, ""))
+    def test_format(self):
+        """f-strings format the prefixed value and add the unit"""
+        cap = pq("2.5 uF/cm2")
+        self.assertEqual(f"{cap}", str(cap))
+        self.assertEqual(f"{cap:.1f}", "25.0 mF/m2")
+        self.assertEqual(repr(pq("20 pS")), "20.000 pS")
+
+
+class InstrumentationTestCase(TestCase):
+    """these tests check the counters and timings of PhysQuant operations"""
+    def setUp(self):
+        PhysQuant.clear_parse_cache()
+        PhysQuant.reset_instrumentation()
+    def tearDown(self):
+        PhysQuant.set_instrumentation(False)
+        PhysQuant.reset_instrumentation()
+    def test_instrumentation_counts(self):
+        """Operations are counted and timed only while switched on"""
+        pq("1 mV") * pq("2 pA")
+        self.assertEqual(PhysQuant.instrumentation_info()["multiply"]["calls"], 0)
+        PhysQuant.set_instrumentation()
+        charge = pq("10 nS") * pq("2 pF")
+        repr(charge)
+        info = PhysQuant.instrumentation_info()
+        self.assertEqual(info["parse"]["calls"], 2)
+        self.assertEqual(info["unit_parser"]["calls"], 2)
+        self.assertEqual(info["clean"]["calls"], 0)
+        self.assertEqual(info["multiply"]["calls"], 1)
+        self.assertEqual(info["format"]["calls"], 1)
+        self.assertEqual(info["allocate"]["calls"], 3)
+        self.assertGreater(info["parse"]["seconds"], 0.0)
+    def test_instrumentation_off(self):
+        """Switching off puts back the original methods"""
+        original = PhysQuant.__dict__["__mul__"]
+        PhysQuant.set_instrumentation()
+        self.assertIsNot(PhysQuant.__dict__["__mul__"], original)
+        PhysQuant.set_instrumentation(False)
+        self.assertIs(PhysQuant.__dict__["__mul__"], original)
+        self.assertAlmostEqual((pq("2 mV") * 2.0).scalar, 4e-3)
+    def test_profile(self):
+        """A cProfile session runs around a block of code"""
+        with PhysQuant.profile(limit=0) as profiler:
+            pq("1 uF/cm2") * pq("100 um2")
+        self.assertTrue(profiler.getstats())
+
+
+class ConstantsTestCase(TestCase):
+    """these tests check the precomputed module constants"""
+    def assertSameQuant(self, quant, unit_str):
+        parsed = pq(unit_str)
+        self.assertEqual(quant._dims, parsed._dims)
+        self.assertAlmostEqual(quant._scale / parsed._scale, 1.0)
+    def test_module_constants(self):
+        """Constants match the unit strings they stand for"""
+        self.assertSameQuant(N, "6.0224e23 / mol")
+        self.assertSameQuant(R, "8.314 J.mol/K")
+        self.assertSameQuant(VtoBase, "1.0 J/V.coul")
+        self.assertSameQuant(StoBase, "1.0 coul.coul/J.sec.S")
+        self.assertSameQuant(RtoBase, "1.0 J.sec.S/coul.coul")
+        self.assertSameQuant(AtoBase, "1.0 coul/sec.A")
+        self.assertSameQuant(F, "96500 coul/mol")
+        self.assertSameQuant(tau_conv, "1.0 sec/ohm.F")
+        self.assertSameQuant(to_sec, "1.0 sec/s")
+    def test_converters(self):
+        """Converters factors match the unit strings they stand for"""
+        unit_strs = {"V": "1 J/V.coul", "M": "1 mol/1000 M.cm.cm.cm",
+                     "Ω": "1 J.sec/Ω.coul.coul", "l": "1000 cm.cm.cm /l",
+                     "S": "1 coul.coul/J.sec", "A": "1 coul/A.sec",
+                     "F": "1 coul.coul/F.J"}
+        self.assertEqual(set(Converters.reduced_units), set(unit_strs))
+        for unit, unit_str in unit_strs.items():
+            self.assertSameQuant(Converters.reduced_units[unit], unit_str)
+        self.assertSameQuant(Converters.conversion_factors["N"],
+                             "6.0224e23 obj/ mol")
+        self.assertSameQuant(Converters.conversion_factors["R"], "8.314 J.mol/K")
+        self.assertSameQuant(Converters.conversion_factors["F"],
+                             "96500 coul/z.mol")
+
+
+class GeometryCacheTestCase(TestCase):
+    """these tests check the geometry kept by segment and rnd_cell"""
+    def setUp(self):
+        segment.clear_geometry_cache_info()
+        rnd_cell.clear_geometry_cache_info()
+    def test_segment_cached(self):
+        """Geometry is computed once and reused by the other properties"""
+        seg = segment(d=pq("10 um"), l=pq("100 um"))
+        first = seg.ra
+        self.assertEqual(segment.geometry_cache_info(), {"hits": 0, "misses": 3})
+        seg.cm
+        seg.ra
+        self.assertEqual(segment.geometry_cache_info(), {"hits": 2, "misses": 4})
+        self.assertIsNot(seg.ra, first)
+        self.assertAlmostEqual(seg.ra.scalar, first.scalar)
+    def test_segment_invalidate(self):
+        """Setting d, l, myelin or ra_cm forgets the kept geometry"""
+        seg = segment(d=pq("10 um"), l=pq("100 um"))
+        ra = seg.ra.scalar
+        cm = seg.cm.scalar
+        seg.d = pq("20 um")
+        self.assertAlmostEqual(seg.ra.scalar, ra / 2.0)
+        seg.l = pq("200 um")
+        self.assertAlmostEqual(seg.ra.scalar, ra / 2.0)
+        seg.ra_cm = pq("200 ohm.cm")
+        self.assertAlmostEqual(seg.ra.scalar, ra)
+        seg.d = pq("10 um")
+        seg.myelin = True
+        self.assertAlmostEqual(seg.cm.scalar, cm * 2.0 * 0.0167)
+    def test_rnd_cell_precision(self):
+        """rnd_cell geometry uses the stored diameter, not its printed form"""
+        cell = rnd_cell(um=12.34567)
+        self.assertEqual(cell.vol.scalar, (pi / 6.0) * cell.scalar ** 3)
+        self.assertEqual(cell.sa.scalar, pi * cell.scalar ** 2)
+        cell.vol
+        self.assertEqual(rnd_cell.geometry_cache_info(), {"hits": 1, "misses": 2})
+        cell._unit_dict = {"num": [2e-5, ["m"], 1], "denom": [1.0, [], -1]}
+        self.assertAlmostEqual(cell.sa.scalar, pi * 4e-10)
+
+
 if __name__ == "__main__":
     main()
 
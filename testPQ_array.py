@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Program to run unittests on the PhysQuantArray code, currently residing in
+the PQ_array file.
+"""
+
+import numpy as np
+from PQ_math_reorg import *
+from PQ_array import *
+from unittest import TestCase, main
+
+class PhysQuantArrayTestCase(TestCase):
+    """these tests check math on arrays of quantities with a shared unit"""
+    def test_array_create(self):
+        """Values are converted to SI once when the array is made"""
+        volts = PhysQuantArray([-70, -65, -60], "mV")
+        self.assertTrue(np.allclose(volts.values, [-0.07, -0.065, -0.06]))
+        self.assertEqual(volts.unit, "V")
+        temps = PhysQuantArray([0, 23], "oC")
+        self.assertTrue(np.allclose(temps.values, [273.15, 296.15]))
+    def test_array_mult_constants(self):
+        """Arrays broadcast against scalar PhysQuant constants"""
+        temps = PhysQuantArray([273.15, 310.0], "K")
+        rt_f = R * temps / F
+        expected = [(R * pq("{0} K".format(t)) * F.inverted()).scalar
+                    for t in (273.15, 310.0)]
+        self.assertTrue(np.allclose(rt_f.values, expected))
+        self.assertEqual(rt_f.unit, (R * pq("1 K") * F.inverted()).SI[1])
+    def test_array_numpy_left(self):
+        """numpy arrays and numbers on the left give a PhysQuantArray"""
+        a = PhysQuantArray([1, 2], "mV")
+        for product in (np.array([2.0, 3.0]) * a, np.float64(2.0) * a):
+            self.assertIsInstance(product, PhysQuantArray)
+            self.assertEqual(product.unit, "V")
+        self.assertTrue(np.allclose((np.array([2.0, 3.0]) * a).values,
+                                    [2e-3, 6e-3]))
+        ratio = np.float64(1.0) / a
+        self.assertIsInstance(ratio, PhysQuantArray)
+        self.assertTrue(np.allclose(ratio.values, [1e3, 5e2]))
+        total = np.zeros(2) + PhysQuantArray([1.0, 2.0])
+        self.assertIsInstance(total, PhysQuantArray)
+    def test_array_add_units(self):
+        """Adding needs the same unit and is checked once"""
+        a = PhysQuantArray([1, 2], "pA")
+        b = PhysQuantArray([3, 4], "nA")
+        self.assertTrue(np.allclose((a + b).values, [3.001e-9, 4.002e-9]))
+        self.assertRaises(UnitError, a.__add__, PhysQuantArray([1, 2], "mV"))
+    def test_array_unitless(self):
+        """Unitless arrays share the unitless signature and add numbers"""
+        a = PhysQuantArray([1.0, 2.0])
+        self.assertIs(a._dims, pq(1.0)._dims)
+        self.assertTrue(np.allclose((a + 3.0).values, [4.0, 5.0]))
+        self.assertTrue(np.allclose((a + pq(1.0)).values, [2.0, 3.0]))
+    def test_array_pow_invert(self):
+        """Powers and inversion change the shared unit"""
+        diam = PhysQuantArray([2, 4], "um")
+        area = diam ** 2
+        self.assertEqual(area.unit, "m.m")
+        self.assertEqual(diam.inverted().unit, "/m")
+        self.assertTrue(np.allclose(area.values, [4e-12, 16e-12]))
+    def test_array_slice_view(self):
+        """Slices share the values and single items are PhysQuant objects"""
+        a = PhysQuantArray([1.0, 2.0, 3.0], "mV")
+        view = a[1:]
+        view.values[0] = 0.5
+        self.assertEqual(a.values[1], 0.5)
+        self.assertIsInstance(a[0], PhysQuant)
+        self.assertAlmostEqual(a[0].scalar, 1e-3)
+    def test_array_reductions(self):
+        """Reductions return PhysQuant objects with the array unit"""
+        a = PhysQuantArray([1.0, 2.0, 3.0], "mV")
+        self.assertAlmostEqual(a.sum().scalar, 6e-3)
+        self.assertAlmostEqual(a.max().scalar, 3e-3)
+        self.assertEqual(a.mean().SI[1], "V")
+    def test_array_from_quantities(self):
+        """A list of PhysQuant objects with one unit makes an array"""
+        a = PhysQuantArray.from_quantities([pq("1 mV"), pq("2 V")])
+        self.assertTrue(np.allclose(a.values, [1e-3, 2.0]))
+        self.assertRaises(UnitError, PhysQuantArray.from_quantities,
+                          [pq("1 mV"), pq("2 pA")])
+    def test_array_change_unit(self):
+        """Arrays are converted with one cached plan"""
+        cap = PhysQuantArray([1.0, 2.0], "uF/cm2")
+        values, unit = cap.change_unit("μF/cm2")
+        self.assertTrue(np.allclose(values, [1.0, 2.0]))
+        self.assertEqual(unit, "μF/cm2")
+        self.assertRaises(UnitError, cap.change_unit, "mV")
+    def test_array_format(self):
+        """Formatting an array matches printing each PhysQuant"""
+        a = PhysQuantArray([2e-3, 5.0, 7e4, 0.0, -1.0], "mV")
+        self.assertEqual(list(a.format()), [str(quant) for quant in a])
+        values, unit = a.prefixed(per_element=False)
+        self.assertEqual(unit, "V")
+        self.assertEqual(list(a.format(decimals=1, per_element=False)),
+                         ["0.0 V", "0.0 V", "70.0 V", "0.0 V", "-0.0 V"])
+
+
+class ParseQuantitiesTestCase(TestCase):
+    """these tests check parsing many unit strings at once"""
+    def test_parse_groups(self):
+        """Rows are grouped by their SI unit in row order"""
+        parsed = parse_quantities(["100 mS/50 cm2", "20 pS", "3 mS/10 cm2",
+                                   "5 nS"])
+        indexes, conduct = parsed.groups["S"]
+        self.assertEqual(list(indexes), [1, 3])
+        self.assertTrue(np.allclose(conduct.values, [2e-11, 5e-9]))
+        indexes, density = parsed.groups["S/m.m"]
+        self.assertEqual(list(indexes), [0, 2])
+        self.assertTrue(np.allclose(density.values, [20.0, 3.0]))
+        self.assertRaises(UnitError, parsed.as_array)
+    def test_parse_errors(self):
+        """Bad rows are reported by index and do not stop the batch"""
+        parsed = parse_quantities(np.array(["1 mV", "x mV", "2 V", ""]))
+        self.assertEqual([error[0] for error in parsed.errors], [1, 3])
+        volts = parsed.as_array()
+        self.assertEqual(volts.unit, "V")
+        self.assertTrue(np.allclose(volts.values[[0, 2]], [1e-3, 2.0]))
+        self.assertTrue(np.isnan(volts.values[1]))
+    def test_parse_temperature(self):
+        """Temperatures are converted with their offset"""
+        parsed = parse_quantities(["23 oC", "300 K"])
+        self.assertTrue(np.allclose(parsed.as_array().values, [296.15, 300.0]))
+
+
+if __name__ == "__main__":
+    main()
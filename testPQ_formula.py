@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Program to run unittests on the formula compiler in the PQ_formula file.
+"""
+
+import math
+import subprocess
+import sys
+import numpy as np
+from PQ_math_reorg import *
+from PQ_array import *
+from PQ_formula import *
+from unittest import TestCase, main
+
+class CompileFormulaTestCase(TestCase):
+    """these tests check compiled formulas against PhysQuant math"""
+    def test_formula_string(self):
+        """An expression string gives the PhysQuant value on plain floats"""
+        nernst = compile_formula("R*T/(z*F)*log(co/ci)",
+                                 {"T": "K", "z": None, "co": "mM", "ci": "mM"})
+        expected = R * pq("310 K") / F * math.log(14.0)
+        self.assertAlmostEqual(nernst(310.0, 1, 140.0, 10.0) / expected.scalar,
+                               1.0)
+        self.assertEqual(nernst.unit, expected.SI[1])
+        self.assertAlmostEqual(nernst(T=310.0, z=1, co=14.0, ci=1.0),
+                               nernst(310.0, 1, 140.0, 10.0))
+    def test_formula_function(self):
+        """A function is traced once and its scale factors are folded"""
+        ra = compile_formula(lambda d, l, ra_cm: ra_cm / ((pi / 4.0) * d ** 2 * l)
+                             * (pi * d * l),
+                             {"d": "um", "l": "um", "ra_cm": "ohm.cm"})
+        seg = segment(d=pq("10 um"), l=pq("100 um"))
+        self.assertAlmostEqual(ra(10.0, 100.0, 100.0) / seg.ra.scalar, 1.0)
+        self.assertEqual(ra.unit, seg.ra.SI[1])
+        self.assertEqual(ra.source.count("e-06"), 0)
+        self.assertIsInstance(ra.quantity(10.0, 100.0, 100.0), PhysQuant)
+    def test_formula_unit(self):
+        """The result is given in the requested unit, reducing if needed"""
+        tau = compile_formula("r * c * tau_conv", {"r": "MOhm", "c": "pF"},
+                              unit="msec")
+        self.assertAlmostEqual(tau(100.0, 20.0), 2.0)
+        energy = compile_formula("q * v", {"q": "coul", "v": "mV"}, unit="J")
+        self.assertAlmostEqual(energy(2.0, 500.0), 1.0)
+        self.assertRaises(UnitError, compile_formula, "r * c", {"r": "ohm",
+                          "c": "F"}, unit="V")
+    def test_formula_quantity_unit(self):
+        """A PhysQuant unit is reported as the unit the results are in"""
+        half = compile_formula("v", {"v": "mV"}, unit=pq("2 mV"))
+        self.assertAlmostEqual(half(4.0), 2.0)
+        self.assertEqual(half.unit, "2 mV")
+        self.assertAlmostEqual(half(4.0) * pq(half.unit).scalar, 4e-3)
+        self.assertEqual(compile_formula("v", {"v": "V"}, unit=pq("1 mV")).unit,
+                         "mV")
+    def test_formula_arrays(self):
+        """With arrays=True the compiled function works on numpy arrays"""
+        cm = compile_formula("pi * d * l * pq('1 uF/cm2')",
+                             {"d": "um", "l": "um"}, unit="pF", arrays=True)
+        d = np.array([1.0, 2.0])
+        self.assertTrue(np.allclose(cm(d, 100.0), pi * d * 100.0 * 1e-2))
+        self.assertIsInstance(cm.quantity(d, 100.0), PhysQuantArray)
+    def test_formula_checks(self):
+        """Units are checked when compiling and strings are never run"""
+        units = {"a": "mV", "b": "pA"}
+        self.assertRaises(UnitError, compile_formula, "a + b", units)
+        self.assertRaises(UnitError, compile_formula, "log(a)", units)
+        self.assertRaises(ValueError, compile_formula, "__import__('os')", units)
+        self.assertRaises(ValueError, compile_formula, "a.real", units)
+        self.assertRaises(ValueError, compile_formula, "a ** b", units)
+        self.assertRaises(ValueError, compile_formula, "a", {"pi": "m"})
+        self.assertRaises(UnitError, compile_formula, "T", {"T": "oC"})
+
+
+@unit_checked(returns="pA", v="mV", g="nS", e_rev="mV")
+def current(v, g, e_rev="0 mV"):
+    return g * (v - e_rev)
+
+
+class UnitCheckedTestCase(TestCase):
+    """these tests check the unit_checked decorator"""
+    def tearDown(self):
+        set_unit_checks(True)
+    def test_checked_arguments(self):
+        """Quantities, strings and plain numbers reach the body in SI"""
+        expected = -130e-12
+        self.assertAlmostEqual(current(pq("-65 mV"), "2 nS").scalar, expected)
+        self.assertAlmostEqual(current(-65.0, 2.0).scalar, expected)
+        self.assertAlmostEqual(current(v=-75.0, g=2.0, e_rev=pq("-10 mV")).scalar,
+                               expected)
+        self.assertEqual(current(-65.0, 2.0).SI[1], "A")
+        self.assertEqual(current.__name__, "current")
+    def test_checked_arrays(self):
+        """Arrays are converted once and the result is a PhysQuantArray"""
+        result = current(PhysQuantArray([-65.0, -55.0], "mV"), np.array([2.0, 1.0]))
+        self.assertIsInstance(result, PhysQuantArray)
+        self.assertTrue(np.allclose(result.values, [-130e-12, -55e-12]))
+    def test_checked_units(self):
+        """Wrong units raise and reducible units are converted by a plan"""
+        self.assertRaises(UnitError, current, pq("1 pA"), 2.0)
+        volts = current(pq("-0.065 J/coul"), 2.0)
+        self.assertAlmostEqual(volts.scalar, -130e-12)
+        current(pq("-0.065 J/coul"), 2.0)
+        self.assertGreaterEqual(current.plan_cache_info()["hits"], 1)
+        set_unit_checks(False)
+        self.assertAlmostEqual(current(pq("-65 mA"), 2.0).scalar, -130e-12)
+    def test_checked_without_numpy(self):
+        """Decorating and calling with numbers does not import numpy"""
+        code = ("import sys\n"
+                "from PQ_formula import unit_checked\n"
+                "@unit_checked(returns='V', v='mV', t='oC')\n"
+                "def f(v, t):\n"
+                "    return v\n"
+                "f(3.0, 37.0)\n"
+                "print('numpy' in sys.modules)\n")
+        output = subprocess.run([sys.executable, "-c", code], check=True,
+                                capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), "False")
+    def test_checked_temperature(self):
+        """Plain numbers in an offset temperature unit get the offset"""
+        @unit_checked(returns="K", t="oC")
+        def kelvin(t):
+            return t
+        self.assertAlmostEqual(kelvin(37.0).scalar, 310.15)
+        self.assertAlmostEqual(kelvin(pq("37 oC")).scalar, 310.15)
+        values = kelvin(np.array([0.0, 100.0])).values
+        self.assertTrue(np.allclose(values, [273.15, 373.15]))
+    def test_checked_quantity_result(self):
+        """A body may return quantities in, or reducible to, the unit"""
+        @unit_checked(returns="V", i="A", r="ohm")
+        def drop(i, r):
+            return i * pq("1 A") * r * pq("1 ohm")
+        self.assertAlmostEqual(drop(2.0, 3.0).scalar, 6.0)
+        self.assertEqual(drop(2.0, 3.0).SI[1], "V")
+        @unit_checked(returns="V", i="A")
+        def wrong(i):
+            return i * pq("1 A")
+        self.assertRaises(UnitError, wrong, 1.0)
+
+
+if __name__ == "__main__":
+    main()
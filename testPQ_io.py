@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Program to run unittests on saving and loading quantities, currently
+residing in the PQ_io file.
+"""
+
+import io
+import json
+import os
+import tempfile
+import numpy as np
+from PQ_math_reorg import *
+from PQ_array import *
+from PQ_io import *
+from PQ_io import _split_header
+from concurrent.futures import ProcessPoolExecutor
+from unittest import TestCase, main
+
+class BinaryTestCase(TestCase):
+    """these tests check the binary file form of quantities"""
+    def setUp(self):
+        self.items = [pq("1 uF/cm2"), pq("100 ohm.cm"),
+                      PhysQuantArray([1.0, 2.0, 3.0], "mV"), pq("2 S"),
+                      pq(3.0), pq("-70 mV")]
+    def assertSame(self, loaded):
+        self.assertEqual(len(loaded), len(self.items))
+        for item, back in zip(self.items, loaded):
+            self.assertIs(type(back), type(item))
+            self.assertIs(back._dims, item._dims)
+            if isinstance(item, PhysQuant):
+                self.assertEqual(back.scalar, item.scalar)
+            else:
+                self.assertTrue(np.array_equal(back.values, item.values))
+    def test_round_trip(self):
+        """Quantities and arrays come back with the same values and units"""
+        stream = io.BytesIO()
+        self.assertEqual(save_quantities(stream, self.items, chunk_size=2),
+                         len(self.items))
+        stream.seek(0)
+        self.assertSame(load_quantities(stream))
+    def test_file_streamed(self):
+        """A file is read back a block at a time"""
+        with tempfile.NamedTemporaryFile(suffix=".pqb", delete=False) as pqb:
+            name = pqb.name
+        try:
+            save_quantities(name, [pq("{0} mV".format(i)) for i in range(10)],
+                            chunk_size=4)
+            sizes = [len(values) for _, values, _ in iter_blocks(name)]
+            loaded = list(iter_quantities(name))
+        finally:
+            os.remove(name)
+        self.assertEqual(sizes, [4, 4, 2])
+        self.assertAlmostEqual(loaded[7].scalar, 7e-3)
+        self.assertEqual(loaded[7].SI[1], "V")
+    def test_bad_streams(self):
+        """Streams that are not whole files are reported"""
+        stream = io.BytesIO()
+        save_quantities(stream, self.items)
+        data = stream.getvalue()
+        self.assertRaises(ValueError, load_quantities, io.BytesIO(b"XXXX"))
+        self.assertRaises(ValueError, load_quantities, io.BytesIO(data[:-3]))
+        self.assertRaises(ValueError, load_quantities,
+                          io.BytesIO(MAGIC + b"Q\x01\x00\x00\x00" + bytes(12)))
+        self.assertRaises(ValueError, save_quantities, io.BytesIO(), [1.0])
+
+
+class JSONTestCase(TestCase):
+    """these tests check the JSON form of quantities"""
+    def test_round_trip(self):
+        """Lists and single quantities come back as they were saved"""
+        items = [pq("5 nS"), PhysQuantArray([0.5, 1.5], "um"), pq("6 nS")]
+        text = to_json(items)
+        self.assertEqual(len(json.loads(text)["signatures"]), 2)
+        loaded = from_json(text)
+        self.assertAlmostEqual(loaded[2].scalar, 6e-9)
+        self.assertTrue(np.array_equal(loaded[1].values, items[1].values))
+        self.assertEqual(from_json(to_json(pq("1 pA"))).SI[1], "A")
+    def test_bad_documents(self):
+        """Documents that are not saved quantities are reported"""
+        self.assertRaises(ValueError, from_json, "[1, 2]")
+        base = {"format": "PhysQuant", "version": 1,
+                "signatures": [{"V": 1}], "items": [[1, 2.0]]}
+        self.assertRaises(ValueError, from_json, json.dumps(base))
+        base["items"] = [[0, "2.0"]]
+        self.assertRaises(ValueError, from_json, json.dumps(base))
+        base["signatures"] = [{"V": "__import__('os')"}]
+        base["items"] = [[0, 2.0]]
+        self.assertRaises(ValueError, from_json, json.dumps(base))
+        base["signatures"] = [{"V": True}]
+        self.assertRaises(ValueError, from_json, json.dumps(base))
+        names = len(PhysQuant._unit_names)
+        base["signatures"] = [{"notaunit": 1}]
+        self.assertRaises(ValueError, from_json, json.dumps(base))
+        self.assertEqual(len(PhysQuant._unit_names), names)
+
+
+
+MEASUREMENT_LINES = ["# rig 3, cell 2",
+                     "t (msec),Vm (mV),I [pA],T (oC),R (J/(mol.K)),sweep",
+                     "0,-70,5,23,8.314,1",
+                     "1,-69.5,,23.5,8.314,1",
+                     "",
+                     "2,-69,6,24,8.314,2"]
+
+
+class MeasurementTestCase(TestCase):
+    """these tests check reading measurement files with units in the header"""
+    def test_headers(self):
+        """The unit of a column is the bracketed text at the end of its name"""
+        self.assertEqual(_split_header(" Vm (mV)"), ("Vm", "mV"))
+        self.assertEqual(_split_header('"I [pA]"'), ("I", "pA"))
+        self.assertEqual(_split_header("R (J/(mol.K))"), ("R", "J/(mol.K)"))
+        self.assertEqual(_split_header("Vm (soma) (mV)"), ("Vm (soma)", "mV"))
+        self.assertEqual(_split_header("sweep"), ("sweep", ""))
+    def test_chunks(self):
+        """Columns are converted to SI, temperatures with their offset"""
+        reader = MeasurementReader(MEASUREMENT_LINES, chunk_size=2)
+        chunks = list(reader.chunks())
+        self.assertEqual([len(chunk["t"]) for chunk in chunks], [2, 1])
+        self.assertEqual(reader.rows, 3)
+        first = chunks[0]
+        self.assertTrue(np.allclose(first["Vm"].values, [-0.07, -0.0695]))
+        self.assertEqual(first["Vm"].unit, "V")
+        self.assertTrue(np.allclose(first["T"].values, [296.15, 296.65]))
+        self.assertTrue(np.isnan(first["I"].values[1]))
+        self.assertIs(first["R"]._dims, pq("1 J/mol.K")._dims)
+        self.assertEqual(first["sweep"].unit, "")
+    def test_temperature_exact(self):
+        """Temperature columns get the offset without losing precision"""
+        columns = load_measurements(["T (oC),U (oF)", "100,212", "0,32"])
+        self.assertEqual(columns["T"].values.tolist(), [373.15, 273.15])
+        self.assertEqual(columns["U"].values.tolist(), [373.15, 273.15])
+        self.assertEqual(PhysQuantArray([100.0], "oC").values[0], 373.15)
+    def test_file_and_si_copy(self):
+        """A file is read through a memory map and its SI copy reads back"""
+        rng = np.random.default_rng(2)
+        values = rng.normal(size=(1001, 2))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sweep.tsv")
+            with open(path, "w", newline="") as tsv_file:
+                tsv_file.write("Vm (mV)\tT (oC)\r\n")
+                for row in values.tolist():
+                    tsv_file.write("{0!r}\t{1!r}\r\n".format(*row))
+            reader = MeasurementReader(path, chunk_size=100)
+            self.assertEqual([len(chunk["Vm"]) for chunk in reader.chunks()],
+                             [100] * 10 + [1])
+            self.assertEqual(reader.bytes, os.path.getsize(path) - 16)
+            self.assertGreater(reader.mb_per_sec, 0.0)
+            si_path = os.path.join(directory, "sweep_si.tsv")
+            self.assertEqual(MeasurementReader(path).write_si(si_path), 1001)
+            with open(si_path) as si_file:
+                self.assertEqual(si_file.readline(), "Vm (V)\tT (K)\n")
+            columns = load_measurements(si_path)
+        self.assertTrue(np.allclose(columns["Vm"].values, values[:, 0] * 1e-3))
+        self.assertTrue(np.allclose(columns["T"].values, values[:, 1] + 273.15))
+    def test_bad_files(self):
+        """Rows that do not match the header are reported"""
+        self.assertRaises(ValueError, load_measurements,
+                          ["Vm (mV),I (pA)", "1,2", "3"])
+        self.assertRaises(ValueError, load_measurements,
+                          ["Vm (mV),I (pA)", "1,x"])
+        self.assertRaises(ValueError, load_measurements, ["Vm (mV),Vm (V)"])
+        self.assertRaises(ValueError, load_measurements, ["Vm (mV nA)", "1"])
+    def test_ragged_rows(self):
+        """Ragged rows are reported even when their values add up"""
+        with self.assertRaises(ValueError) as caught:
+            load_measurements(["Vm (mV),I (pA)", "1,2,3", "4"])
+        self.assertIn("Row 1", str(caught.exception))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ragged.tsv")
+            with open(path, "w") as tsv_file:
+                tsv_file.write("Vm (mV)\tI (pA)\n1\t2\n3\t4\t5\n6\n")
+            with self.assertRaises(ValueError) as caught:
+                load_measurements(path)
+        self.assertIn("Row 2", str(caught.exception))
+    def test_header_only(self):
+        """A file with only a header gives empty columns"""
+        columns = load_measurements(["# no sweeps", "Vm (mV),T (oC)"])
+        self.assertEqual(list(columns), ["Vm", "T"])
+        self.assertEqual(len(columns["Vm"]), 0)
+        self.assertEqual(columns["Vm"].unit, "V")
+        self.assertEqual(columns["T"].unit, "K")
+
+
+
+def _store_total(path):
+    """Sums a store in another process, opened read only"""
+    with QuantityStore(path) as store:
+        return float(store.values.sum())
+
+
+class QuantityStoreTestCase(TestCase):
+    """these tests check the memory mapped store of quantities"""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "vm.f8")
+        self.store = QuantityStore.create(self.path, [1.0, 2.0, 3.0], "mV")
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+    def test_slices_not_copied(self):
+        """Slices are arrays over the map and single values are PhysQuant"""
+        window = self.store[1:]
+        self.assertIsInstance(window, PhysQuantArray)
+        self.assertTrue(np.shares_memory(window.values, self.store.values))
+        self.assertEqual(window.unit, "V")
+        self.assertAlmostEqual(self.store[2].scalar, 3e-3)
+        self.store[0] = pq("10 mV")
+        self.assertRaises(UnitError, self.store.__setitem__, 0, pq("1 pA"))
+        self.store.flush()
+        self.assertAlmostEqual(QuantityStore(self.path)[0].scalar, 1e-2)
+    def test_append(self):
+        """Values are added to the end and seen by readers after refresh"""
+        reader = QuantityStore(self.path)
+        self.assertEqual(self.store.append(PhysQuantArray([4.0], "mV")), 4)
+        self.assertEqual(self.store.append([5e-3]), 5)
+        self.assertRaises(UnitError, self.store.append, [1.0], "pA")
+        self.assertEqual(len(reader), 3)
+        reader.refresh()
+        self.assertTrue(np.allclose(reader.values, [1e-3, 2e-3, 3e-3, 4e-3,
+                                                    5e-3]))
+        self.assertRaises(ValueError, reader.append, [1.0])
+        self.assertRaises(ValueError, reader.__setitem__, 0, 1.0)
+        empty = QuantityStore.create(self.path + "2", unit="oC")
+        self.assertEqual(len(empty), 0)
+        empty.append([0.0], "oC")
+        self.assertAlmostEqual(empty[0].scalar, 273.15)
+    def test_views(self):
+        """Views in another unit convert only the values read"""
+        view = self.store.change_unit("uV")
+        self.assertEqual(len(view), 3)
+        self.assertAlmostEqual(view[1], 2000.0)
+        blocks = list(view.chunks(2))
+        self.assertEqual([len(block) for block in blocks], [2, 1])
+        self.assertTrue(np.allclose(np.concatenate(blocks),
+                                    [1000.0, 2000.0, 3000.0]))
+        self.assertRaises(UnitError, self.store.change_unit, "pA")
+        self.assertEqual([len(block) for block in self.store.chunks(2)], [2, 1])
+    def test_shared_read_only(self):
+        """Several processes read the same file at once"""
+        self.store.flush()
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            totals = list(pool.map(_store_total, [self.path] * 2))
+        self.assertEqual(len(totals), 2)
+        self.assertAlmostEqual(totals[0], 6e-3)
+        self.assertAlmostEqual(totals[1], 6e-3)
+    def test_bad_sidecar(self):
+        """Files that are not stores are reported"""
+        with open(QuantityStore.sidecar(self.path)) as sidecar:
+            self.assertEqual(json.load(sidecar)["unit"], {"V": 1})
+        for unit in ("__import__('os')", {"V": "1"}, {"notaunit": 1}):
+            with open(QuantityStore.sidecar(self.path), "w") as sidecar:
+                json.dump({"format": "PhysQuantStore", "unit": unit}, sidecar)
+            self.assertRaises(ValueError, QuantityStore, self.path)
+        self.assertRaises(ValueError, QuantityStore, self.path, "w")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Program to run unittests on the deferred expressions in the PQ_lazy file.
+"""
+
+import numpy as np
+from PQ_math_reorg import *
+from PQ_array import *
+from PQ_lazy import *
+from unittest import TestCase, main
+
+class LazyQuantTestCase(TestCase):
+    """these tests check that deferred expressions match eager math"""
+    def test_lazy_segment_ra(self):
+        """A deferred segment.ra formula gives the same value and unit"""
+        seg = segment(d=pq("10 um"), l=pq("100 um"))
+        ra = lazy(seg.vol).inverted() * seg.ra_cm * seg.sa
+        self.assertIsInstance(ra, LazyQuant)
+        self.assertEqual(ra.SI[1], seg.ra.SI[1])
+        self.assertAlmostEqual(ra.scalar / seg.ra.scalar, 1.0)
+        self.assertEqual(repr(ra), repr(seg.ra))
+    def test_lazy_evaluated_once(self):
+        """The result is kept once the graph has been evaluated"""
+        rt_f = lazy(R) * pq("310 K") / F
+        self.assertIsNone(rt_f._result)
+        first = rt_f.evaluate()
+        self.assertIs(rt_f.evaluate(), first)
+        self.assertAlmostEqual(first.scalar, (R * pq("310 K") * F.inverted()).scalar)
+    def test_lazy_units(self):
+        """Adding needs the same unit, checked when the graph is evaluated"""
+        total = lazy("1 mV") + "2 mV" - pq("0.5 mV")
+        self.assertAlmostEqual(total.scalar, 2.5e-3)
+        self.assertAlmostEqual((-lazy("3 mV")).scalar, -3e-3)
+        self.assertEqual((lazy("3 um") ** 2).SI[1], "m.m")
+        mixed = lazy("1 mV") + "1 pA"
+        self.assertRaises(UnitError, mixed.evaluate)
+    def test_lazy_arrays(self):
+        """Array expressions are evaluated in one pass to a PhysQuantArray"""
+        d = PhysQuantArray([2.0, 4.0], "um")
+        l = PhysQuantArray([10.0, 20.0], "um")
+        vol = (pi / 4.0) * lazy(d) ** 2 * l
+        sa = pi * lazy(d) * l
+        ra = vol.inverted() * pq("100 ohm.cm") * sa
+        eager = ((pi / 4.0) * d ** 2 * l).inverted() * pq("100 ohm.cm") * (pi * d * l)
+        self.assertIsInstance(ra.evaluate(), PhysQuantArray)
+        self.assertTrue(np.allclose(ra.values, eager.values))
+        self.assertEqual(ra.unit, eager.unit)
+        self.assertTrue(np.allclose(d.values, [2e-6, 4e-6]))
+    def test_lazy_common_subexpression(self):
+        """Repeated sub-expressions are evaluated once and inputs are kept"""
+        d = PhysQuantArray([1.0, 2.0], "um")
+        area = lazy(d) * d * pi
+        total = area * 2.0 + area * 2.0
+        self.assertTrue(np.allclose(total.values, [4 * pi * 1e-12, 16 * pi * 1e-12]))
+        self.assertTrue(np.allclose(d.values, [1e-6, 2e-6]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Program to run unittests on the MorphologyTable code, currently residing in
+the PQ_morphology file.
+"""
+
+import os
+import tempfile
+import numpy as np
+from PQ_math_reorg import *
+from PQ_array import *
+from PQ_morphology import *
+from unittest import TestCase, main
+
+class MorphologyTableTestCase(TestCase):
+    """these tests check that the table matches segment compartments"""
+    def setUp(self):
+        self.table = MorphologyTable([10, 2, 5], [100, 50, 20], "um",
+                                     myelin=[False, True, False])
+    def test_table_matches_segment(self):
+        """Every property matches segment in value and unit"""
+        props = self.table.electrical()
+        for index in range(len(self.table)):
+            seg = segment(myelin=bool(self.table.myelin[index]),
+                          d=pq("{0} um".format([10, 2, 5][index])),
+                          l=pq("{0} um".format([100, 50, 20][index])))
+            for name in ("sa", "vol", "cm", "ra"):
+                expected = getattr(seg, name)
+                self.assertAlmostEqual(props[name].values[index] / expected.scalar, 1.0)
+                self.assertEqual(props[name].unit, expected.SI[1])
+                self.assertEqual(getattr(self.table, name).unit, expected.SI[1])
+    def test_table_segment_view(self):
+        """Single compartments are given back as segment objects"""
+        seg = self.table[1]
+        self.assertIsInstance(seg, segment)
+        self.assertTrue(seg.myelin)
+        self.assertAlmostEqual(seg.d.scalar, 2e-6)
+        self.assertAlmostEqual(seg.ra_cm.scalar, 1.0)
+        self.assertEqual(len(self.table[1:]), 2)
+    def test_table_from_segments(self):
+        """A table made from segments gives the same results"""
+        table = MorphologyTable.from_segments(self.table)
+        self.assertTrue(np.allclose(table.ra.values, self.table.ra.values))
+        self.assertTrue(np.array_equal(table.myelin, self.table.myelin))
+    def test_table_ra_cm(self):
+        """ra_cm can be given per compartment"""
+        ra_cm = PhysQuantArray([100, 200, 50], "ohm.cm")
+        table = MorphologyTable([10, 2, 5], [100, 50, 20], ra_cm=ra_cm)
+        self.assertTrue(np.allclose(table.ra.values,
+                                    self.table.ra.values * [1.0, 2.0, 0.5]))
+        self.assertRaises(UnitError, MorphologyTable, [1.0], [1.0], "mV")
+        self.assertRaises(ValueError, MorphologyTable, [1.0, 2.0], [1.0])
+
+
+SWC_LINES = ["# a soma and a short branch",
+             "1 1 0 0 0 5 -1",
+             "2 3 3 4 0 1 1",
+             "3 3 3 4 10 0.5 2",
+             "",
+             "4 3 0 0 -2 1.5 1"]
+
+
+class SWCReaderTestCase(TestCase):
+    """these tests check reading compartments from SWC morphologies"""
+    def test_swc_compartments(self):
+        """Each point with a parent becomes a compartment"""
+        table = load_swc(SWC_LINES)
+        self.assertEqual(len(table), 3)
+        self.assertTrue(np.allclose(table.d.values, [2e-6, 1e-6, 3e-6]))
+        self.assertTrue(np.allclose(table.l.values, [5e-6, 10e-6, 2e-6]))
+    def test_swc_chunks(self):
+        """Compartments are given out in chunks and the reader counts them"""
+        reader = SWCReader(SWC_LINES, chunk_size=2)
+        chunks = list(reader.segments())
+        self.assertEqual([len(chunk) for chunk in chunks], [1, 2])
+        self.assertIsInstance(chunks[1][0], segment)
+        self.assertAlmostEqual(chunks[1][0].l.scalar, 10e-6)
+        self.assertEqual(reader.points, 4)
+        self.assertEqual(reader.compartments, 3)
+        self.assertGreater(reader.points_per_sec, 0.0)
+    def test_swc_csv_file(self):
+        """A comma separated file with a header is read through a memory map"""
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+            csv_file.write("id,type,x,y,z,radius,parent\n")
+            for line in SWC_LINES:
+                if line and line[0] != "#":
+                    csv_file.write(line.replace(" ", ",") + "\n")
+        try:
+            table = load_swc(csv_file.name)
+        finally:
+            os.remove(csv_file.name)
+        self.assertTrue(np.allclose(table.ra.values, load_swc(SWC_LINES).ra.values))
+    def test_swc_window(self):
+        """Parents further back than the window are reported"""
+        lines = ["1 1 0 0 0 1 -1"] + ["{0} 3 {0} 0 0 1 {1}".format(i, i - 1)
+                                      for i in range(2, 10)] + ["10 3 0 0 1 1 2"]
+        self.assertEqual(len(SWCReader(lines[:-1], chunk_size=2,
+                                       window=2).table()), 8)
+        self.assertRaises(ValueError, SWCReader(lines, chunk_size=2, window=2).table)
+        self.assertEqual(len(load_swc(lines, window=None)), 9)
+        self.assertRaises(ValueError, load_swc, ["1 1 0 0 x 1 -1"])
+    def test_swc_window_soma(self):
+        """Dendrites start from the soma however far back it is"""
+        lines = ["1 1 0 0 0 1 -1"] + ["{0} 3 {0} 0 0 1 {1}".format(i, i - 1)
+                                      for i in range(2, 10)] + ["10 3 0 0 1 1 1"]
+        table = SWCReader(lines, chunk_size=2, window=2).table()
+        self.assertEqual(len(table), 9)
+        self.assertAlmostEqual(table.l.values[-1], 1e-6)
+    def test_swc_bounded(self):
+        """The points kept stay bounded while a long file is read"""
+        lines = ("{0} 3 {0} 0 0 1 {1}".format(i, i - 1 if i > 1 else -1)
+                 for i in range(1, 200001))
+        reader = SWCReader(lines, chunk_size=1000)
+        self.assertEqual(len(reader.table()), 199999)
+        self.assertEqual(len(reader._store.ids), SWC_WINDOW + 1000)
+        self.assertEqual(len(reader._store.roots), 1)
+
+
+class ParallelTestCase(TestCase):
+    """these tests check that parallel evaluation matches the serial path"""
+    def test_parallel_matches_serial(self):
+        """Chunks done by worker processes give exactly the serial values"""
+        rng = np.random.default_rng(1)
+        table = MorphologyTable(rng.uniform(0.5, 10.0, 1001),
+                                rng.uniform(1.0, 100.0, 1001),
+                                myelin=rng.random(1001) < 0.5,
+                                ra_cm=PhysQuantArray(rng.uniform(50, 200, 1001),
+                                                     "ohm.cm"))
+        serial = table.electrical()
+        parallel = parallel_electrical(table, workers=2, chunk_size=300,
+                                       names=("sa", "vol", "cm", "ra"))
+        for name in ("sa", "vol", "cm", "ra"):
+            self.assertTrue(np.array_equal(parallel[name].values,
+                                           serial[name].values))
+            self.assertEqual(parallel[name].unit, serial[name].unit)
+    def test_parallel_segments(self):
+        """Segments are gathered into a table, one worker runs in process"""
+        segs = [segment(d=pq("2 um"), l=pq("10 um")),
+                segment(d=pq("1 um"), l=pq("5 um"), myelin=True)]
+        results = parallel_electrical(segs, workers=1)
+        self.assertEqual(sorted(results), ["cm", "ra"])
+        self.assertAlmostEqual(results["ra"].values[0] / segs[0].ra.scalar, 1.0)
+        self.assertAlmostEqual(results["cm"].values[1] / segs[1].cm.scalar, 1.0)
+
+
+if __name__ == "__main__":
+    main()